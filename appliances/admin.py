@@ -12,3 +12,5 @@ class ProductLineAdmin(admin.ModelAdmin):
 class ApplianceAdmin(admin.ModelAdmin):
     list_display = ("serial_number", "model_number", "product_line")
     list_filter = ("product_line",)
+    search_fields = ("^serial_number", "^model_number")
+    ordering = ("serial_number",)
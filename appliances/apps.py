@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AppliancesConfig(AppConfig):
     name = 'appliances'
+
+    def ready(self):
+        from appliances import signals  # noqa: F401
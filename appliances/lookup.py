@@ -0,0 +1,294 @@
+"""
+An in-process lookup service for appliance serial numbers.
+
+A bloom filter of every (normalized) serial number rejects typos and guesses without a query,
+and a bounded LRU cache keeps recently matched appliances, with their product line, in memory,
+for up to ``APPLIANCE_CACHE_TTL`` seconds.
+
+Near matches for mistyped serial numbers are found using trigram similarity,
+backed by a pg_trgm GIN index on PostgreSQL, and an in-memory trigram index elsewhere.
+
+Signals keep both up-to-date with saves in this process, once the filter is built.
+Since the bot and the admin panel (or ``import_appliances``) run in separate processes,
+the appliances added since the filter was built are added to it every ``APPLIANCE_FILTER_POLL`` seconds,
+with a query for the ids above the highest one it holds,
+and it is rebuilt in the background every ``APPLIANCE_FILTER_TTL`` seconds, picking up any other change.
+Serial numbers the filter rejects are never looked up.
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, connections
+from django.db.models import Max
+
+from appliances.models import Appliance
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(serial_number: str) -> str:
+    return serial_number.strip().casefold()
+
+
+def trigrams(value: str) -> set:
+    """Splits a string into trigrams, the same way pg_trgm does for a single word."""
+
+    padded = f"  {normalize(value)} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """An inverted index from trigrams to serial numbers, for databases without pg_trgm."""
+
+    def __init__(self, serial_numbers: Iterable[str]):
+        self.postings = defaultdict(list)
+        self.sizes = {}
+        for serial_number in serial_numbers:
+            grams = trigrams(serial_number)
+            self.sizes[serial_number] = len(grams)
+            for gram in grams:
+                self.postings[gram].append(serial_number)
+
+    def search(self, value: str, threshold: float, limit: int) -> List[str]:
+        grams = trigrams(value)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scored = []
+        for serial_number, count in shared.items():
+            similarity = count / (len(grams) + self.sizes[serial_number] - count)
+            if similarity >= threshold:
+                scored.append((similarity, serial_number))
+        scored.sort(reverse=True)
+
+        return [serial_number for _, serial_number in scored[:limit]]
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key)
+        )
+
+
+class LRUCache:
+    """An LRU cache whose entries also expire ``ttl`` seconds after they're put in."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value, expires_at = self.items[key]
+            except KeyError:
+                return None
+            if time.monotonic() > expires_at:
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value, time.monotonic() + self.ttl
+            self.items.move_to_end(key)
+            if len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class ApplianceLookup:
+    def __init__(self, cache_size: int, cache_ttl: float, ttl: float, poll: float):
+        self.ttl = ttl
+        self.poll = poll
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.filter = None
+        self.built_at = 0.0
+        # the appliances added since the filter was built (or last polled) have a higher id
+        self.last_pk = 0
+        self.polled_at = 0.0
+        self.rebuilding = False
+        self.trigram_index = None
+        self.trigram_index_built_at = 0.0
+        # reentrant, since the first build happens while it's held
+        self.lock = threading.RLock()
+
+    def build(self):
+        """Builds a new filter, and swaps it in once it's complete."""
+
+        last_pk = Appliance.objects.aggregate(Max("pk"))["pk__max"] or 0
+        serial_numbers = Appliance.objects.filter(pk__lte=last_pk).values_list(
+            "serial_number", flat=True
+        )
+        bloom = BloomFilter(
+            # leave room for the appliances added until the next rebuild
+            capacity=int(serial_numbers.count() * 1.25)
+            + 1000
+        )
+        for serial_number in serial_numbers.iterator():
+            bloom.add(normalize(serial_number))
+
+        with self.lock:
+            self.filter = bloom
+            self.last_pk = last_pk
+            self.built_at = self.polled_at = time.monotonic()
+
+    def poll_added(self):
+        """Adds the appliances created since the filter was built, or last polled."""
+
+        rows = list(
+            Appliance.objects.filter(pk__gt=self.last_pk)
+            .order_by("pk")
+            .values_list("pk", "serial_number")
+        )
+        for _, serial_number in rows:
+            self.filter.add(normalize(serial_number))
+        if rows:
+            self.last_pk = rows[-1][0]
+        self.polled_at = time.monotonic()
+
+    def rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Could not rebuild the appliance filter")
+        finally:
+            self.rebuilding = False
+            connections.close_all()
+
+    def get_filter(self) -> BloomFilter:
+        """
+        Returns the filter, building it the first time, and adding the appliances created since every poll interval.
+        Once it's older than the TTL, it's rebuilt in a background thread, while the old one is still used.
+        """
+
+        if self.filter is None:
+            with self.lock:
+                if self.filter is None:
+                    self.build()
+        elif time.monotonic() - self.polled_at > self.poll:
+            with self.lock:
+                if time.monotonic() - self.polled_at > self.poll:
+                    self.poll_added()
+
+        if time.monotonic() - self.built_at > self.ttl and not self.rebuilding:
+            with self.lock:
+                if self.rebuilding:
+                    return self.filter
+                self.rebuilding = True
+            threading.Thread(
+                target=self.rebuild, name="appliance-filter", daemon=True
+            ).start()
+        return self.filter
+
+    def add(self, serial_numbers: Iterable[str]):
+        """Adds ``serial_numbers`` to the filter, if this process has built one."""
+
+        bloom = self.filter
+        if bloom is None:
+            return  # they'll be in it once it's built
+        for serial_number in serial_numbers:
+            bloom.add(normalize(serial_number))
+
+    def get_trigram_index(self) -> TrigramIndex:
+        if not self.trigram_index_fresh():
+            with self.lock:
+                if not self.trigram_index_fresh():
+                    serial_numbers = Appliance.objects.values_list(
+                        "serial_number", flat=True
+                    )
+                    self.trigram_index = TrigramIndex(serial_numbers.iterator())
+                    self.trigram_index_built_at = time.monotonic()
+        return self.trigram_index
+
+    def trigram_index_fresh(self) -> bool:
+        return (
+            self.trigram_index is not None
+            and time.monotonic() - self.trigram_index_built_at <= self.ttl
+        )
+
+    def suggest(self, serial_number: str) -> List[Appliance]:
+        """Returns the appliances with serial numbers most similar to ``serial_number``."""
+
+        limit = settings.SERIAL_SUGGESTION_LIMIT
+        threshold = settings.SERIAL_SUGGESTION_THRESHOLD
+        serial_number = serial_number.strip()
+
+        if connection.vendor == "postgresql":
+            return list(
+                Appliance.objects.annotate(
+                    similarity=TrigramSimilarity("serial_number", serial_number)
+                )
+                # the `%` operator, which can use the trigram index
+                .filter(serial_number__trigram_similar=serial_number)
+                .filter(similarity__gte=threshold)
+                .order_by("-similarity")[:limit]
+            )
+
+        matches = self.get_trigram_index().search(serial_number, threshold, limit)
+        appliances = Appliance.objects.in_bulk(matches, field_name="serial_number")
+        return [appliances[match] for match in matches if match in appliances]
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def get(self, serial_number: str) -> Optional[Appliance]:
+        """Returns the appliance with this (case insensitive) serial number, if any."""
+
+        key = normalize(serial_number)
+        appliance = self.cache.get(key)
+        if appliance is not None:
+            return appliance
+
+        if key not in self.get_filter():
+            return None
+
+        appliance = (
+            Appliance.objects.select_related("product_line")
+            .filter(serial_number__iexact=serial_number.strip())
+            .first()
+        )
+        if appliance is not None:
+            self.cache.put(key, appliance)
+        return appliance
+
+
+appliance_lookup = ApplianceLookup(
+    cache_size=settings.APPLIANCE_CACHE_SIZE,
+    cache_ttl=settings.APPLIANCE_CACHE_TTL,
+    ttl=settings.APPLIANCE_FILTER_TTL,
+    poll=settings.APPLIANCE_FILTER_POLL,
+)
@@ -2,6 +2,7 @@ import csv
 from pprint import pprint
 
 import djclick as click
+from appliances.lookup import appliance_lookup
 from appliances.models import Appliance, ProductLine
 
 
@@ -24,3 +25,7 @@ def command(csv_file):
 
     if click.confirm("Proceed?"):
         Appliance.objects.bulk_create(appliances)
+        # bulk_create sends no signals, see `appliances.signals`
+        # (the bot processes pick them up with their next poll, see `appliances.lookup`)
+        appliance_lookup.add(appliance.serial_number for appliance in appliances)
+        appliance_lookup.invalidate()
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# django's istartswith lookup compiles to UPPER(column::text) LIKE UPPER(...)
+INDEXES = {
+    "appliances_appliance_serial_number_upper_like": "serial_number",
+    "appliances_appliance_model_number_upper_like": "model_number",
+}
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, column in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} "
+            f"ON appliances_appliance (UPPER({column}::text) text_pattern_ops)"
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0002_serial_number_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
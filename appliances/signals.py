@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from appliances.lookup import appliance_lookup
+from appliances.models import Appliance, ProductLine
+
+
+@receiver(post_save, sender=Appliance)
+def on_appliance_saved(instance: Appliance, **kwargs):
+    appliance_lookup.add([instance.serial_number])
+    appliance_lookup.invalidate()
+
+
+@receiver(post_delete, sender=Appliance)
+@receiver(post_save, sender=ProductLine)
+@receiver(post_delete, sender=ProductLine)
+def on_appliance_changed(**kwargs):
+    appliance_lookup.invalidate()
@@ -1,3 +1,151 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from appliances.lookup import (
+    ApplianceLookup,
+    BloomFilter,
+    LRUCache,
+    TrigramIndex,
+    trigrams,
+)
+from appliances.models import Appliance, ProductLine
+
+
+class BloomFilterTest(SimpleTestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000)
+        keys = [f"sn{i}" for i in range(1000)]
+        for key in keys:
+            bloom.add(key)
+
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"sn{i}")
+
+        false_positives = sum(f"other{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_empty(self):
+        self.assertNotIn("sn", BloomFilter(capacity=0))
+
+
+class LRUCacheTest(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expires(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.put("a", 1)
+
+        later = time.monotonic() + 61
+        with mock.patch("time.monotonic", return_value=later):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.items, {})
+
+
+class TrigramIndexTest(SimpleTestCase):
+    def test_trigrams(self):
+        # same as pg_trgm's show_trgm('Ab1')
+        self.assertEqual(trigrams(" Ab1 "), {"  a", " ab", "ab1", "b1 "})
+
+    def test_search(self):
+        index = TrigramIndex(["ABC123", "ABC124", "XYZ999"])
+
+        self.assertEqual(index.search("abc123", threshold=1, limit=3), ["ABC123"])
+        self.assertEqual(
+            index.search("ABC12", threshold=0.3, limit=3), ["ABC124", "ABC123"]
+        )
+        self.assertEqual(index.search("ABC12", threshold=0.3, limit=1), ["ABC124"])
+        self.assertEqual(index.search("QQQ", threshold=0.3, limit=3), [])
+
+
+class ApplianceLookupTest(TestCase):
+    def setUp(self):
+        self.product_line = ProductLine.objects.create(name="Fridge")
+        self.appliance = self.create("ABC123")
+        self.lookup = ApplianceLookup(cache_size=10, cache_ttl=60, ttl=300, poll=10)
+
+    def create(self, serial_number: str) -> Appliance:
+        return Appliance.objects.create(
+            serial_number=serial_number,
+            product_line=self.product_line,
+            model_number="M1",
+            name="Fridge",
+        )
+
+    def test_get(self):
+        self.assertEqual(self.lookup.get(" abc123 "), self.appliance)
+        self.assertIsNone(self.lookup.get("XYZ"))
+
+    def test_cached(self):
+        self.lookup.get("ABC123")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup.get("abc123"), self.appliance)
+
+    def test_rejected_without_query(self):
+        self.lookup.get_filter()
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.lookup.get("XYZ"))
+
+    def test_added_after_build(self):
+        self.lookup.get_filter()
+        # as if added by the admin panel, in another process
+        with mock.patch("appliances.signals.appliance_lookup"):
+            appliance = self.create("DEF456")
+
+        self.assertIsNone(self.lookup.get("DEF456"))
+
+        later = time.monotonic() + 11
+        with mock.patch("time.monotonic", return_value=later):
+            with self.assertNumQueries(2):
+                self.assertEqual(self.lookup.get("DEF456"), appliance)
+            with self.assertNumQueries(0):
+                self.assertIsNone(self.lookup.get("XYZ"))
+
+    def test_added_before_build(self):
+        with self.assertNumQueries(0):
+            self.lookup.add(["DEF456"])
+        self.assertIsNone(self.lookup.filter)
+
+    def test_deleted(self):
+        self.lookup.get("ABC123")
+        with mock.patch("appliances.signals.appliance_lookup"):
+            self.appliance.delete()
+
+        later = time.monotonic() + 61
+        with mock.patch("time.monotonic", return_value=later):
+            self.assertIsNone(self.lookup.get("ABC123"))
+
+    def test_rebuilds_in_background(self):
+        old = self.lookup.get_filter()
+        self.lookup.built_at -= self.lookup.ttl + 1
+
+        with mock.patch("threading.Thread") as thread:
+            self.assertIs(self.lookup.get_filter(), old)
+            self.assertIs(self.lookup.get_filter(), old)
+        thread.return_value.start.assert_called_once_with()
+
+    def test_suggest(self):
+        other = self.create("ABC124")
+        self.create("XYZ999")
+
+        self.assertEqual(self.lookup.suggest("ABC12"), [other, self.appliance])
+        self.assertEqual(self.lookup.suggest("QQQ"), [])
+
+    def test_trigram_index_built_once(self):
+        with self.assertNumQueries(1):
+            index = self.lookup.get_trigram_index()
+            self.assertIs(self.lookup.get_trigram_index(), index)
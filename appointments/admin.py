@@ -1,8 +1,21 @@
+import datetime
+import json
+
+from django import forms
 from django.contrib import admin
-from django.utils.html import format_html
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext as _
 
-from . import models
+from gea_bot.paginator import ApproximateCountPaginator
+from pin_codes.models import PinCode, TimeSlot
+from users.models import CustomUser
+from . import bulk, export, models, stats
 
 # an href template for opening a link in a new tab
 NEW_LINK_HREF_TEMPLATE = (
@@ -10,6 +23,52 @@ NEW_LINK_HREF_TEMPLATE = (
 )
 
 
+class ReassignTimeSlotForm(forms.Form):
+    weekday = forms.ChoiceField(choices=PinCode.WEEKDAY_CHOICES)
+    time_slot = forms.ModelChoiceField(TimeSlot.objects.all())
+
+
+class PinCodeFilter(admin.SimpleListFilter):
+    """
+    Filters by a pin code typed in, instead of listing every pin code as a choice.
+    """
+
+    title = _("pin code")
+    parameter_name = "pin_code"
+    template = "admin/input_filter.html"
+
+    def lookups(self, request, model_admin):
+        # the filter is only shown with at least one choice
+        return ((None, None),)
+
+    def choices(self, changelist):
+        # only the link to clear the filter, the template renders the input
+        all_choice = next(super().choices(changelist))
+        all_choice["query_parts"] = [
+            (key, value)
+            for key, value in changelist.get_filters_params().items()
+            if key != self.parameter_name
+        ]
+        yield all_choice
+
+    def queryset(self, request, queryset):
+        value = (self.value() or "").strip()
+        if value:
+            return queryset.filter(pin_code__pin_code=value)
+        return queryset
+
+
+class AppointmentStatusChangeInline(admin.TabularInline):
+    model = models.AppointmentStatusChange
+    fields = ("status", "note", "changed_by", "created_at")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(models.Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
     fields = (
@@ -35,11 +94,54 @@ class AppointmentAdmin(admin.ModelAdmin):
         "is_cancelled",
         "status",
     )
-    list_filter = ("pin_code__pin_code", "created_at")
+    list_select_related = ("user", "appliance__product_line", "pin_code")
+    list_filter = (PinCodeFilter, "created_at")
+    autocomplete_fields = ("appliance", "user", "pin_code")
+    search_fields = ("=tracking_number", "address", "reason")
 
     ordering = ("-created_at",)
     readonly_fields = ("created_at", "get_location_href")
 
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    inlines = (AppointmentStatusChangeInline,)
+    change_list_template = "admin/appointments/appointment/change_list.html"
+    actions = (
+        "accept",
+        "resolve",
+        "cancel",
+        "reassign_time_slot",
+        "export_csv",
+        "export_jsonl",
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        On postgres, looks up tracking numbers exactly,
+        and anything else through the full text index over the address and reason.
+        """
+
+        search_term = search_term.strip()
+        if not search_term or connections[queryset.db].vendor != "postgresql":
+            return super().get_search_results(request, queryset, search_term)
+
+        if search_term.isdigit():
+            return queryset.filter(tracking_number=search_term), False
+
+        # must match the index created in migration 0004
+        return (
+            queryset.extra(
+                where=[
+                    "to_tsvector('simple'::regconfig, appointments_appointment.address "
+                    "|| ' ' || appointments_appointment.reason) "
+                    "@@ plainto_tsquery('simple'::regconfig, %s)"
+                ],
+                params=[search_term],
+            ),
+            False,
+        )
+
     def get_location_href(self, obj) -> str:
         """Returns the html href tag for viewing the location of this user on Google Maps."""
 
@@ -52,3 +154,164 @@ class AppointmentAdmin(admin.ModelAdmin):
             return "---"
 
     get_location_href.short_description = _("Google Maps")
+
+    def accept(self, request, queryset):
+        count = bulk.accept(queryset, request.user)
+        self.message_user(
+            request, _("Accepted %(count)d appointments.") % {"count": count}
+        )
+
+    accept.short_description = _("Accept selected appointments")
+
+    def resolve(self, request, queryset):
+        count = bulk.resolve(queryset, request.user)
+        self.message_user(
+            request, _("Resolved %(count)d appointments.") % {"count": count}
+        )
+
+    resolve.short_description = _("Resolve selected appointments")
+
+    def cancel(self, request, queryset):
+        count = bulk.cancel(queryset, request.user)
+        self.message_user(
+            request, _("Cancelled %(count)d appointments.") % {"count": count}
+        )
+
+    cancel.short_description = _("Cancel selected appointments")
+
+    def reassign_time_slot(self, request, queryset):
+        form = ReassignTimeSlotForm(request.POST if "apply" in request.POST else None)
+
+        if form.is_valid():
+            changed, skipped = bulk.reassign_time_slot(
+                queryset,
+                form.cleaned_data["weekday"],
+                form.cleaned_data["time_slot"],
+                request.user,
+            )
+            self.message_user(
+                request,
+                _(
+                    "Reassigned %(changed)d appointments, "
+                    "skipped %(skipped)d whose pin code doesn't offer that time slot."
+                )
+                % {"changed": changed, "skipped": skipped},
+            )
+            return None
+
+        return TemplateResponse(
+            request,
+            "admin/appointments/appointment/reassign_time_slot.html",
+            {
+                **self.admin_site.each_context(request),
+                "opts": self.model._meta,
+                "form": form,
+                "count": queryset.count(),
+                "select_across": request.POST.get("select_across", "0"),
+                "selected": request.POST.getlist(admin.helpers.ACTION_CHECKBOX_NAME),
+            },
+        )
+
+    reassign_time_slot.short_description = _(
+        "Reassign time slot of selected appointments"
+    )
+
+    @staticmethod
+    def export(queryset, fmt: str) -> StreamingHttpResponse:
+        lines, content_type = export.export(queryset, fmt)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="appointments.{fmt}"'
+        return response
+
+    def export_csv(self, request, queryset):
+        return self.export(queryset, "csv")
+
+    export_csv.short_description = _("Export selected appointments as CSV")
+
+    def export_jsonl(self, request, queryset):
+        return self.export(queryset, "jsonl")
+
+    export_jsonl.short_description = _("Export selected appointments as JSON lines")
+
+    def get_urls(self):
+        return [
+            path(
+                "stats/",
+                self.admin_site.admin_view(self.stats_view),
+                name="appointments_appointment_stats",
+            )
+        ] + super().get_urls()
+
+    def stats_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        try:
+            days = max(int(request.GET.get("days", 30)), 1)
+        except ValueError:
+            days = 30
+        since = timezone.localdate() - datetime.timedelta(days=days - 1)
+
+        return TemplateResponse(
+            request,
+            "admin/appointments/appointment/stats.html",
+            {
+                **self.admin_site.each_context(request),
+                "opts": self.model._meta,
+                "title": _("Appointment stats"),
+                "days": days,
+                "since": since,
+                "summary": stats.summarize(since),
+            },
+        )
+
+
+@admin.register(models.ArchivedAppointment)
+class ArchivedAppointmentAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "appliance",
+        "user",
+        "pin_code",
+        "created_at",
+        "is_cancelled",
+        "status",
+        "archived_at",
+    )
+    list_select_related = ("user", "appliance__product_line", "pin_code")
+    list_filter = ("created_at",)
+    search_fields = ("=tracking_number",)
+    ordering = ("-created_at",)
+    exclude = ("status_changes",)
+    readonly_fields = ("get_status_changes",)
+
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def get_status_changes(self, obj) -> str:
+        changes = json.loads(obj.status_changes)
+        users = CustomUser.objects.in_bulk({i["changed_by"] for i in changes})
+        return format_html_join(
+            "",
+            "<p>{} ➙ {} {} {}</p>",
+            (
+                (
+                    i["created_at"],
+                    i["status"],
+                    users.get(i["changed_by"], ""),
+                    i["note"],
+                )
+                for i in changes
+            ),
+        )
+
+    get_status_changes.short_description = _("Status changes")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
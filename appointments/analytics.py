@@ -0,0 +1,265 @@
+"""
+Capacity planning metrics, computed with NumPy over a columnar dump of the appointments,
+so that heavy aggregations don't run against the production database.
+
+``dump()`` streams the appointments, ``CHUNK_SIZE`` at a time, into a compressed ``.npz`` file
+of numeric columns, along with lookup arrays for the ids they refer to (pin codes, product lines, ...).
+Each chunk is written to the file as soon as it's read, as its own array per column (``"id.0"``, ``"id.1"`` ...),
+so that the dump never holds more than one chunk in memory. ``load()`` joins them back together.
+Archived appointments can be dumped along with the others, see `appointments.archive`.
+The metrics are computed from that file by ``load()`` and the functions below,
+with a handful of vectorized passes over each column.
+
+Requires numpy, from the ``analytics`` extra.
+"""
+
+import calendar
+import datetime
+import zipfile
+from itertools import chain, islice
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from appliances.models import ProductLine
+from appointments.export import CHUNK_SIZE
+from appointments.models import Appointment
+from pin_codes.models import PinCode, TimeSlot
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+# column -> (lookup, dtype)
+COLUMNS = {
+    "id": ("pk", np.int64),
+    # seconds since the epoch, in local wall-clock time, see `local_seconds()`
+    "created_at": ("created_at", np.int64),
+    "weekday": ("weekday", np.int8),
+    "time_slot": ("time_slot_id", np.int32),
+    "pin_code": ("pin_code_id", np.int32),
+    "product_line": ("appliance__product_line_id", np.int32),
+    # index into "status_labels"
+    "status": ("status", np.int8),
+    "is_cancelled": ("is_cancelled", np.bool_),
+}
+
+# the columns of ids, each with a "<column>_ids" lookup array of them, and a "<column>_labels" one
+DIMENSIONS = ("time_slot", "pin_code", "product_line")
+
+Data = Dict[str, np.ndarray]
+
+
+def local_seconds(value: datetime.datetime) -> int:
+    """Seconds since the epoch in local wall-clock time, so that days and weekdays fall out of integer division."""
+    return calendar.timegm(timezone.localtime(value).timetuple())
+
+
+def time_seconds(value: datetime.time) -> int:
+    return value.hour * 60 * 60 + value.minute * 60 + value.second
+
+
+def get_lookups() -> Data:
+    time_slots = TimeSlot.objects.order_by("pk")
+    pin_codes = (
+        PinCode.objects.order_by("pk")
+        .select_related("service_area")
+        .prefetch_related("time_slots", "service_area__time_slots")
+    )
+    product_lines = ProductLine.objects.order_by("pk")
+
+    # the (pin code, weekday, time slot) combinations open for booking
+    offers = [
+        (pin_code.pk, int(weekday), time_slot.pk)
+        for pin_code in pin_codes
+        for weekday in pin_code.get_working_days()
+        for time_slot in pin_code.get_time_slots()
+    ]
+
+    return {
+        "time_slot_ids": np.array([i.pk for i in time_slots], dtype=np.int32),
+        "time_slot_labels": np.array([str(i) for i in time_slots], dtype=np.str_),
+        "time_slot_starts": np.array(
+            [time_seconds(i.start) for i in time_slots], dtype=np.int32
+        ),
+        "pin_code_ids": np.array([i.pk for i in pin_codes], dtype=np.int32),
+        "pin_code_labels": np.array([i.pin_code for i in pin_codes], dtype=np.str_),
+        "product_line_ids": np.array([i.pk for i in product_lines], dtype=np.int32),
+        "product_line_labels": np.array([i.name for i in product_lines], dtype=np.str_),
+        "offers": np.array(offers, dtype=np.int32).reshape(-1, 3),
+    }
+
+
+def dump(queryset: QuerySet, file, archived: QuerySet = None):
+    """
+    Writes the columns of the appointments in ``queryset``, and the ``archived`` ones (if given),
+    to ``file``, a path or a binary file.
+    """
+
+    statuses = [
+        Appointment.PENDING,
+        Appointment.ACCEPTED,
+        Appointment.RESOLVED,
+        Appointment.CANCELLED,
+        Appointment.RESCHEDULED,
+    ]
+
+    def status_code(value: str) -> int:
+        if value not in statuses:
+            statuses.append(value)
+        return statuses.index(value)
+
+    converters = {"created_at": local_seconds, "weekday": int, "status": status_code}
+
+    querysets = [queryset] if archived is None else [queryset, archived]
+    rows = chain.from_iterable(
+        appointments.order_by()
+        .values_list(*(lookup for lookup, _ in COLUMNS.values()))
+        .iterator(chunk_size=CHUNK_SIZE)
+        for appointments in querysets
+    )
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        chunks = 0
+        while True:
+            chunk = list(islice(rows, CHUNK_SIZE))
+            if not chunk:
+                break
+            for (name, (_, dtype)), values in zip(COLUMNS.items(), zip(*chunk)):
+                if name in converters:
+                    values = map(converters[name], values)
+                values = np.fromiter(values, dtype=dtype, count=len(chunk))
+                write_array(archive, f"{name}.{chunks}", values)
+            chunks += 1
+
+        # after the appointments, so that the pin codes created meanwhile are in there
+        lookups = get_lookups()
+
+        write_array(archive, "chunks", np.array(chunks))
+        write_array(archive, "status_labels", np.array(statuses, dtype=np.str_))
+        for name, values in lookups.items():
+            write_array(archive, name, values)
+
+
+def write_array(archive: zipfile.ZipFile, name: str, values: np.ndarray):
+    """Adds ``values`` to ``archive``, the way `np.savez_compressed` does."""
+    with archive.open(f"{name}.npy", "w", force_zip64=True) as file:
+        np.lib.format.write_array(file, values, allow_pickle=False)
+
+
+def load(file) -> Data:
+    """
+    Reads a file written by ``dump()``.
+    Appointments referring to an id missing from the lookups (e.g. deleted while it was dumped) are dropped,
+    and counted in ``"dropped"``.
+    """
+
+    with np.load(file) as data:
+        chunks = int(data["chunks"])
+        columns = {
+            name: np.concatenate([data[f"{name}.{i}"] for i in range(chunks)])
+            if chunks
+            else np.array([], dtype)
+            for name, (_, dtype) in COLUMNS.items()
+        }
+        data = {
+            **{name: data[name] for name in data.files if "." not in name},
+            **columns,
+        }
+
+    known = np.ones(len(data["id"]), dtype=np.bool_)
+    for dimension in DIMENSIONS:
+        known &= np.isin(data[dimension], data[f"{dimension}_ids"])
+    for name in COLUMNS:
+        data[name] = data[name][known]
+    data["dropped"] = np.array(np.count_nonzero(~known))
+
+    return data
+
+
+def get_codes(data: Data, dimension: str) -> np.ndarray:
+    """Positions of the ids in the ``dimension`` column, in its (sorted) lookup array."""
+    return np.searchsorted(data[f"{dimension}_ids"], data[dimension])
+
+
+def lead_times(data: Data) -> np.ndarray:
+    """
+    Hours between booking each appointment, and the start of its time slot.
+    The appointment is assumed to be on the first of its weekday after booking.
+    """
+
+    created_at = data["created_at"]
+    booked_weekday = (created_at // DAY + 3) % 7  # the epoch was a thursday
+    booked_time = created_at % DAY
+    start = data["time_slot_starts"][get_codes(data, "time_slot")]
+
+    lead = (data["weekday"] - booked_weekday) % 7 * DAY + start - booked_time
+    lead[lead < 0] += WEEK
+    return lead / (60 * 60)
+
+
+def cancellation_rates(
+    data: Data, dimensions: Sequence[str]
+) -> List[Tuple[Tuple[str, ...], int, float]]:
+    """
+    The number of appointments, and the fraction of them cancelled,
+    for each combination of ``dimensions`` (e.g. ``("pin_code", "product_line")``) that has any,
+    highest rate first.
+    """
+
+    shape = tuple(len(data[f"{dimension}_ids"]) for dimension in dimensions)
+    cells = np.ravel_multi_index(
+        [get_codes(data, dimension) for dimension in dimensions], shape
+    )
+    size = int(np.prod(shape))
+    totals = np.bincount(cells, minlength=size)
+    cancelled = np.bincount(cells, weights=data["is_cancelled"], minlength=size)
+
+    (nonzero,) = np.nonzero(totals)
+    rates = cancelled[nonzero] / totals[nonzero]
+    order = nonzero[np.argsort(-rates, kind="stable")]
+
+    labels = [data[f"{dimension}_labels"] for dimension in dimensions]
+    return [
+        (
+            tuple(
+                str(labels[i][j]) for i, j in enumerate(np.unravel_index(cell, shape))
+            ),
+            int(totals[cell]),
+            cancelled[cell] / totals[cell],
+        )
+        for cell in order
+    ]
+
+
+def slot_utilisation(data: Data) -> np.ndarray:
+    """
+    The average number of appointments booked per week, in each pin code open for a time slot,
+    as a (weekday x time slot) matrix. NaN where no pin code is open.
+    """
+
+    shape = (7, len(data["time_slot_ids"]))
+
+    booked = ~data["is_cancelled"]
+    cells = np.ravel_multi_index(
+        (data["weekday"][booked], get_codes(data, "time_slot")[booked]), shape
+    )
+    counts = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+
+    offers = data["offers"]
+    offer_cells = np.ravel_multi_index(
+        (offers[:, 1], np.searchsorted(data["time_slot_ids"], offers[:, 2])), shape
+    )
+    capacity = np.bincount(offer_cells, minlength=shape[0] * shape[1]).reshape(shape)
+
+    created_at = data["created_at"]
+    weeks = (
+        max((created_at.max() - created_at.min()) / WEEK, 1) if created_at.size else 1
+    )
+
+    return np.divide(
+        counts,
+        capacity * weeks,
+        out=np.full(shape, np.nan),
+        where=capacity > 0,
+    )
@@ -0,0 +1,114 @@
+"""
+Moves old resolved and cancelled appointments out of the ``Appointment`` table, into ``ArchivedAppointment``.
+
+Appointments are moved ``ARCHIVE_BATCH_SIZE`` at a time, each batch in its own short transaction,
+skipping rows locked by anyone else (e.g. an admin changing them), so that nobody waits on the archiver for long.
+Their status history is archived along with them.
+Appointments with notifications still waiting to be sent are left alone until they're sent.
+
+Archived appointments are still counted in the stats (see `appointments.stats`),
+so they're deleted without updating the counts.
+"""
+
+import datetime
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from appointments import stats
+from appointments.models import (
+    Appointment,
+    AppointmentStatusChange,
+    ArchivedAppointment,
+    Notification,
+)
+
+FIELDS = [
+    field.attname
+    for field in ArchivedAppointment._meta.concrete_fields
+    if field.name not in ("archived_at", "status_changes")
+]
+
+
+def get_archivable(cutoff: datetime.datetime) -> QuerySet:
+    return (
+        Appointment.objects.filter(created_at__lt=cutoff)
+        .filter(Q(is_cancelled=True) | Q(status=Appointment.RESOLVED))
+        .exclude(pk__in=Notification.objects.filter(sent_at=None).values("appointment"))
+    )
+
+
+def get_status_changes(ids) -> dict:
+    changes = {pk: [] for pk in ids}
+    rows = (
+        AppointmentStatusChange.objects.filter(appointment__in=ids)
+        .order_by("pk")
+        .values_list("appointment_id", "status", "note", "changed_by_id", "created_at")
+    )
+    for pk, status, note, changed_by, created_at in rows:
+        changes[pk].append(
+            {
+                "status": status,
+                "note": note,
+                "changed_by": changed_by,
+                "created_at": created_at.isoformat(),
+            }
+        )
+    return changes
+
+
+def archive_batch(cutoff: datetime.datetime, batch_size: int) -> int:
+    """Archives up to ``batch_size`` appointments booked before ``cutoff``, returning how many."""
+
+    with transaction.atomic():
+        appointments = list(
+            get_archivable(cutoff)
+            .select_for_update(skip_locked=True)
+            .order_by("pk")[:batch_size]
+        )
+        if not appointments:
+            return 0
+
+        ids = [appointment.pk for appointment in appointments]
+        changes = get_status_changes(ids)
+        ArchivedAppointment.objects.bulk_create(
+            ArchivedAppointment(
+                **{name: getattr(appointment, name) for name in FIELDS},
+                status_changes=json.dumps(changes[appointment.pk]),
+            )
+            for appointment in appointments
+        )
+
+        AppointmentStatusChange.objects.filter(appointment__in=ids).delete()
+        Notification.objects.filter(appointment__in=ids).delete()
+        # moved, not deleted: the stats keep counting them
+        with stats.unchanged():
+            Appointment.objects.filter(pk__in=ids).delete()
+
+    return len(appointments)
+
+
+def archive(days: int = None, batch_size: int = None, max_batches: int = None) -> int:
+    """
+    Archives the appointments booked more than ``days`` ago, in batches of ``batch_size``,
+    stopping after ``max_batches`` (if given). Returns the number of appointments archived.
+    """
+
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    if batch_size is None:
+        batch_size = settings.ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        archived = archive_batch(cutoff, batch_size)
+        total += archived
+        batches += 1
+        if archived < batch_size:
+            break
+
+    return total
@@ -0,0 +1,129 @@
+"""
+Changes applied to many appointments at once, from the admin panel.
+
+Appointments are changed in batches of ``BATCH_SIZE``, with a single UPDATE per batch,
+and a single INSERT each for the status history and the notifications to their customers.
+"""
+
+from typing import Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils.translation import gettext as _
+
+from appointments import stats
+from appointments.models import Appointment, AppointmentStatusChange, Notification
+from pin_codes.models import PinCode, TimeSlot
+from users.models import CustomUser
+
+BATCH_SIZE = 1000
+
+
+def batches(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def bulk_change(
+    queryset: QuerySet,
+    fields: dict,
+    status: str,
+    message: str,
+    changed_by: CustomUser = None,
+    note: str = "",
+) -> int:
+    """
+    Updates ``fields`` of every appointment in ``queryset``,
+    and notifies its customer with ``message``, formatted with the appointment's ``tracking_number``.
+
+    Returns the number of appointments changed.
+    """
+
+    rows = list(queryset.order_by().values_list("pk", "tracking_number"))
+
+    for batch in batches(rows, BATCH_SIZE):
+        ids = [pk for pk, _ in batch]
+        with transaction.atomic():
+            stats.update(Appointment.objects.filter(pk__in=ids), **fields)
+            AppointmentStatusChange.objects.bulk_create(
+                AppointmentStatusChange(
+                    appointment_id=pk, status=status, note=note, changed_by=changed_by
+                )
+                for pk in ids
+            )
+            Notification.objects.bulk_create(
+                Notification(
+                    appointment_id=pk,
+                    text=message.format(tracking_number=tracking_number),
+                )
+                for pk, tracking_number in batch
+            )
+
+    return len(rows)
+
+
+def accept(queryset: QuerySet, changed_by: CustomUser = None) -> int:
+    return bulk_change(
+        queryset.filter(is_cancelled=False).exclude(status=Appointment.ACCEPTED),
+        {"status": Appointment.ACCEPTED},
+        Appointment.ACCEPTED,
+        _("Your appointment `{tracking_number}` has been accepted."),
+        changed_by,
+    )
+
+
+def resolve(queryset: QuerySet, changed_by: CustomUser = None) -> int:
+    return bulk_change(
+        queryset.filter(is_cancelled=False).exclude(status=Appointment.RESOLVED),
+        {"status": Appointment.RESOLVED},
+        Appointment.RESOLVED,
+        _("Your appointment `{tracking_number}` has been resolved."),
+        changed_by,
+    )
+
+
+def cancel(queryset: QuerySet, changed_by: CustomUser = None) -> int:
+    return bulk_change(
+        queryset.filter(is_cancelled=False),
+        {"is_cancelled": True},
+        Appointment.CANCELLED,
+        _("Sorry, your appointment `{tracking_number}` has been cancelled."),
+        changed_by,
+    )
+
+
+def reassign_time_slot(
+    queryset: QuerySet,
+    weekday: str,
+    time_slot: TimeSlot,
+    changed_by: CustomUser = None,
+) -> Tuple[int, int]:
+    """
+    Moves the appointments to ``weekday`` and ``time_slot``,
+    skipping the ones whose pin code doesn't offer that time slot.
+
+    Returns the number of appointments changed, and skipped.
+    """
+
+    queryset = queryset.filter(is_cancelled=False)
+
+    valid = PinCode.objects.filter(
+        Q(service_area=None, working_days__contains=weekday, time_slots=time_slot)
+        | Q(
+            service_area__working_days__contains=weekday,
+            service_area__time_slots=time_slot,
+        )
+    ).values("pk")
+
+    pretty_time_slot = f"{PinCode.WEEKDAY_CHOICES_DICT[weekday]}, {time_slot}"
+    changed = bulk_change(
+        queryset.filter(pin_code__in=valid),
+        {"weekday": weekday, "time_slot": time_slot},
+        Appointment.RESCHEDULED,
+        _("Your appointment `{tracking_number}` has been rescheduled to %(time_slot)s.")
+        % {"time_slot": pretty_time_slot},
+        changed_by,
+        note=_("Rescheduled to %(time_slot)s") % {"time_slot": pretty_time_slot},
+    )
+
+    return changed, queryset.exclude(pin_code__in=valid).count()
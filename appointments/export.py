@@ -0,0 +1,105 @@
+"""
+Streams appointments, joined with their user, appliance, product line, pin code and time slot,
+as CSV or JSON lines.
+
+Rows are fetched ``CHUNK_SIZE`` at a time through a server-side cursor (on postgres),
+so exports of any size run in constant memory.
+Archived appointments have the same columns, and can be exported after the others, in a second pass.
+"""
+
+import csv
+import datetime
+import json
+from typing import Iterable, Iterator, Tuple
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+
+# column name -> lookup
+COLUMNS = {
+    "id": "pk",
+    "tracking_number": "tracking_number",
+    "created_at": "created_at",
+    "status": "status",
+    "is_cancelled": "is_cancelled",
+    "weekday": "weekday",
+    "time_slot_start": "time_slot__start",
+    "time_slot_end": "time_slot__end",
+    "pin_code": "pin_code__pin_code",
+    "address": "address",
+    "reason": "reason",
+    "user_first_name": "user__first_name",
+    "user_last_name": "user__last_name",
+    "user_phone_number": "user__phone_number",
+    "user_email": "user__email",
+    "serial_number": "appliance__serial_number",
+    "model_number": "appliance__model_number",
+    "product_line": "appliance__product_line__name",
+}
+
+
+def format_value(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def get_rows(*querysets: QuerySet) -> Iterator[Tuple]:
+    for queryset in querysets:
+        rows = queryset.order_by().values_list(*COLUMNS.values())
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            yield tuple(map(format_value, row))
+
+
+def booked_between(
+    appointments: QuerySet, since: datetime.datetime, until: datetime.datetime
+) -> QuerySet:
+    """Filters the ``appointments`` booked from the day of ``since`` through that of ``until``."""
+
+    if since is not None:
+        appointments = appointments.filter(created_at__gte=timezone.make_aware(since))
+    if until is not None:
+        appointments = appointments.filter(
+            created_at__lt=timezone.make_aware(until + datetime.timedelta(days=1))
+        )
+    return appointments
+
+
+class Echo:
+    """A file-like object that returns what is written to it, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(*querysets: QuerySet) -> Iterable[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in get_rows(*querysets):
+        yield writer.writerow(row)
+
+
+def iter_jsonl(*querysets: QuerySet) -> Iterable[str]:
+    for row in get_rows(*querysets):
+        yield json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n"
+
+
+# format -> (lines, content type)
+FORMATS = {"csv": (iter_csv, "text/csv"), "jsonl": (iter_jsonl, "application/x-ndjson")}
+
+
+def export(
+    queryset: QuerySet, fmt: str, archived: QuerySet = None
+) -> Tuple[Iterable[str], str]:
+    """
+    Returns the lines of the export, followed by those of the ``archived`` appointments (if given),
+    and their content type.
+    """
+
+    fn, content_type = FORMATS[fmt]
+    querysets = [queryset] if archived is None else [queryset, archived]
+    return fn(*querysets), content_type
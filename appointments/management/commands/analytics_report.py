@@ -0,0 +1,57 @@
+import djclick as click
+
+from pin_codes.models import PinCode
+
+PERCENTILES = (50, 90, 99)
+
+
+def echo_rates(title: str, rates, limit: int):
+    click.echo(f"\n{title}:")
+    for labels, total, rate in rates[:limit]:
+        click.echo(f"  {' / '.join(labels):<40} {rate:6.1%} of {total}")
+
+
+@click.command()
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--limit", default=20, help="Rows to show per cancellation table.")
+def command(path, limit):
+    """Capacity planning report, from a file written by `export_analytics`."""
+
+    try:
+        import numpy as np
+
+        from appointments import analytics
+    except ImportError:
+        raise click.ClickException("Install the 'analytics' extra to use this command.")
+
+    data = analytics.load(path)
+    click.echo(f"{len(data['id'])} appointments")
+    if data["dropped"]:
+        click.echo(
+            f"Skipped {data['dropped']} appointments referring to deleted pin codes, "
+            "time slots or product lines."
+        )
+    if not len(data["id"]):
+        return
+
+    lead_times = analytics.lead_times(data)
+    click.echo("\nLead time (hours):")
+    for q, value in zip(PERCENTILES, np.percentile(lead_times, PERCENTILES)):
+        click.echo(f"  p{q:<3} {value:8.1f}")
+
+    for title, dimensions in (
+        ("Cancellation rate by pin code", ("pin_code",)),
+        ("Cancellation rate by product line", ("product_line",)),
+        (
+            "Cancellation rate by pin code and product line",
+            ("pin_code", "product_line"),
+        ),
+    ):
+        echo_rates(title, analytics.cancellation_rates(data, dimensions), limit)
+
+    utilisation = analytics.slot_utilisation(data)
+    click.echo("\nAppointments per pin code per week:")
+    click.echo(" " * 12 + "".join(f"{i:>16}" for i in data["time_slot_labels"]))
+    for weekday, row in enumerate(utilisation):
+        label = PinCode.WEEKDAY_CHOICES_DICT[str(weekday)]
+        click.echo(f"{label:<12}" + "".join(f"{i:16.2f}" for i in row))
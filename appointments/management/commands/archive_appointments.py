@@ -0,0 +1,32 @@
+import time
+
+import djclick as click
+from django.conf import settings
+
+from appointments import archive
+
+
+@click.command()
+@click.option(
+    "--days",
+    type=int,
+    default=settings.ARCHIVE_AFTER_DAYS,
+    help="Archive appointments booked more than this many days ago.",
+)
+@click.option("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE)
+@click.option(
+    "--pause",
+    type=float,
+    default=0.1,
+    help="Seconds to wait between batches, to let replicas catch up.",
+)
+def command(days, batch_size, pause):
+    total = 0
+    while True:
+        archived = archive.archive(days, batch_size, max_batches=1)
+        total += archived
+        if archived < batch_size:
+            break
+        time.sleep(pause)
+
+    click.echo(f"Archived {total} appointments.")
@@ -0,0 +1,38 @@
+import djclick as click
+
+from appointments import export
+from appointments.models import Appointment, ArchivedAppointment
+
+
+@click.command()
+@click.option(
+    "--since",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only appointments booked on or after this day.",
+)
+@click.option(
+    "--until",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only appointments booked on or before this day.",
+)
+@click.option(
+    "--archived/--no-archived",
+    default=True,
+    help="Include the archived appointments (the default).",
+)
+@click.option("--output", "-o", type=click.Path(dir_okay=False), required=True)
+def command(since, until, archived, output):
+    """Dumps the appointments to a columnar .npz file, for `analytics_report`."""
+
+    try:
+        from appointments import analytics
+    except ImportError:
+        raise click.ClickException("Install the 'analytics' extra to use this command.")
+
+    analytics.dump(
+        export.booked_between(Appointment.objects.all(), since, until),
+        output,
+        archived=export.booked_between(ArchivedAppointment.objects.all(), since, until)
+        if archived
+        else None,
+    )
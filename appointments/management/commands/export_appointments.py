@@ -0,0 +1,35 @@
+import djclick as click
+
+from appointments import export
+from appointments.models import Appointment, ArchivedAppointment
+
+
+@click.command()
+@click.option(
+    "--format", "fmt", type=click.Choice(sorted(export.FORMATS)), default="csv"
+)
+@click.option(
+    "--since",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only appointments booked on or after this day.",
+)
+@click.option(
+    "--until",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    help="Only appointments booked on or before this day.",
+)
+@click.option(
+    "--archived/--no-archived",
+    default=True,
+    help="Include the archived appointments (the default).",
+)
+@click.option("--output", "-o", type=click.File("w"), default="-")
+def command(fmt, since, until, archived, output):
+    lines, _ = export.export(
+        export.booked_between(Appointment.objects.all(), since, until),
+        fmt,
+        archived=export.booked_between(ArchivedAppointment.objects.all(), since, until)
+        if archived
+        else None,
+    )
+    output.writelines(lines)
@@ -0,0 +1,19 @@
+import datetime
+
+import djclick as click
+from django.utils import timezone
+
+from appointments import stats
+
+
+@click.command()
+@click.option(
+    "--days",
+    type=int,
+    help="Only recompute the stats of the last few days, instead of all of them.",
+)
+def command(days):
+    since = None
+    if days is not None:
+        since = timezone.localdate() - datetime.timedelta(days=days)
+    stats.reconcile(since)
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# must match the expression searched on in AppointmentAdmin.get_search_results()
+SEARCH_VECTOR = "to_tsvector('simple'::regconfig, address || ' ' || reason)"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS appointments_appointment_search "
+        f"ON appointments_appointment USING gin ({SEARCH_VECTOR})"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS appointments_appointment_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
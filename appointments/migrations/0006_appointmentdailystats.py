@@ -0,0 +1,36 @@
+# Generated by Django 2.1.1 on 2026-10-19 18:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appliances', '0003_prefix_search_indexes'),
+        ('pin_codes', '0001_initial'),
+        ('appointments', '0005_status_changes_and_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('weekday', models.CharField(choices=[('0', 'Monday'), ('1', 'Tuesday'), ('2', 'Wednesday'), ('3', 'Thursday'), ('4', 'Friday'), ('5', 'Saturday'), ('6', 'Sunday')], max_length=1)),
+                ('status', models.CharField(max_length=255)),
+                ('count', models.IntegerField(default=0)),
+                ('pin_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pin_codes.PinCode')),
+                ('product_line', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appliances.ProductLine')),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pin_codes.TimeSlot')),
+            ],
+            options={
+                'verbose_name_plural': 'appointment daily stats',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointmentdailystats',
+            unique_together={('day', 'pin_code', 'time_slot', 'weekday', 'status', 'product_line')},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2 on 2026-10-19 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_appointmentdailystats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(is_cancelled=False), fields=['user', '-created_at'], name='appointment_user_active_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2 on 2026-10-19 20:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pin_codes', '0003_service_areas'),
+        ('appliances', '0003_prefix_search_indexes'),
+        ('appointments', '0007_appointment_user_active_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('address', models.CharField(max_length=4096)),
+                ('place_id', models.CharField(blank=True, help_text='Google Maps Place ID', max_length=32, null=True)),
+                ('weekday', models.CharField(choices=[('0', 'Monday'), ('1', 'Tuesday'), ('2', 'Wednesday'), ('3', 'Thursday'), ('4', 'Friday'), ('5', 'Saturday'), ('6', 'Sunday')], max_length=1)),
+                ('reason', models.CharField(max_length=4096)),
+                ('tracking_number', models.CharField(max_length=255, unique=True)),
+                ('is_cancelled', models.BooleanField(default=False)),
+                ('status', models.CharField(default='Pending', max_length=4096)),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('status_changes', models.TextField(default='[]')),
+                ('appliance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appliances.Appliance')),
+                ('pin_code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pin_codes.PinCode')),
+                ('time_slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pin_codes.TimeSlot')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['-created_at'], name='archived_created_idx'),
+        ),
+    ]
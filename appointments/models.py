@@ -6,12 +6,38 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import gettext as _
 
-from appliances.models import Appliance
+from appliances.models import Appliance, ProductLine
 from pin_codes.models import PinCode, TimeSlot
 from users.models import CustomUser
 
 
-class Appointment(models.Model):
+class AppointmentQuerySet(models.QuerySet):
+    """The lookups made by the bot, each matching an index on ``Appointment``."""
+
+    def active(self) -> "AppointmentQuerySet":
+        return self.filter(is_cancelled=False)
+
+    def owned_by(self, username: str) -> "AppointmentQuerySet":
+        return self.filter(user__username=username)
+
+    def for_listing(self) -> "AppointmentQuerySet":
+        """Newest first, with everything ``short_detail_markup`` needs."""
+        return (
+            self.active()
+            .order_by("-created_at")
+            .select_related("appliance__product_line", "time_slot")
+        )
+
+
+class AppointmentBase(models.Model):
+    """The fields of an appointment, shared by ``Appointment`` and ``ArchivedAppointment``."""
+
+    PENDING = "Pending"
+    ACCEPTED = "Accepted"
+    RESOLVED = "Resolved"
+    CANCELLED = "Cancelled"
+    RESCHEDULED = "Rescheduled"
+
     appliance = models.ForeignKey(Appliance, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
 
@@ -29,28 +55,10 @@ class Appointment(models.Model):
     tracking_number = models.CharField(max_length=255, unique=True)
 
     is_cancelled = models.BooleanField(default=False)
-    status = models.CharField(max_length=4096, default="Pending")
-
-    @classmethod
-    def gen_tracking_number(cls):
-        return "".join(secrets.choice(string.digits) for _ in range(10))
-
-    def validate_time_slot(self):
-        if self.time_slot not in self.pin_code.time_slots.all():
-            raise ValidationError(_("Invalid Time Slot"), code="invalid_time_slot")
-
-    def validate_weekday(self):
-        if self.weekday not in self.pin_code.working_days:
-            raise ValidationError(_("Invalid Week Day"), code="invalid_weekday")
-
-    def clean_fields(self, exclude=None):
-        super().clean_fields(exclude)
+    status = models.CharField(max_length=4096, default=PENDING)
 
-        if "time_slot" not in exclude:
-            self.validate_time_slot()
-
-        if "weekday" not in exclude:
-            self.validate_time_slot()
+    class Meta:
+        abstract = True
 
     @property
     def short_detail_markup(self):
@@ -88,3 +96,125 @@ class Appointment(models.Model):
 
     def __str__(self):
         return f"Appointment for {self.user.first_name}'s {self.appliance.product_line}"
+
+
+class Appointment(AppointmentBase):
+    objects = AppointmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at"], name="appointment_created_idx"),
+            models.Index(
+                fields=["pin_code", "-created_at"], name="appointment_pin_created_idx"
+            ),
+            # a user's active appointments, newest first, see `AppointmentQuerySet.for_listing()`
+            models.Index(
+                fields=["user", "-created_at"],
+                name="appointment_user_active_idx",
+                condition=models.Q(is_cancelled=False),
+            ),
+        ]
+
+    @classmethod
+    def gen_tracking_number(cls):
+        """A random tracking number, not taken by any appointment, archived or not."""
+
+        while True:
+            number = "".join(secrets.choice(string.digits) for _ in range(10))
+            # live appointments first: archiving moves a number out of them, never back
+            if not (
+                cls.objects.filter(tracking_number=number).exists()
+                or ArchivedAppointment.objects.filter(tracking_number=number).exists()
+            ):
+                return number
+
+    def validate_time_slot(self):
+        if self.time_slot not in self.pin_code.get_time_slots():
+            raise ValidationError(_("Invalid Time Slot"), code="invalid_time_slot")
+
+    def validate_weekday(self):
+        if self.weekday not in self.pin_code.get_working_days():
+            raise ValidationError(_("Invalid Week Day"), code="invalid_weekday")
+
+    def clean_fields(self, exclude=None):
+        super().clean_fields(exclude)
+
+        if "time_slot" not in exclude:
+            self.validate_time_slot()
+
+        if "weekday" not in exclude:
+            self.validate_time_slot()
+
+
+class ArchivedAppointment(AppointmentBase):
+    """
+    A resolved or cancelled appointment, moved out of the ``Appointment`` table once it's old enough,
+    so that the table the bot and the admin query every time stays small. See `appointments.archive`.
+    """
+
+    # the id and time of booking it had as an ``Appointment``
+    id = models.IntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+
+    archived_at = models.DateTimeField(auto_now_add=True)
+    # the appointment's `AppointmentStatusChange`s, as a JSON list
+    status_changes = models.TextField(default="[]")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-created_at"], name="archived_created_idx"),
+        ]
+
+
+class AppointmentStatusChange(models.Model):
+    appointment = models.ForeignKey(
+        Appointment, on_delete=models.CASCADE, related_name="status_changes"
+    )
+    status = models.CharField(max_length=4096)
+    note = models.CharField(max_length=4096, blank=True)
+    changed_by = models.ForeignKey(
+        CustomUser, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.appointment_id} ➙ {self.status}"
+
+
+class Notification(models.Model):
+    """A message to the customer of an appointment, waiting to be sent by the bot."""
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE)
+    text = models.CharField(max_length=4096)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["sent_at"], name="notification_sent_at_idx")]
+
+    def __str__(self):
+        return self.text
+
+
+class AppointmentDailyStats(models.Model):
+    """
+    The number of appointments booked on ``day``, for each combination of the other fields.
+    Cancelled appointments are counted under the ``Cancelled`` status. See `appointments.stats`.
+    """
+
+    day = models.DateField()
+    pin_code = models.ForeignKey(PinCode, on_delete=models.CASCADE)
+    time_slot = models.ForeignKey(TimeSlot, on_delete=models.CASCADE)
+    weekday = models.CharField(max_length=1, choices=PinCode.WEEKDAY_CHOICES)
+    status = models.CharField(max_length=255)
+    product_line = models.ForeignKey(ProductLine, on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = (
+            ("day", "pin_code", "time_slot", "weekday", "status", "product_line"),
+        )
+        verbose_name_plural = "appointment daily stats"
+
+    def __str__(self):
+        return f"{self.day} {self.pin_code_id} {self.status}: {self.count}"
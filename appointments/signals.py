@@ -0,0 +1,36 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from appointments import stats
+from appointments.models import Appointment
+
+
+@receiver(pre_save, sender=Appointment)
+def on_appointment_saving(instance: Appointment, **kwargs):
+    if stats.suspended.get():
+        return
+    if instance.pk is None:
+        instance._stats_key = None
+    else:
+        instance._stats_key = stats.get_keys(
+            Appointment.objects.filter(pk=instance.pk)
+        ).get(instance.pk)
+
+
+@receiver(post_save, sender=Appointment)
+def on_appointment_saved(instance: Appointment, **kwargs):
+    if stats.suspended.get():
+        return
+    deltas = Counter({stats.key_of(instance): 1})
+    if instance._stats_key is not None:
+        deltas[instance._stats_key] -= 1
+    stats.apply(deltas)
+
+
+@receiver(post_delete, sender=Appointment)
+def on_appointment_deleted(instance: Appointment, **kwargs):
+    if stats.suspended.get():
+        return
+    stats.apply(Counter({stats.key_of(instance): -1}))
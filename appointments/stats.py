@@ -0,0 +1,209 @@
+"""
+Appointment counts by day of booking, pin code, time slot, weekday, status and product line,
+kept in ``AppointmentDailyStats``, so that the dashboard doesn't aggregate over every appointment.
+
+The counts are updated as appointments are saved (see `appointments.signals`),
+or changed through ``update()``, and periodically recomputed by ``reconcile()`` to correct any drift.
+Archived appointments are still counted (see `appointments.archive`),
+so moving them is done inside ``unchanged()``.
+"""
+
+import contextvars
+import datetime
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, QuerySet, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from appointments.models import (
+    Appointment,
+    AppointmentDailyStats,
+    ArchivedAppointment,
+)
+
+FIELDS = ("day", "pin_code_id", "time_slot_id", "weekday", "status", "product_line_id")
+Key = Tuple[datetime.date, int, int, str, str, int]
+
+BREAKDOWNS = (
+    (_("Day"), "day"),
+    (_("Pin code"), "pin_code"),
+    (_("Weekday"), "weekday"),
+    (_("Time slot"), "time_slot"),
+    (_("Product line"), "product_line"),
+    (_("Status"), "status"),
+)
+
+
+# whether the signals should leave the counts alone, see `unchanged()`
+suspended = contextvars.ContextVar("suspended", default=False)
+
+
+@contextmanager
+def unchanged():
+    """Skips the count updates made by `appointments.signals` inside this block."""
+
+    token = suspended.set(True)
+    try:
+        yield
+    finally:
+        suspended.reset(token)
+
+
+def get_key(
+    created_at: datetime.datetime,
+    pin_code_id: int,
+    time_slot_id: int,
+    weekday: str,
+    status: str,
+    is_cancelled: bool,
+    product_line_id: int,
+) -> Key:
+    return (
+        timezone.localdate(created_at),
+        pin_code_id,
+        time_slot_id,
+        weekday,
+        Appointment.CANCELLED if is_cancelled else status,
+        product_line_id,
+    )
+
+
+def get_keys(queryset: QuerySet) -> Dict[int, Key]:
+    rows = queryset.order_by().values_list(
+        "pk",
+        "created_at",
+        "pin_code_id",
+        "time_slot_id",
+        "weekday",
+        "status",
+        "is_cancelled",
+        "appliance__product_line_id",
+    )
+    return {pk: get_key(*row) for pk, *row in rows}
+
+
+def key_of(appointment: Appointment) -> Key:
+    return get_key(
+        appointment.created_at,
+        appointment.pin_code_id,
+        appointment.time_slot_id,
+        appointment.weekday,
+        appointment.status,
+        appointment.is_cancelled,
+        appointment.appliance.product_line_id,
+    )
+
+
+def apply(deltas: Counter):
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+
+        lookup = dict(zip(FIELDS, key))
+        with transaction.atomic():
+            stats = AppointmentDailyStats.objects.filter(**lookup)
+            if stats.update(count=F("count") + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    AppointmentDailyStats.objects.create(count=delta, **lookup)
+            except IntegrityError:
+                # created concurrently
+                stats.update(count=F("count") + delta)
+
+
+def update(queryset: QuerySet, **fields) -> int:
+    """Like ``queryset.update(**fields)``, but keeps the counts up to date."""
+
+    with transaction.atomic():
+        # locked until the counts are applied, so that a concurrent change isn't counted twice
+        before = get_keys(queryset.select_for_update(of=("self",)))
+        updated = Appointment.objects.filter(pk__in=before).update(**fields)
+        after = get_keys(Appointment.objects.filter(pk__in=before))
+
+        deltas = Counter()
+        deltas.subtract(before.values())
+        deltas.update(after.values())
+        apply(deltas)
+
+    return updated
+
+
+def count(queryset: QuerySet) -> Counter:
+    rows = (
+        queryset.order_by()
+        .annotate(
+            day=TruncDate("created_at"),
+            effective_status=Case(
+                When(is_cancelled=True, then=Value(Appointment.CANCELLED)),
+                default=F("status"),
+                output_field=CharField(),
+            ),
+        )
+        .values_list(
+            "day",
+            "pin_code_id",
+            "time_slot_id",
+            "weekday",
+            "effective_status",
+            "appliance__product_line_id",
+        )
+        .annotate(count=Count("pk"))
+    )
+    return Counter({tuple(key): n for *key, n in rows})
+
+
+def reconcile(since: datetime.date = None):
+    """
+    Recomputes the counts of appointments booked on or after ``since`` (or of all appointments),
+    including the archived ones.
+    """
+
+    stats = AppointmentDailyStats.objects.all()
+    counts = Counter()
+    for model in (Appointment, ArchivedAppointment):
+        appointments = model.objects.all()
+        if since is not None:
+            appointments = appointments.filter(
+                created_at__gte=timezone.make_aware(
+                    datetime.datetime.combine(since, datetime.time.min)
+                )
+            )
+        counts.update(count(appointments))
+    if since is not None:
+        stats = stats.filter(day__gte=since)
+
+    with transaction.atomic():
+        stats.delete()
+        AppointmentDailyStats.objects.bulk_create(
+            AppointmentDailyStats(count=n, **dict(zip(FIELDS, key)))
+            for key, n in counts.items()
+        )
+
+
+def summarize(since: datetime.date) -> List[Tuple[str, List[Tuple[str, int]]]]:
+    """Totals of the appointments booked on or after ``since``, broken down by each field in turn."""
+
+    stats = AppointmentDailyStats.objects.filter(day__gte=since)
+
+    summary = []
+    for title, name in BREAKDOWNS:
+        field = AppointmentDailyStats._meta.get_field(name)
+        rows = dict(
+            stats.values_list(field.attname)
+            .annotate(total=Sum("count"))
+            .order_by(field.attname)
+        )
+        if field.is_relation:
+            labels = field.related_model.objects.in_bulk(rows)
+        else:
+            labels = dict(field.choices or ())
+        totals = [(labels.get(value, value), n) for value, n in rows.items() if n]
+        summary.append((title, totals))
+
+    return summary
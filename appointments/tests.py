@@ -1,3 +1,498 @@
+import csv
+import datetime
+import io
+import json
+import unittest
+from unittest import mock
+
+from django.contrib import admin
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from appliances.models import Appliance, ProductLine
+from appointments import archive, bulk, export, stats
+from appointments.models import (
+    Appointment,
+    AppointmentDailyStats,
+    AppointmentStatusChange,
+    ArchivedAppointment,
+    Notification,
+)
+from pin_codes.models import PinCode, ServiceArea, TimeSlot
+from users.models import CustomUser
+
+try:
+    from appointments import analytics
+except ImportError:
+    analytics = None
+
+
+class AppointmentTestCase(TestCase):
+    def setUp(self):
+        product_line = ProductLine.objects.create(name="Fridge")
+        self.appliance = Appliance.objects.create(
+            serial_number="ABC123",
+            product_line=product_line,
+            model_number="M1",
+            name="Fridge",
+        )
+        self.user = CustomUser.objects.create(
+            username="42", phone_number="+919000000000"
+        )
+        self.time_slot = TimeSlot.objects.create(
+            start=datetime.time(9), end=datetime.time(11)
+        )
+        self.pin_code = PinCode.objects.create(pin_code="560001")
+        self.pin_code.time_slots.add(self.time_slot)
+
+    def create(self, tracking_number: str, **kwargs) -> Appointment:
+        fields = {
+            "appliance": self.appliance,
+            "user": self.user,
+            "address": "Somewhere",
+            "pin_code": self.pin_code,
+            "weekday": PinCode.MON,
+            "time_slot": self.time_slot,
+            "reason": "Broken",
+            **kwargs,
+        }
+        return Appointment.objects.create(tracking_number=tracking_number, **fields)
+
+
+class StatsTest(AppointmentTestCase):
+    def get_counts(self) -> dict:
+        return dict(
+            AppointmentDailyStats.objects.filter(count__gt=0).values_list(
+                "status", "count"
+            )
+        )
+
+    def test_signals(self):
+        appointment = self.create("0000000001")
+        self.create("0000000002")
+        self.assertEqual(self.get_counts(), {Appointment.PENDING: 2})
+
+        appointment.status = Appointment.ACCEPTED
+        appointment.save()
+        self.assertEqual(
+            self.get_counts(), {Appointment.PENDING: 1, Appointment.ACCEPTED: 1}
+        )
+
+        appointment.is_cancelled = True
+        appointment.save()
+        self.assertEqual(
+            self.get_counts(), {Appointment.PENDING: 1, Appointment.CANCELLED: 1}
+        )
+
+        appointment.delete()
+        self.assertEqual(self.get_counts(), {Appointment.PENDING: 1})
+
+    def test_update(self):
+        for i in range(3):
+            self.create(f"000000000{i}")
+
+        updated = stats.update(
+            Appointment.objects.filter(tracking_number__lt="0000000002"),
+            status=Appointment.RESOLVED,
+        )
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            self.get_counts(), {Appointment.PENDING: 1, Appointment.RESOLVED: 2}
+        )
+
+    def test_matches_reconcile(self):
+        self.create("0000000001")
+        self.create("0000000002", is_cancelled=True).delete()
+        stats.update(Appointment.objects.all(), weekday=PinCode.TUE)
+        rows = AppointmentDailyStats.objects.filter(count__gt=0)
+        counts = set(rows.values_list(*stats.FIELDS, "count"))
+
+        stats.reconcile()
+        self.assertEqual(set(rows.values_list(*stats.FIELDS, "count")), counts)
+
+    def test_summarize(self):
+        self.create("0000000001")
+        self.create("0000000002", weekday=PinCode.TUE, is_cancelled=True)
+        other = PinCode.objects.create(pin_code="560002")
+        self.create("0000000003", pin_code=other).delete()
+        today = timezone.localdate()
+
+        summary = dict(stats.summarize(today))
+
+        self.assertEqual(
+            [str(title) for title, _ in stats.BREAKDOWNS], list(map(str, summary))
+        )
+        summary = {str(title): totals for title, totals in summary.items()}
+        self.assertEqual(summary["Day"], [(today, 2)])
+        self.assertEqual(summary["Pin code"], [(self.pin_code, 2)])
+        self.assertEqual(summary["Weekday"], [("Monday", 1), ("Tuesday", 1)])
+        self.assertEqual(summary["Time slot"], [(self.time_slot, 2)])
+        self.assertEqual(
+            summary["Status"], [(Appointment.CANCELLED, 1), (Appointment.PENDING, 1)]
+        )
+        self.assertEqual(stats.summarize(today + datetime.timedelta(days=1))[0][1], [])
+
+
+class BulkChangeTest(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = CustomUser.objects.create(username="admin")
+        self.pending = [self.create(f"000000000{i}") for i in range(3)]
+        self.accepted = self.create("0000000003", status=Appointment.ACCEPTED)
+        self.cancelled = self.create("0000000004", is_cancelled=True)
+
+    def get_history(self, status: str) -> set:
+        return set(
+            AppointmentStatusChange.objects.filter(
+                status=status, changed_by=self.admin
+            ).values_list("appointment_id", flat=True)
+        )
+
+    def test_update_per_batch(self):
+        table = connection.ops.quote_name(Appointment._meta.db_table)
+        with mock.patch("appointments.bulk.BATCH_SIZE", 2), CaptureQueriesContext(
+            connection
+        ) as queries:
+            changed = bulk.accept(Appointment.objects.all(), self.admin)
+
+        self.assertEqual(changed, 3)
+        updates = [
+            query["sql"]
+            for query in queries.captured_queries
+            if query["sql"].startswith(f"UPDATE {table}")
+        ]
+        self.assertEqual(len(updates), 2)
+
+    def test_accept(self):
+        self.assertEqual(bulk.accept(Appointment.objects.all(), self.admin), 3)
+
+        ids = {appointment.pk for appointment in self.pending}
+        self.assertEqual(
+            set(
+                Appointment.objects.filter(status=Appointment.ACCEPTED).values_list(
+                    "pk", flat=True
+                )
+            ),
+            ids | {self.accepted.pk},
+        )
+        self.assertEqual(self.get_history(Appointment.ACCEPTED), ids)
+        self.assertEqual(
+            set(Notification.objects.values_list("appointment_id", "text")),
+            {
+                (
+                    appointment.pk,
+                    f"Your appointment `{appointment.tracking_number}` has been accepted.",
+                )
+                for appointment in self.pending
+            },
+        )
+
+    def test_resolve(self):
+        self.assertEqual(bulk.resolve(Appointment.objects.all(), self.admin), 4)
+
+        self.assertEqual(
+            self.get_history(Appointment.RESOLVED),
+            {appointment.pk for appointment in self.pending} | {self.accepted.pk},
+        )
+        self.cancelled.refresh_from_db()
+        self.assertEqual(self.cancelled.status, Appointment.PENDING)
+
+    def test_cancel(self):
+        self.assertEqual(bulk.cancel(Appointment.objects.all(), self.admin), 4)
+
+        self.assertEqual(Appointment.objects.filter(is_cancelled=False).count(), 0)
+        self.assertNotIn(self.cancelled.pk, self.get_history(Appointment.CANCELLED))
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_reassign_time_slot(self):
+        time_slot = TimeSlot.objects.create(
+            start=datetime.time(14), end=datetime.time(16)
+        )
+        self.pin_code.time_slots.add(time_slot)
+        area = ServiceArea.objects.create(name="Pune", start=411000, end=411999)
+        area.time_slots.add(time_slot)
+        in_area = self.create(
+            "0000000005",
+            pin_code=PinCode.objects.create(pin_code="411001", service_area=area),
+        )
+        unserved = self.create(
+            "0000000006", pin_code=PinCode.objects.create(pin_code="560002")
+        )
+
+        changed, skipped = bulk.reassign_time_slot(
+            Appointment.objects.all(), PinCode.TUE, time_slot, self.admin
+        )
+
+        self.assertEqual((changed, skipped), (5, 1))
+        moved = {appointment.pk for appointment in self.pending}
+        moved |= {self.accepted.pk, in_area.pk}
+        self.assertEqual(self.get_history(Appointment.RESCHEDULED), moved)
+        self.assertEqual(
+            set(
+                Appointment.objects.filter(
+                    weekday=PinCode.TUE, time_slot=time_slot
+                ).values_list("pk", flat=True)
+            ),
+            moved,
+        )
+        unserved.refresh_from_db()
+        self.assertEqual(unserved.time_slot, self.time_slot)
+
+    def test_reassign_to_day_off(self):
+        changed, skipped = bulk.reassign_time_slot(
+            Appointment.objects.all(), PinCode.SUN, self.time_slot, self.admin
+        )
+
+        self.assertEqual((changed, skipped), (0, 4))
+        self.assertFalse(Notification.objects.exists())
+
+
+class ArchiveTest(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.resolved = self.create("0000000001", status=Appointment.RESOLVED)
+        self.cancelled = self.create("0000000002", is_cancelled=True)
+        self.pending = self.create("0000000003")
+        self.notified = self.create("0000000004", is_cancelled=True)
+        self.recent = self.create("0000000005", is_cancelled=True)
+
+        AppointmentStatusChange.objects.create(
+            appointment=self.resolved, status=Appointment.RESOLVED, note="Fixed"
+        )
+        Notification.objects.create(appointment=self.resolved, text="Resolved")
+        Notification.objects.filter(appointment=self.resolved).update(
+            sent_at=timezone.now()
+        )
+        Notification.objects.create(appointment=self.notified, text="Cancelled")
+
+        stats.update(
+            Appointment.objects.exclude(pk=self.recent.pk),
+            created_at=timezone.now() - datetime.timedelta(days=10),
+        )
+
+    def get_counts(self) -> dict:
+        return {
+            (row.day, row.status): row.count
+            for row in AppointmentDailyStats.objects.filter(count__gt=0)
+        }
+
+    def test_archive(self):
+        counts = self.get_counts()
+        created_at = Appointment.objects.get(pk=self.resolved.pk).created_at
+
+        self.assertEqual(archive.archive(days=5, batch_size=1), 2)
+
+        self.assertEqual(
+            set(ArchivedAppointment.objects.values_list("pk", flat=True)),
+            {self.resolved.pk, self.cancelled.pk},
+        )
+        self.assertEqual(
+            set(Appointment.objects.values_list("pk", flat=True)),
+            {self.pending.pk, self.notified.pk, self.recent.pk},
+        )
+        self.assertFalse(Notification.objects.filter(appointment=self.resolved.pk))
+        self.assertEqual(self.get_counts(), counts)
+
+        archived = ArchivedAppointment.objects.get(pk=self.resolved.pk)
+        self.assertEqual(archived.tracking_number, "0000000001")
+        self.assertEqual(archived.created_at, created_at)
+        (change,) = json.loads(archived.status_changes)
+        self.assertEqual((change["status"], change["note"]), ("Resolved", "Fixed"))
+
+    def test_no_stats_updates(self):
+        with mock.patch("appointments.stats.apply") as apply:
+            archive.archive(days=5)
+        apply.assert_not_called()
+
+    def test_max_batches(self):
+        self.assertEqual(archive.archive(days=5, batch_size=1, max_batches=1), 1)
+
+    def test_stats_match_reconcile(self):
+        archive.archive(days=5)
+        counts = self.get_counts()
+
+        stats.reconcile()
+        self.assertEqual(self.get_counts(), counts)
+
+    def test_tracking_number_skips_archived(self):
+        archive.archive(days=5)
+
+        digits = iter("0000000001" + "0000000003" + "0000000009")
+        with mock.patch("secrets.choice", side_effect=lambda _: next(digits)):
+            self.assertEqual(Appointment.gen_tracking_number(), "0000000009")
+
+    def test_export_archived(self):
+        archive.archive(days=5)
+
+        lines, _ = export.export(
+            Appointment.objects.all(),
+            "jsonl",
+            archived=ArchivedAppointment.objects.all(),
+        )
+        tracking_numbers = [json.loads(line)["tracking_number"] for line in lines]
+        self.assertEqual(len(tracking_numbers), 5)
+        self.assertEqual(set(tracking_numbers[3:]), {"0000000001", "0000000002"})
+
+
+class ExportTest(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.create("0000000001")
+        self.second = self.create("0000000002")
+        self.create("0000000003")
+        admin = CustomUser.objects.create_superuser(
+            username="admin", email="admin@example.com", password="password"
+        )
+        self.client.force_login(admin)
+
+    def run_action(self, action: str):
+        return self.client.post(
+            reverse("admin:appointments_appointment_changelist"),
+            {
+                "action": action,
+                admin.helpers.ACTION_CHECKBOX_NAME: [self.first.pk, self.second.pk],
+            },
+        )
+
+    def test_csv(self):
+        response = self.run_action("export_csv")
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="appointments.csv"'
+        )
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0], list(export.COLUMNS))
+        self.assertEqual(
+            sorted(row[1] for row in rows[1:]), ["0000000001", "0000000002"]
+        )
+
+    def test_jsonl(self):
+        response = self.run_action("export_jsonl")
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            sorted(json.loads(line)["tracking_number"] for line in lines),
+            ["0000000001", "0000000002"],
+        )
+
+    def test_booked_between(self):
+        Appointment.objects.filter(pk=self.first.pk).update(
+            created_at=timezone.now() - datetime.timedelta(days=3)
+        )
+        today = datetime.datetime.combine(timezone.localdate(), datetime.time.min)
+        three_days_ago = today - datetime.timedelta(days=3)
+        yesterday = today - datetime.timedelta(days=1)
+
+        def booked(since, until) -> set:
+            booked = export.booked_between(Appointment.objects.all(), since, until)
+            return set(booked.values_list("tracking_number", flat=True))
+
+        self.assertEqual(len(booked(None, None)), 3)
+        self.assertEqual(booked(None, yesterday), {"0000000001"})
+        self.assertEqual(booked(three_days_ago, three_days_ago), {"0000000001"})
+        self.assertEqual(booked(today, None), {"0000000002", "0000000003"})
+
+
+class PinCodeFilterTest(AppointmentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create("0000000001")
+        self.create("0000000002", pin_code=PinCode.objects.create(pin_code="560002"))
+        admin = CustomUser.objects.create_superuser(
+            username="admin", email="admin@example.com", password="password"
+        )
+        self.client.force_login(admin)
+
+    def get_tracking_numbers(self, **params) -> set:
+        response = self.client.get(
+            reverse("admin:appointments_appointment_changelist"), params
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            appointment.tracking_number
+            for appointment in response.context["cl"].result_list
+        }
+
+    def test_filter(self):
+        self.assertEqual(self.get_tracking_numbers(pin_code=" 560002 "), {"0000000002"})
+        self.assertEqual(self.get_tracking_numbers(pin_code="999999"), set())
+        self.assertEqual(self.get_tracking_numbers(), {"0000000001", "0000000002"})
+
+    def test_no_choices_listed(self):
+        response = self.client.get(reverse("admin:appointments_appointment_changelist"))
+
+        self.assertContains(response, 'name="pin_code"')
+        self.assertNotContains(response, "?pin_code__id__exact=")
+
+
+@unittest.skipIf(analytics is None, "the 'analytics' extra isn't installed")
+class AnalyticsDumpTest(AppointmentTestCase):
+    def dump_and_load(self, archived=None) -> dict:
+        file = io.BytesIO()
+        analytics.dump(Appointment.objects.all(), file, archived=archived)
+        file.seek(0)
+        return analytics.load(file)
+
+    def test_chunks(self):
+        appointments = [self.create(f"{i:010}", is_cancelled=i == 1) for i in range(3)]
+
+        with mock.patch("appointments.analytics.CHUNK_SIZE", 2):
+            data = self.dump_and_load()
+
+        self.assertEqual(
+            sorted(data["id"].tolist()), [appointment.pk for appointment in appointments]
+        )
+        self.assertEqual(data["is_cancelled"].sum(), 1)
+        self.assertEqual(data["pin_code_labels"].tolist(), ["560001"])
+        self.assertEqual(data["status_labels"][data["status"][0]], Appointment.PENDING)
+
+    def test_archived(self):
+        self.create("0000000001", status=Appointment.RESOLVED)
+        stats.update(
+            Appointment.objects.all(),
+            created_at=timezone.now() - datetime.timedelta(days=10),
+        )
+        archive.archive(days=5)
+        self.create("0000000002")
+
+        data = self.dump_and_load(archived=ArchivedAppointment.objects.all())
+
+        self.assertEqual(data["id"].size, 2)
+
+    def test_drops_unknown_ids(self):
+        self.create("0000000001")
+        other = PinCode.objects.create(pin_code="560002")
+        self.create("0000000002", pin_code=other)
+        lookups = analytics.get_lookups
+
+        def get_lookups():
+            # as if the pin code was deleted after its appointment was dumped
+            data = lookups()
+            known = data["pin_code_ids"] != other.pk
+            data["pin_code_ids"] = data["pin_code_ids"][known]
+            data["pin_code_labels"] = data["pin_code_labels"][known]
+            return data
+
+        with mock.patch("appointments.analytics.get_lookups", get_lookups):
+            data = self.dump_and_load()
+
+        self.assertEqual(data["id"].size, 1)
+        self.assertEqual(data["dropped"], 1)
+        self.assertEqual(
+            analytics.cancellation_rates(data, ["pin_code"]), [(("560001",), 1, 0.0)]
+        )
+
+    def test_empty(self):
+        data = self.dump_and_load()
 
-# Create your tests here.
+        self.assertEqual(data["id"].size, 0)
+        self.assertEqual(data["id"].dtype, analytics.COLUMNS["id"][1])
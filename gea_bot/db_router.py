@@ -0,0 +1,76 @@
+"""
+Sends the bot's reads to the read replicas, and everything else to the default database.
+
+After a bot user writes some of their own data (their registration, an appointment ...),
+their reads go to the default database for ``REPLICA_STICKINESS`` seconds,
+so that they see their own writes even if the replicas are lagging behind.
+Bookkeeping written along the way (update checkpoints, pin codes created for a service area ...)
+doesn't count.
+
+Bot users are identified through the logging context of the update being handled (`telebot.logs`).
+Outside of it, e.g. in the admin panel, reads always go to the default database.
+"""
+
+import random
+import threading
+import time
+
+from django.conf import settings
+
+from telebot.logs import user_id
+
+# the models holding the data a bot user expects to see their own changes to
+USER_DATA = {
+    "users.customuser",
+    "appointments.appointment",
+    "appointments.appointmentstatuschange",
+}
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = [alias for alias in settings.DATABASES if alias != "default"]
+        self.last_writes = {}
+        self.lock = threading.Lock()
+
+    def wrote_recently(self, user: int) -> bool:
+        last_write = self.last_writes.get(user)
+        return (
+            last_write is not None
+            and time.monotonic() - last_write < settings.REPLICA_STICKINESS
+        )
+
+    def record_write(self, user: int):
+        now = time.monotonic()
+        with self.lock:
+            self.last_writes[user] = now
+            if len(self.last_writes) > 10_000:
+                self.last_writes = {
+                    user: last_write
+                    for user, last_write in self.last_writes.items()
+                    if now - last_write < settings.REPLICA_STICKINESS
+                }
+
+    def db_for_read(self, model, **hints):
+        user = user_id.get()
+        if not self.replicas or user is None or self.wrote_recently(user):
+            return "default"
+
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # follow relations on the database the instance came from
+            return instance._state.db
+
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        user = user_id.get()
+        if user is not None and model._meta.label_lower in USER_DATA:
+            self.record_write(user)
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # every database holds the same data
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == "default"
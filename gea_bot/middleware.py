@@ -0,0 +1,20 @@
+import time
+
+from telebot.metrics import REQUEST_LATENCY
+
+
+def metrics_middleware(get_response):
+    """Records the latency of every request, labelled by the resolved view."""
+
+    def middleware(request):
+        start = time.perf_counter()
+        response = get_response(request)
+
+        match = request.resolver_match
+        REQUEST_LATENCY.labels(
+            match.view_name if match else "<unresolved>", request.method
+        ).observe(time.perf_counter() - start)
+
+        return response
+
+    return middleware
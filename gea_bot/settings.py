@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 
 import os
 
-from decouple import config, UndefinedValueError
+from decouple import config, Csv, UndefinedValueError
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -39,6 +39,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "phonenumber_field",
     "users",
     "appliances",
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "gea_bot.middleware.metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -100,6 +102,30 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database, used for the bot's lookups (see `gea_bot.db_router`).
+for i, host in enumerate(config("POSTGRES_REPLICA_HOSTS", default="", cast=Csv())):
+    DATABASES[f"replica{i}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["gea_bot.db_router.ReplicaRouter"]
+
+# Seconds for which a bot user's reads stick to the primary after they write something.
+REPLICA_STICKINESS = config("REPLICA_STICKINESS", default=10, cast=float)
+
+# A memcached server (host:port) shared by the bot processes, needed for ``THROTTLE_SHARED``.
+# Without one, each process caches in its own memory.
+MEMCACHED_LOCATION = config("MEMCACHED_LOCATION", default="")
+if MEMCACHED_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": MEMCACHED_LOCATION,
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -127,6 +153,7 @@ USE_L10N = True
 USE_TZ = True
 
 PHONENUMBER_DEFAULT_REGION = "IN"
+PHONENUMBER_DB_FORMAT = "E164"
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
@@ -139,3 +166,83 @@ AUTH_USER_MODEL = "users.CustomUser"
 
 TELEGRAM_API_TOKEN = config("TELEGRAM_API_TOKEN")
 GOOGLE_MAPS_API_TOKEN = config("GOOGLE_MAPS_API_TOKEN")
+
+# Address of the sidecar HTTP server exposing the bot process' prometheus metrics and health checks.
+METRICS_HOST = config("METRICS_HOST", default="127.0.0.1")
+METRICS_PORT = config("METRICS_PORT", default=9100, cast=int)
+
+# Bearer token required to scrape the metrics (of the web and bot processes), which aren't served without one.
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# On-demand sampling profiler for the bot process, started by sending it SIGUSR2.
+PROFILE_DIR = config("PROFILE_DIR", default=os.path.join(BASE_DIR, "profiles"))
+PROFILE_SAMPLE_RATE = config("PROFILE_SAMPLE_RATE", default=0.1, cast=float)
+PROFILE_WINDOW = config("PROFILE_WINDOW", default=60, cast=float)
+PROFILE_INTERVAL = config("PROFILE_INTERVAL", default=0.005, cast=float)
+
+# The bot logs JSON lines through a queue, sampling INFO records once the queue backs up.
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", default=10000, cast=int)
+LOG_SAMPLE_THRESHOLD = config("LOG_SAMPLE_THRESHOLD", default=1000, cast=int)
+LOG_SAMPLE_RATE = config("LOG_SAMPLE_RATE", default=0.1, cast=float)
+
+# Inline buttons older than this (in seconds) are rejected, see `telebot.tokens`.
+CALLBACK_TOKEN_MAX_AGE = config("CALLBACK_TOKEN_MAX_AGE", default=30 * 24 * 60 * 60, cast=int)
+
+# Serial number lookups, see `appliances.lookup`.
+APPLIANCE_CACHE_SIZE = config("APPLIANCE_CACHE_SIZE", default=10000, cast=int)
+APPLIANCE_CACHE_TTL = config("APPLIANCE_CACHE_TTL", default=60, cast=float)
+APPLIANCE_FILTER_TTL = config("APPLIANCE_FILTER_TTL", default=300, cast=float)
+APPLIANCE_FILTER_POLL = config("APPLIANCE_FILTER_POLL", default=10, cast=float)
+SERIAL_SUGGESTION_LIMIT = config("SERIAL_SUGGESTION_LIMIT", default=3, cast=int)
+SERIAL_SUGGESTION_THRESHOLD = config("SERIAL_SUGGESTION_THRESHOLD", default=0.3, cast=float)
+# Suggestion buttons older than this (in seconds) are rejected.
+SERIAL_SUGGESTION_MAX_AGE = config("SERIAL_SUGGESTION_MAX_AGE", default=10 * 60, cast=int)
+# Each user gets up to SERIAL_SUGGESTION_BURST lists of suggestions, refilled at SERIAL_SUGGESTION_RATE per second.
+SERIAL_SUGGESTION_RATE = config("SERIAL_SUGGESTION_RATE", default=1 / 60, cast=float)
+SERIAL_SUGGESTION_BURST = config("SERIAL_SUGGESTION_BURST", default=5, cast=int)
+
+# Per-user flood protection, see `telebot.throttle`.
+THROTTLE_RATE = config("THROTTLE_RATE", default=1.0, cast=float)
+THROTTLE_BURST = config("THROTTLE_BURST", default=5, cast=int)
+# Counts the limit in memcached (see ``MEMCACHED_LOCATION``), so that it holds across bot processes.
+THROTTLE_SHARED = config("THROTTLE_SHARED", default=False, cast=bool)
+
+# Admission control for incoming updates, see `telebot.ingress`.
+INGRESS_QUEUE_SIZE = config("INGRESS_QUEUE_SIZE", default=1000, cast=int)
+SHED_QUEUE_DEPTH = config("SHED_QUEUE_DEPTH", default=200, cast=int)
+SHED_QUEUE_AGE = config("SHED_QUEUE_AGE", default=5, cast=float)
+SHED_BUSY_REPLIES = config("SHED_BUSY_REPLIES", default=100, cast=int)
+
+# Redelivered update detection, see `telebot.dedup`.
+DEDUP_WINDOW = config("DEDUP_WINDOW", default=10_000, cast=int)
+DEDUP_CHECKPOINT_EVERY = config("DEDUP_CHECKPOINT_EVERY", default=50, cast=int)
+
+# Graceful shutdown of the bot, see `telebot.bot.stop_bot()`.
+BOT_STATE_FILE = config("BOT_STATE_FILE", default=os.path.join(BASE_DIR, "bot_state.pickle"))
+DRAIN_TIMEOUT = config("DRAIN_TIMEOUT", default=20, cast=float)
+
+# Health checks of the bot process, see `telebot.health`.
+HEALTH_POLL_TIMEOUT = config("HEALTH_POLL_TIMEOUT", default=60, cast=float)
+MAPS_CIRCUIT_FAILURES = config("MAPS_CIRCUIT_FAILURES", default=5, cast=int)
+MAPS_CIRCUIT_RESET_TIMEOUT = config("MAPS_CIRCUIT_RESET_TIMEOUT", default=30, cast=float)
+# Seconds to wait for google maps, per request, and in total across its retries.
+MAPS_TIMEOUT = config("MAPS_TIMEOUT", default=5, cast=float)
+MAPS_RETRY_TIMEOUT = config("MAPS_RETRY_TIMEOUT", default=10, cast=float)
+
+# Delivery of customer notifications by the bot, see `telebot.notifications`.
+NOTIFICATION_INTERVAL = config("NOTIFICATION_INTERVAL", default=5, cast=float)
+NOTIFICATION_BATCH_SIZE = config("NOTIFICATION_BATCH_SIZE", default=100, cast=int)
+
+# Reconciliation of the appointment stats by the bot, see `appointments.stats`.
+STATS_RECONCILE_INTERVAL = config("STATS_RECONCILE_INTERVAL", default=24 * 60 * 60, cast=float)
+STATS_RECONCILE_DAYS = config("STATS_RECONCILE_DAYS", default=7, cast=int)
+
+# Pin code service areas, see `pin_codes.lookup`.
+SERVICE_AREA_TTL = config("SERVICE_AREA_TTL", default=60, cast=float)
+
+# Archival of old appointments, see `appointments.archive`.
+ARCHIVE_AFTER_DAYS = config("ARCHIVE_AFTER_DAYS", default=180, cast=int)
+ARCHIVE_BATCH_SIZE = config("ARCHIVE_BATCH_SIZE", default=500, cast=int)
+ARCHIVE_INTERVAL = config("ARCHIVE_INTERVAL", default=5 * 60, cast=float)
+ARCHIVE_BATCHES_PER_RUN = config("ARCHIVE_BATCHES_PER_RUN", default=10, cast=int)
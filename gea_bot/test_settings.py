@@ -0,0 +1,38 @@
+"""
+Settings for running the tests locally, on SQLite instead of PostgreSQL:
+
+    ./manage.py test --settings=gea_bot.test_settings
+
+Along with a second database standing in for a read replica (see `gea_bot.db_router`),
+which mirrors the default one in tests.
+"""
+
+import os
+
+# placeholders for the settings that have no default, unless they're set already
+for name in (
+    "SECRET_KEY",
+    "POSTGRES_DB",
+    "POSTGRES_USER",
+    "POSTGRES_PASSWORD",
+    "POSTGRES_HOST",
+    "POSTGRES_PORT",
+    "GOOGLE_MAPS_API_TOKEN",
+):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("DEBUG", "False")
+os.environ.setdefault("TELEGRAM_API_TOKEN", "123456:test")
+
+from gea_bot.settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, "db.sqlite3"),  # noqa: F405
+    },
+    "replica0": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BASE_DIR, "db.sqlite3"),  # noqa: F405
+        "TEST": {"MIRROR": "default"},
+    },
+}
@@ -0,0 +1,85 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from prometheus_client import REGISTRY
+
+from gea_bot import settings
+from gea_bot.paginator import ApproximateCountPaginator
+from pin_codes.models import PinCode
+
+
+class MetricsViewTest(SimpleTestCase):
+    def get(self, token: str = None):
+        headers = {} if token is None else {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+        return self.client.get("/metrics", **headers)
+
+    def test_token(self):
+        with mock.patch.object(settings, "METRICS_TOKEN", "secret"):
+            response = self.get("secret")
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"http_request_latency_seconds", response.content)
+
+            self.assertEqual(self.get().status_code, 404)
+            self.assertEqual(self.get("wrong").status_code, 404)
+
+    def test_without_token_set(self):
+        with mock.patch.object(settings, "METRICS_TOKEN", ""):
+            self.assertEqual(self.get("").status_code, 404)
+
+
+class MetricsMiddlewareTest(SimpleTestCase):
+    def get_count(self, view: str) -> float:
+        return (
+            REGISTRY.get_sample_value(
+                "http_request_latency_seconds_count", {"view": view, "method": "GET"}
+            )
+            or 0
+        )
+
+    def test_labelled_by_view(self):
+        metrics = self.get_count("gea_bot.views.metrics")
+        unresolved = self.get_count("<unresolved>")
+
+        self.client.get("/metrics")
+        self.client.get("/missing")
+
+        self.assertEqual(self.get_count("gea_bot.views.metrics"), metrics + 1)
+        self.assertEqual(self.get_count("<unresolved>"), unresolved + 1)
+
+
+class ApproximateCountPaginatorTest(TestCase):
+    def setUp(self):
+        PinCode.objects.bulk_create(PinCode(pin_code=str(i)) for i in range(5))
+
+    def test_exact_count(self):
+        paginator = ApproximateCountPaginator(PinCode.objects.order_by("pk"), 2)
+
+        # no estimate outside postgres
+        self.assertIsNone(paginator.estimate())
+        self.assertEqual(paginator.count, 5)
+        self.assertEqual(paginator.num_pages, 3)
+
+    def test_estimate(self):
+        paginator = ApproximateCountPaginator(PinCode.objects.order_by("pk"), 2)
+        paginator.threshold = 3
+
+        with mock.patch.object(paginator, "estimate", return_value=1000):
+            self.assertEqual(paginator.count, 1000)
+        self.assertEqual(len(paginator.page(2)), 2)
+
+    def test_small_estimate(self):
+        paginator = ApproximateCountPaginator(PinCode.objects.order_by("pk"), 2)
+
+        # below the threshold, the estimate could be off by more than the table's size
+        with mock.patch.object(paginator, "estimate", return_value=3):
+            self.assertEqual(paginator.count, 5)
+
+    def test_filtered(self):
+        paginator = ApproximateCountPaginator(
+            PinCode.objects.filter(pin_code__in=["1", "2"]).order_by("pk"), 2
+        )
+
+        with mock.patch("gea_bot.paginator.connections") as connections:
+            self.assertIsNone(paginator.estimate())
+        connections.__getitem__.assert_not_called()
+        self.assertEqual(paginator.count, 2)
@@ -19,9 +19,11 @@ from django.contrib import admin
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path
 
-from .views import home
+from .views import healthz, home, metrics
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics),
+    path("healthz", healthz),
     path("", home),
 ] + staticfiles_urlpatterns()
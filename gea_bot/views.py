@@ -1,5 +1,42 @@
+import os
+
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
+
+from telebot.health import check_db, is_authorized
 
 
 def home(request):
     return render(request, "home.html")
+
+
+def metrics(request):
+    """
+    The metrics of every gunicorn worker, aggregated through ``PROMETHEUS_MULTIPROC_DIR`` (see `scripts/run-prod.sh`).
+    Only served to scrapers sending ``METRICS_TOKEN`` as a bearer token, and not at all if it isn't set.
+    """
+
+    if not is_authorized(request.META.get("HTTP_AUTHORIZATION", "")):
+        raise Http404
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY  # a single process, e.g. runserver
+
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def healthz(request):
+    """Health of the web process. The bot process serves its own, see `telebot.health`."""
+
+    database = check_db()
+    return JsonResponse({"database": database}, status=200 if database["ok"] else 503)
@@ -1,6 +1,54 @@
+from django import forms
 from django.contrib import admin
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext_lazy as _
 
-from pin_codes.models import TimeSlot, PinCode
+from pin_codes.models import PIN_CODE_LENGTH, PinCode, ServiceArea, TimeSlot
+
+
+class WorkingDayFilter(admin.SimpleListFilter):
+    title = _("working day")
+    parameter_name = "working_day"
+
+    def lookups(self, request, model_admin):
+        return PinCode.WEEKDAY_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value() not in PinCode.WEEKDAY_CHOICES_DICT:
+            return queryset
+        return queryset.filter(working_days__contains=self.value())
+
+
+class ServiceAreaForm(forms.ModelForm):
+    prefix = forms.RegexField(
+        regex=rf"^\d{{1,{PIN_CODE_LENGTH}}}$",
+        required=False,
+        help_text=_("Covers every pin code starting with this, instead of a range."),
+    )
+
+    class Meta:
+        model = ServiceArea
+        fields = ("name", "prefix", "start", "end", "time_slots", "working_days")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["start"].required = False
+        self.fields["end"].required = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+
+        prefix = cleaned_data.get("prefix")
+        if prefix:
+            cleaned_data["start"], cleaned_data["end"] = ServiceArea.get_prefix_range(
+                prefix
+            )
+        elif cleaned_data.get("start") is None or cleaned_data.get("end") is None:
+            raise ValidationError(
+                _("Enter either a prefix, or the first and last pin codes.")
+            )
+
+        return cleaned_data
 
 
 @admin.register(TimeSlot)
@@ -10,4 +58,18 @@ class TimeSlotAdmin(admin.ModelAdmin):
 
 @admin.register(PinCode)
 class PinCodeAdmin(admin.ModelAdmin):
-    pass
+    search_fields = ("^pin_code",)
+    ordering = ("pin_code",)
+    list_display = ("pin_code", "service_area")
+    list_filter = (WorkingDayFilter, "service_area")
+    list_select_related = ("service_area",)
+    autocomplete_fields = ("service_area",)
+
+
+@admin.register(ServiceArea)
+class ServiceAreaAdmin(admin.ModelAdmin):
+    form = ServiceAreaForm
+    search_fields = ("name",)
+    ordering = ("start",)
+    list_display = ("name", "start", "end")
+    list_filter = (WorkingDayFilter,)
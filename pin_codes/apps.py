@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PinCodesConfig(AppConfig):
     name = "pin_codes"
     verbose_name = "Pin Codes"
+
+    def ready(self):
+        from pin_codes import signals  # noqa: F401
@@ -0,0 +1,134 @@
+"""
+An in-process index of service areas, to find the one containing a pin code with a binary search,
+along with the served pin codes, so that resolving one takes no query.
+
+The areas can't overlap, so sorting them by the first pin code in their range
+is enough to find the only candidate with ``bisect``.
+
+A pin code is served if it has time slots of its own, or belongs to a service area.
+Those are kept in memory with their time slots, keyed by their code.
+A pin code inside an area only gets its row on its first booking, see ``ServiceAreaIndex.resolve()``.
+
+Signals rebuild the index after saves in this process.
+Since the bot and the admin panel run in separate processes,
+it is also rebuilt every ``SERVICE_AREA_TTL`` seconds.
+"""
+
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Q
+
+from pin_codes.models import PIN_CODE_LENGTH, PinCode, ServiceArea
+
+
+class Index(NamedTuple):
+    starts: tuple
+    ends: tuple
+    ids: tuple
+    # code -> served pin code
+    pin_codes: Dict[str, PinCode]
+
+
+def get_served() -> Dict[str, PinCode]:
+    served = (
+        PinCode.objects.filter(
+            Q(service_area__isnull=False) | Q(time_slots__isnull=False)
+        )
+        .distinct()
+        .select_related("service_area")
+        .prefetch_related("time_slots", "service_area__time_slots")
+    )
+    return {pin_code.pin_code: pin_code for pin_code in served}
+
+
+class ServiceAreaIndex:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.index = None
+        self.built_at = 0.0
+        self.lock = threading.Lock()
+
+    def build(self):
+        rows = list(
+            ServiceArea.objects.order_by("start").values_list("start", "end", "pk")
+        )
+        starts, ends, ids = zip(*rows) if rows else ((), (), ())
+        self.index, self.built_at = (
+            Index(starts, ends, ids, get_served()),
+            time.monotonic(),
+        )
+
+    def get_index(self) -> Index:
+        if self.index is None or time.monotonic() - self.built_at > self.ttl:
+            with self.lock:
+                if self.index is None or time.monotonic() - self.built_at > self.ttl:
+                    self.build()
+        return self.index
+
+    def invalidate(self):
+        self.index = None
+
+    def find(self, pin_code: str) -> Optional[int]:
+        """Returns the id of the service area containing ``pin_code``, if any."""
+
+        pin_code = pin_code.strip()
+        if not (
+            pin_code.isascii()
+            and pin_code.isdigit()
+            and len(pin_code) == PIN_CODE_LENGTH
+        ):
+            return None
+        number = int(pin_code)
+
+        index = self.get_index()
+        i = bisect_right(index.starts, number) - 1
+        if i < 0 or number > index.ends[i]:
+            return None
+        return index.ids[i]
+
+    def resolve(self, pin_code: str) -> Optional[PinCode]:
+        """
+        Returns the ``PinCode`` for ``pin_code``, if it's served,
+        creating it on the first booking inside a service area.
+
+        Served pin codes are returned as they are, whether configured on their own or not,
+        so a service area never overrides a pin code set up explicitly.
+        Only a row that's left unserved (e.g. its area was deleted) is moved into the area now covering it.
+        The returned ``PinCode`` is shared between threads, and must not be changed.
+        """
+
+        pin_code = pin_code.strip()
+        index = self.get_index()
+        served = index.pin_codes.get(pin_code)
+        if served is not None:
+            return served
+
+        area_id = self.find(pin_code)
+        if area_id is None:
+            return None
+
+        obj, created = PinCode.objects.get_or_create(
+            pin_code=pin_code, defaults={"service_area_id": area_id}
+        )
+        if not created and obj.service_area_id is None:
+            if obj.time_slots.exists():
+                # configured since the index was built
+                return obj
+            PinCode.objects.filter(pk=obj.pk, service_area=None).update(
+                service_area_id=area_id
+            )
+
+        obj = (
+            PinCode.objects.select_related("service_area")
+            .prefetch_related("service_area__time_slots")
+            .get(pk=obj.pk)
+        )
+        index.pin_codes[pin_code] = obj
+        return obj
+
+
+service_areas = ServiceAreaIndex(ttl=settings.SERVICE_AREA_TTL)
@@ -0,0 +1,43 @@
+# Generated by Django 2.1.1 on 2026-10-19 19:12
+
+from django.db import migrations
+import pin_codes.models
+
+
+def to_mask(apps, schema_editor):
+    PinCode = apps.get_model('pin_codes', 'PinCode')
+    for pin_code in PinCode.objects.all():
+        pin_code.working_days_mask = pin_code.working_days
+        pin_code.save(update_fields=['working_days_mask'])
+
+
+def to_json(apps, schema_editor):
+    PinCode = apps.get_model('pin_codes', 'PinCode')
+    for pin_code in PinCode.objects.all():
+        pin_code.working_days = list(pin_code.working_days_mask)
+        pin_code.save(update_fields=['working_days'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin_codes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pincode',
+            name='working_days_mask',
+            field=pin_codes.models.WeekdaysField(choices=[('0', 'Monday'), ('1', 'Tuesday'), ('2', 'Wednesday'), ('3', 'Thursday'), ('4', 'Friday'), ('5', 'Saturday'), ('6', 'Sunday')], db_index=True, default=frozenset(['0', '1', '2', '3', '4'])),
+        ),
+        migrations.RunPython(to_mask, to_json),
+        migrations.RemoveField(
+            model_name='pincode',
+            name='working_days',
+        ),
+        migrations.RenameField(
+            model_name='pincode',
+            old_name='working_days_mask',
+            new_name='working_days',
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.1.1 on 2026-10-19 19:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import pin_codes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pin_codes', '0002_working_days_bitmask'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pincode',
+            name='time_slots',
+            field=models.ManyToManyField(blank=True, to='pin_codes.TimeSlot'),
+        ),
+        migrations.CreateModel(
+            name='ServiceArea',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('start', models.PositiveIntegerField(help_text='The first pin code in this area.')),
+                ('end', models.PositiveIntegerField(help_text='The last pin code in this area.')),
+                ('working_days', pin_codes.models.WeekdaysField(choices=[('0', 'Monday'), ('1', 'Tuesday'), ('2', 'Wednesday'), ('3', 'Thursday'), ('4', 'Friday'), ('5', 'Saturday'), ('6', 'Sunday')], default=frozenset(['0', '1', '2', '3', '4']))),
+                ('time_slots', models.ManyToManyField(to='pin_codes.TimeSlot')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pincode',
+            name='service_area',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pin_codes', to='pin_codes.ServiceArea'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 import json
+from typing import Tuple
 
 from django import forms
 from django.core import checks
@@ -6,6 +7,8 @@ from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import gettext as _
 
+PIN_CODE_LENGTH = 6
+
 
 class TimeSlot(models.Model):
     start = models.TimeField()
@@ -157,6 +160,120 @@ class MultipleChoiceCharField(models.CharField):
         return self.get_prep_value(value)
 
 
+class WeekdaySet(frozenset):
+    """A set of weekday ids (``PinCode.MON`` ...), iterated in order of the week."""
+
+    @classmethod
+    def from_mask(cls, mask: int) -> "WeekdaySet":
+        return cls(str(i) for i in range(7) if mask & (1 << i))
+
+    @property
+    def mask(self) -> int:
+        return sum(1 << int(i) for i in self)
+
+    def __iter__(self):
+        return iter(sorted(super().__iter__()))
+
+    def __repr__(self):
+        return f"WeekdaySet({list(self)})"
+
+
+class WeekdaysField(models.PositiveSmallIntegerField):
+    """
+    Stores a set of weekdays as a bitmask, with bit ``i`` set for weekday id ``str(i)``.
+    Its value is a ``WeekdaySet``, edited with checkboxes in forms.
+
+    ``field__contains=PinCode.SAT`` (or a set of weekdays, to require all of them)
+    is compiled to an ``IN`` over every mask that includes them, which, unlike a bitwise ``&``, can use an index.
+    """
+
+    description = _("Stores a set of weekdays as a bitmask")
+
+    def validate(self, value, _):
+        if not self.editable:
+            # Skip validation for non-editable fields.
+            return
+        if value is None:
+            if not self.null:
+                raise ValidationError(self.error_messages["null"], code="null")
+            return
+        if not value and not self.blank:
+            raise ValidationError(self.error_messages["blank"], code="blank")
+
+        choices = {key for key, _ in self.flatchoices}
+        for selected in value:
+            if selected not in choices:
+                raise ValidationError(
+                    self.error_messages["invalid_choice"],
+                    code="invalid_choice",
+                    params={"value": selected},
+                )
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return WeekdaySet.from_mask(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, WeekdaySet):
+            return value
+
+        if isinstance(value, str):
+            # a mask, or a JSON list of ids, as serialized by `MultipleChoiceCharField`
+            try:
+                value = json.loads(value)
+            except json.JSONDecodeError as e:
+                raise ValidationError(str(e), code="invalid")
+
+        if isinstance(value, int):
+            return WeekdaySet.from_mask(value)
+        return WeekdaySet(map(str, value))
+
+    def get_prep_value(self, value):
+        value = self.to_python(value)
+        if value is None:
+            return value
+        return value.mask
+
+    def formfield(self, **kwargs):
+        defaults = {
+            "choices_form_class": forms.fields.TypedMultipleChoiceField,
+            "coerce": str,
+            "widget": forms.widgets.CheckboxSelectMultiple,
+        }
+        defaults.update(kwargs)
+
+        return super().formfield(**defaults)
+
+    def value_from_object(self, obj):
+        # as a list, for the initial value of form widgets
+        value = super().value_from_object(obj)
+        if value is None:
+            return value
+        return list(self.to_python(value))
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return str(self.get_prep_value(value))
+
+
+@WeekdaysField.register_lookup
+class WeekdaysContains(models.Lookup):
+    lookup_name = "contains"
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        lhs, params = self.process_lhs(compiler, connection)
+
+        rhs = self.rhs
+        if isinstance(rhs, str):
+            rhs = [rhs]
+        mask = self.lhs.output_field.get_prep_value(rhs)
+
+        masks = [i for i in range(1 << 7) if i & mask == mask]
+        return f"{lhs} IN ({', '.join(['%s'] * len(masks))})", [*params, *masks]
+
+
 class PinCode(models.Model):
     MON = "0"
     TUE = "1"
@@ -179,11 +296,82 @@ class PinCode(models.Model):
     WEEKDAY_CHOICES_DICT = dict(WEEKDAY_CHOICES)
 
     pin_code = models.CharField(max_length=255, unique=True)
-    time_slots = models.ManyToManyField(TimeSlot)
+    # when set, the area's time slots and working days are used instead of these
+    service_area = models.ForeignKey(
+        "ServiceArea",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="pin_codes",
+    )
+    time_slots = models.ManyToManyField(TimeSlot, blank=True)
 
-    working_days = MultipleChoiceCharField(
-        choices=WEEKDAY_CHOICES, default=[MON, TUE, WED, THU, FRI]
+    working_days = WeekdaysField(
+        choices=WEEKDAY_CHOICES,
+        default=WeekdaySet([MON, TUE, WED, THU, FRI]),
+        db_index=True,
     )
 
     def __str__(self):
         return self.pin_code
+
+    def get_time_slots(self) -> models.QuerySet:
+        if self.service_area_id is not None:
+            return self.service_area.time_slots.all()
+        return self.time_slots.all()
+
+    def get_working_days(self) -> WeekdaySet:
+        if self.service_area_id is not None:
+            return self.service_area.working_days
+        return self.working_days
+
+
+class ServiceArea(models.Model):
+    """
+    A range of pin codes, served on the same working days and time slots.
+    Pin codes inside it need no configuration of their own, see `pin_codes.lookup`.
+    """
+
+    name = models.CharField(max_length=255)
+    start = models.PositiveIntegerField(help_text=_("The first pin code in this area."))
+    end = models.PositiveIntegerField(help_text=_("The last pin code in this area."))
+    time_slots = models.ManyToManyField(TimeSlot)
+
+    working_days = WeekdaysField(
+        choices=PinCode.WEEKDAY_CHOICES,
+        default=WeekdaySet(
+            [PinCode.MON, PinCode.TUE, PinCode.WED, PinCode.THU, PinCode.FRI]
+        ),
+    )
+
+    def __str__(self):
+        return f"{self.name} ({self.start:0{PIN_CODE_LENGTH}}-{self.end:0{PIN_CODE_LENGTH}})"
+
+    @staticmethod
+    def get_prefix_range(prefix: str) -> Tuple[int, int]:
+        """The first and last pin codes starting with ``prefix``."""
+
+        padding = PIN_CODE_LENGTH - len(prefix)
+        return int(prefix + "0" * padding), int(prefix + "9" * padding)
+
+    def clean(self):
+        if self.start is None or self.end is None:
+            return
+
+        if self.start > self.end:
+            raise ValidationError(
+                _("The first pin code must not be after the last one."),
+                code="invalid_range",
+            )
+
+        overlapping = (
+            ServiceArea.objects.filter(start__lte=self.end, end__gte=self.start)
+            .exclude(pk=self.pk)
+            .first()
+        )
+        if overlapping is not None:
+            raise ValidationError(
+                _("Overlaps with %(area)s."),
+                code="overlapping_range",
+                params={"area": overlapping},
+            )
@@ -0,0 +1,22 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from pin_codes.lookup import service_areas
+from pin_codes.models import PinCode, ServiceArea
+
+
+@receiver(post_save, sender=ServiceArea)
+@receiver(post_delete, sender=ServiceArea)
+@receiver(post_delete, sender=PinCode)
+@receiver(m2m_changed, sender=ServiceArea.time_slots.through)
+@receiver(m2m_changed, sender=PinCode.time_slots.through)
+def on_service_area_changed(**kwargs):
+    service_areas.invalidate()
+
+
+@receiver(post_save, sender=PinCode)
+def on_pin_code_saved(instance: PinCode, created: bool, **kwargs):
+    # created on a booking inside its area, which `ServiceAreaIndex.resolve()` adds to the index itself
+    if created and instance.service_area_id is not None:
+        return
+    service_areas.invalidate()
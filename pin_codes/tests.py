@@ -1,3 +1,132 @@
-from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase
 
-# Create your tests here.
+from pin_codes.lookup import ServiceAreaIndex
+from pin_codes.models import PinCode, ServiceArea, TimeSlot, WeekdaySet, WeekdaysField
+
+
+class WeekdaySetTest(SimpleTestCase):
+    def test_mask(self):
+        weekdays = WeekdaySet([PinCode.SUN, PinCode.MON, PinCode.WED])
+
+        self.assertEqual(weekdays.mask, 0b1000101)
+        self.assertEqual(WeekdaySet.from_mask(0b1000101), weekdays)
+        self.assertEqual(list(weekdays), [PinCode.MON, PinCode.WED, PinCode.SUN])
+
+    def test_to_python(self):
+        field = WeekdaysField(choices=PinCode.WEEKDAY_CHOICES)
+        expected = WeekdaySet([PinCode.MON, PinCode.TUE])
+
+        self.assertEqual(field.to_python(3), expected)
+        self.assertEqual(field.to_python("3"), expected)
+        self.assertEqual(field.to_python('["0", "1"]'), expected)
+        self.assertEqual(field.to_python([0, 1]), expected)
+        with self.assertRaises(ValidationError):
+            field.to_python("[")
+
+    def test_validate(self):
+        field = WeekdaysField(choices=PinCode.WEEKDAY_CHOICES)
+
+        field.validate(WeekdaySet([PinCode.SAT]), None)
+        with self.assertRaises(ValidationError):
+            field.validate(WeekdaySet(), None)
+        with self.assertRaises(ValidationError):
+            field.validate(WeekdaySet(["7"]), None)
+
+
+class WeekdaysContainsTest(TestCase):
+    def setUp(self):
+        self.weekdays = PinCode.objects.create(
+            pin_code="1", working_days=[PinCode.MON, PinCode.TUE, PinCode.WED]
+        )
+        self.weekend = PinCode.objects.create(
+            pin_code="2", working_days=[PinCode.SAT, PinCode.SUN]
+        )
+        self.every_day = PinCode.objects.create(
+            pin_code="3", working_days=[i for i, _ in PinCode.WEEKDAY_CHOICES]
+        )
+
+    def filter(self, weekdays) -> set:
+        return set(PinCode.objects.filter(working_days__contains=weekdays))
+
+    def test_one_weekday(self):
+        self.assertEqual(self.filter(PinCode.MON), {self.weekdays, self.every_day})
+        self.assertEqual(self.filter(PinCode.SUN), {self.weekend, self.every_day})
+
+    def test_all_of_weekdays(self):
+        self.assertEqual(
+            self.filter([PinCode.MON, PinCode.WED]), {self.weekdays, self.every_day}
+        )
+        self.assertEqual(self.filter([PinCode.MON, PinCode.SAT]), {self.every_day})
+
+    def test_round_trip(self):
+        pin_code = PinCode.objects.get(pk=self.weekend.pk)
+
+        self.assertIsInstance(pin_code.working_days, WeekdaySet)
+        self.assertEqual(pin_code.working_days, {PinCode.SAT, PinCode.SUN})
+
+
+class ServiceAreaIndexTest(TestCase):
+    def setUp(self):
+        self.time_slot = TimeSlot.objects.create(start="09:00", end="11:00")
+        self.pune = ServiceArea.objects.create(name="Pune", start=411000, end=411999)
+        self.pune.time_slots.add(self.time_slot)
+        self.mumbai = ServiceArea.objects.create(
+            name="Mumbai", start=400001, end=400104
+        )
+        self.index = ServiceAreaIndex(ttl=60)
+
+    def test_find(self):
+        self.assertEqual(self.index.find("411000"), self.pune.pk)
+        self.assertEqual(self.index.find(" 411999 "), self.pune.pk)
+        self.assertEqual(self.index.find("400050"), self.mumbai.pk)
+        self.assertIsNone(self.index.find("400000"))
+        self.assertIsNone(self.index.find("400105"))
+        self.assertIsNone(self.index.find("500000"))
+        self.assertIsNone(self.index.find("41100"))
+        self.assertIsNone(self.index.find("４１１０００"))
+
+    def test_find_without_areas(self):
+        ServiceArea.objects.all().delete()
+        self.assertIsNone(ServiceAreaIndex(ttl=60).find("411000"))
+
+    def test_creates_pin_code_in_area(self):
+        pin_code = self.index.resolve("411001")
+
+        self.assertEqual(pin_code.service_area, self.pune)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.resolve("411001"), pin_code)
+            self.assertEqual(list(pin_code.get_time_slots()), [self.time_slot])
+
+    def test_served_without_query(self):
+        explicit = PinCode.objects.create(pin_code="560001")
+        explicit.time_slots.add(self.time_slot)
+        in_area = PinCode.objects.create(pin_code="411001", service_area=self.pune)
+        self.index.get_index()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.resolve(" 560001 "), explicit)
+            self.assertEqual(self.index.resolve("411001"), in_area)
+            self.assertIsNone(self.index.resolve("560002"))
+
+    def test_keeps_explicit_pin_code(self):
+        explicit = PinCode.objects.create(pin_code="411002")
+        explicit.time_slots.add(self.time_slot)
+
+        self.assertEqual(self.index.resolve("411002"), explicit)
+        explicit.refresh_from_db()
+        self.assertIsNone(explicit.service_area)
+
+    def test_unserved_pin_code(self):
+        # e.g. left behind by a deleted service area
+        orphan = PinCode.objects.create(pin_code="411003")
+        PinCode.objects.create(pin_code="560001")
+
+        self.assertEqual(self.index.resolve("411003").service_area, self.pune)
+        orphan.refresh_from_db()
+        self.assertEqual(orphan.service_area, self.pune)
+        self.assertIsNone(self.index.resolve("560001"))
+
+    def test_unserved(self):
+        self.assertIsNone(self.index.resolve("560002"))
+        self.assertFalse(PinCode.objects.filter(pin_code="560002").exists())
@@ -4,5 +4,6 @@ set -ex
 
 rm -rf deps
 pip install . --target deps
+python -m compileall -q deps
 cd deps
 tar -cjf ../gea_bot_deps.tar.bz2 .
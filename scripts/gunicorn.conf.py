@@ -0,0 +1,8 @@
+# gunicorn settings for the web process, see `scripts/run-prod.sh`.
+
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # drop the live gauges of dead workers from the aggregated metrics
+    multiprocess.mark_process_dead(worker.pid)
@@ -12,5 +12,19 @@ export PATH=$PWD/bin:$PATH
 ./manage.py migrate
 
 ./caddy -conf scripts/Caddyfile &
+caddy_pid=$!
 ./manage.py runtelebot &
-gunicorn gea_bot.wsgi --bind unix:$WORKDIR/gunicorn.sock
+bot_pid=$!
+# each worker writes its metrics here, for /metrics to add them up across workers (the bot serves its own)
+metrics_dir=$WORKDIR/prometheus
+rm -rf $metrics_dir
+mkdir -p $metrics_dir
+PROMETHEUS_MULTIPROC_DIR=$metrics_dir gunicorn gea_bot.wsgi --preload \
+  --config scripts/gunicorn.conf.py --bind unix:$WORKDIR/gunicorn.sock &
+web_pid=$!
+
+# let the bot drain its updates and checkpoint before the container goes away
+trap 'kill -TERM $bot_pid $web_pid $caddy_pid' SIGINT SIGTERM
+wait $bot_pid $web_pid
+# the first wait returns as soon as the trap runs
+wait $bot_pid $web_pid
@@ -1,12 +1,15 @@
 import logging
+import os
+import signal
 import textwrap
-import traceback
+import threading
+from datetime import timedelta
 from functools import wraps
 from typing import Callable
 
-import googlemaps
 import telegram as tg
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.translation import gettext as T
 from telegram.ext import (
     CommandHandler,
@@ -15,16 +18,77 @@ from telegram.ext import (
     CallbackQueryHandler,
     Updater,
     Filters,
+    JobQueue,
+    PicklePersistence,
 )
+from telegram.utils.request import Request
 
 import telebot.util as util
+from telebot import (
+    callbacks,
+    dedup,
+    health,
+    logs,
+    metrics,
+    notifications,
+    throttle,
+    tokens,
+)
+from telebot.ingress import IngressQueue
+from telebot.profiler import profiler
+from telebot.routing import Router
+from appliances.lookup import appliance_lookup
 from appliances.models import Appliance
-from appointments.models import Appointment
+from appointments import archive, stats
+from appointments.models import Appointment, ArchivedAppointment
 from gea_bot import settings
-from pin_codes.models import PinCode, TimeSlot
+from pin_codes.lookup import service_areas
+from pin_codes.models import TimeSlot
+
+router = Router()
+
+
+def is_critical(up: tg.Update) -> bool:
+    return up.callback_query is not None or router.is_active(up)
+
+
+update_queue = IngressQueue(
+    maxsize=settings.INGRESS_QUEUE_SIZE,
+    shed_depth=settings.SHED_QUEUE_DEPTH,
+    shed_age=settings.SHED_QUEUE_AGE,
+    is_critical=is_critical,
+    busy_replies=settings.SHED_BUSY_REPLIES,
+)
+
+# callback data codes, see `Router.add_callback_handler()`
+HYPERLINK = "h"
+NEW_TIME_SLOT = "t"
+CANCEL_CONFIRM = "c"
+SERIAL_SUGGESTION = "s"
+
+# how often a user can be shown close matches for a serial number they got wrong,
+# so that the suggestions can't be used to enumerate the serial numbers
+suggestion_throttle = throttle.Throttle(
+    settings.SERIAL_SUGGESTION_RATE, settings.SERIAL_SUGGESTION_BURST
+)
+
+
+def appointment_button(
+    text: str, action: int, appointment: Appointment, up: tg.Update
+) -> tg.InlineKeyboardButton:
+    token = tokens.Token(action, appointment.pk, up.effective_user.id)
+    return tg.InlineKeyboardButton(
+        text=text, callback_data=HYPERLINK + tokens.dumps(token)
+    )
+
+
+def get_owned_appointment(token: tokens.Token) -> Appointment:
+    return (
+        Appointment.objects.active()
+        .owned_by(str(token.owner_id))
+        .get(pk=token.appointment_id)
+    )
 
-updater = Updater(token=settings.TELEGRAM_API_TOKEN)
-dispatcher = updater.dispatcher
 
 HELP = T(
     textwrap.dedent(
@@ -55,16 +119,14 @@ HELP = T(
     )
 )
 
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
-)
+logger = logging.getLogger(__name__)
 
 
 def show_help(_, up: tg.Update):
     up.effective_message.reply_text(text=HELP, parse_mode="Markdown")
 
 
-dispatcher.add_handler(CommandHandler("help", show_help))
+router.add_handler(CommandHandler("help", show_help))
 
 
 def abort(_, up: tg.Update):
@@ -153,7 +215,7 @@ def recv_email(bot, up: tg.Update, chat_data):
     return ConversationHandler.END
 
 
-dispatcher.add_handler(
+router.add_handler(
     ConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
@@ -166,6 +228,8 @@ dispatcher.add_handler(
             ],
         },
         fallbacks=[ABORT, CommandHandler("start", start)],
+        name="start",
+        persistent=True,
     )
 )
 
@@ -185,26 +249,37 @@ def book(_, up: tg.Update):
 
 @util.login_required
 def recv_serial_number(_, up: tg.Update, chat_data):
-    serial_number = up.effective_message.text.strip()
+    serial_number = up.effective_message.text
+    appliance = appliance_lookup.get(serial_number)
 
-    try:
-        appliance = Appliance.objects.get(serial_number__iexact=serial_number)
+    if appliance is not None:
+        return start_appointment(up, chat_data, appliance)
 
-        chat_data["appointment"] = Appointment(
-            appliance=appliance,
-            user=util.get_user(up),
-            tracking_number=Appointment.gen_tracking_number(),
-        )
+    allowed, _ = suggestion_throttle.allow(up.effective_user.id)
+    suggestions = appliance_lookup.suggest(serial_number) if allowed else []
+    if suggestions:
         up.effective_message.reply_text(
-            T(
-                "Checks out!\n"
-                "Next, provide an address for this service appointment.\n\n"
-                "You can also share your location, using the attach (📎) button."
-            )
+            T("You entered an invalid serial number.\n" "Did you mean one of these?"),
+            reply_markup=tg.InlineKeyboardMarkup(
+                [
+                    [
+                        tg.InlineKeyboardButton(
+                            appliance.serial_number,
+                            callback_data=SERIAL_SUGGESTION
+                            + tokens.dumps(
+                                tokens.Token(
+                                    tokens.SUGGESTED_APPLIANCE,
+                                    appliance.pk,
+                                    up.effective_user.id,
+                                )
+                            ),
+                        )
+                    ]
+                    for appliance in suggestions
+                ]
+            ),
         )
-
-        return recv_location.__name__
-    except Appliance.DoesNotExist:
+    else:
         up.effective_message.reply_text(
             T(
                 "You entered an invalid serial number.\n"
@@ -212,8 +287,45 @@ def recv_serial_number(_, up: tg.Update, chat_data):
             )
         )
 
+    return recv_serial_number.__name__
+
+
+@util.verify_token(SERIAL_SUGGESTION, max_age=settings.SERIAL_SUGGESTION_MAX_AGE)
+@callbacks.acknowledge
+@util.login_required
+def recv_serial_suggestion(_, up: tg.Update, chat_data, token: tokens.Token):
+    if token.action != tokens.SUGGESTED_APPLIANCE:
+        return recv_serial_number.__name__
+
+    try:
+        appliance = Appliance.objects.select_related("product_line").get(
+            pk=token.appointment_id
+        )
+    except Appliance.DoesNotExist:
+        up.effective_message.reply_text(
+            T("Invalid Appliance!\nPlease enter a valid serial number.")
+        )
         return recv_serial_number.__name__
 
+    return start_appointment(up, chat_data, appliance)
+
+
+def start_appointment(up: tg.Update, chat_data: dict, appliance: Appliance):
+    chat_data["appointment"] = Appointment(
+        appliance=appliance,
+        user=util.get_user(up),
+        tracking_number=Appointment.gen_tracking_number(),
+    )
+    up.effective_message.reply_text(
+        T(
+            "Checks out!\n"
+            "Next, provide an address for this service appointment.\n\n"
+            "You can also share your location, using the attach (📎) button."
+        )
+    )
+
+    return recv_location.__name__
+
 
 @util.login_required
 def recv_location(_, up: tg.Update, chat_data: dict):
@@ -233,12 +345,13 @@ def recv_location(_, up: tg.Update, chat_data: dict):
     progress_msg: tg.Message = up.effective_message.reply_text("Retrieving address...")
 
     try:
-        address, place_id, pin_code = util.reverse_geocode(coordinates)
+        with metrics.GEOCODE_LATENCY.time():
+            address, place_id, pin_code = util.reverse_geocode(coordinates)
     except (IndexError, KeyError):
         progress_msg.edit_text("Invalid location!\nPlease enter a valid location.")
         return recv_location.__name__
-    except googlemaps.exceptions.Timeout as e:
-        traceback.print_exc()
+    except TimeoutError:
+        logger.warning("Timed out while reverse geocoding", exc_info=True)
         up.effective_message.reply_text(
             T(
                 "Sorry, but I couldn't fetch your location.\n"
@@ -247,9 +360,8 @@ def recv_location(_, up: tg.Update, chat_data: dict):
         )
         return recv_location.__name__
 
-    try:
-        pin_code = PinCode.objects.get(pin_code=pin_code)
-    except PinCode.DoesNotExist:
+    resolved = service_areas.resolve(pin_code)
+    if resolved is None:
         progress_msg.edit_text(
             T(
                 f"We don't have any technicians available at this pin code ({pin_code})!\n"
@@ -259,7 +371,7 @@ def recv_location(_, up: tg.Update, chat_data: dict):
         return ConversationHandler.END
 
     appointment.address = address
-    appointment.pin_code = pin_code
+    appointment.pin_code = resolved
     appointment.place_id = place_id
 
     progress_msg.edit_text(f"Please enter the reason for this service appointment.")
@@ -269,11 +381,8 @@ def recv_location(_, up: tg.Update, chat_data: dict):
 
 @util.login_required
 def recv_pincode(_, up: tg.Update, chat_data: dict):
-    pin_code = up.effective_message.text.strip()
-
-    try:
-        pin_code = PinCode.objects.get(pin_code=pin_code)
-    except PinCode.DoesNotExist:
+    pin_code = service_areas.resolve(up.effective_message.text)
+    if pin_code is None:
         up.effective_message.reply_text(
             T(
                 f"We don't have any technicians available at this Pin Code!\n"
@@ -305,6 +414,7 @@ def recv_reason(_, up: tg.Update, chat_data):
     return recv_time_slot.__name__
 
 
+@callbacks.acknowledge
 @util.login_required
 def recv_time_slot(_, up: tg.Update, chat_data: dict):
     query: tg.CallbackQuery = up.callback_query
@@ -328,27 +438,20 @@ def recv_time_slot(_, up: tg.Update, chat_data: dict):
                 reply_markup=util.get_time_slot_keyboard(appointment.pin_code),
             )
         except tg.error.BadRequest:
-            query.answer()
+            pass  # the message is unchanged
 
         return recv_time_slot.__name__
 
-    appointment.save()
+    # a redelivered callback must not book the same appointment twice
+    if appointment.pk is None:
+        appointment.save()
 
     reply_markup = tg.InlineKeyboardMarkup(
         [
             [
-                tg.InlineKeyboardButton(
-                    text=T("Cancel"),
-                    callback_data=f"{hyperlink.__name__}{cancel.__name__}:{appointment.pk}",
-                ),
-                tg.InlineKeyboardButton(
-                    text=T("Check details"),
-                    callback_data=f"{hyperlink.__name__}{check.__name__}:{appointment.pk}",
-                ),
-                tg.InlineKeyboardButton(
-                    text=T("Reschedule"),
-                    callback_data=f"{hyperlink.__name__}{schedule.__name__}:{appointment.pk}",
-                ),
+                appointment_button(T("Cancel"), tokens.CANCEL, appointment, up),
+                appointment_button(T("Check details"), tokens.CHECK, appointment, up),
+                appointment_button(T("Reschedule"), tokens.SCHEDULE, appointment, up),
             ]
         ]
     )
@@ -367,12 +470,17 @@ def recv_time_slot(_, up: tg.Update, chat_data: dict):
     return ConversationHandler.END
 
 
-dispatcher.add_handler(
+router.add_handler(
     ConversationHandler(
         entry_points=[CommandHandler("book", book)],
         states={
             recv_serial_number.__name__: [
-                MessageHandler(Filters.text, recv_serial_number, pass_chat_data=True)
+                MessageHandler(Filters.text, recv_serial_number, pass_chat_data=True),
+                CallbackQueryHandler(
+                    recv_serial_suggestion,
+                    pass_chat_data=True,
+                    pattern=SERIAL_SUGGESTION,
+                ),
             ],
             recv_location.__name__: [
                 MessageHandler(Filters.location, recv_location, pass_chat_data=True),
@@ -389,41 +497,36 @@ dispatcher.add_handler(
             ],
         },
         fallbacks=[ABORT, CommandHandler("book", book)],
+        name="book",
+        persistent=True,
     )
 )
 
 
+@util.verify_token(HYPERLINK)
+@callbacks.defer
 @util.login_required
-def hyperlink(bot: tg.Bot, up: tg.Update, chat_data: dict):
-    query: tg.CallbackQuery = up.callback_query
-    fn_name, appointment_pk = query.data[len(hyperlink.__name__) :].split(":")
-
+def hyperlink(bot: tg.Bot, up: tg.Update, chat_data: dict, token: tokens.Token):
     try:
-        fn = HYPERLINK_MAP[fn_name]
+        fn = HYPERLINK_MAP[token.action]
     except KeyError:
         up.effective_message.reply_text(T("Invalid Hyperlink!"))
     else:
         try:
-            chat_data["appointment"] = Appointment.objects.get(
-                pk=int(appointment_pk), is_cancelled=False
-            )
+            chat_data["appointment"] = get_owned_appointment(token)
         except Appointment.DoesNotExist:
             up.effective_message.reply_text(T("Invalid Appointment!"))
         else:
             fn(bot, up, chat_data)
-        finally:
-            query.answer()
 
 
-dispatcher.add_handler(
-    CallbackQueryHandler(hyperlink, pass_chat_data=True, pattern=hyperlink.__name__)
-)
+router.add_callback_handler(HYPERLINK, hyperlink, pass_chat_data=True)
 
 
 def show_list(_, up: tg.Update):
-    appointments = util.get_user(up).appointment_set.exclude(is_cancelled=True)
+    appointments = list(util.get_user(up).appointment_set.for_listing())
 
-    if not appointments.exists():
+    if not appointments:
         up.effective_message.reply_text(
             T(
                 "You haven't booked any appointments yet!\n"
@@ -439,17 +542,12 @@ def show_list(_, up: tg.Update):
         reply_markup = tg.InlineKeyboardMarkup(
             [
                 [
-                    tg.InlineKeyboardButton(
-                        text=T("Cancel"),
-                        callback_data=f"{hyperlink.__name__}{cancel.__name__}:{appointment.pk}",
+                    appointment_button(T("Cancel"), tokens.CANCEL, appointment, up),
+                    appointment_button(
+                        T("Check details"), tokens.CHECK, appointment, up
                     ),
-                    tg.InlineKeyboardButton(
-                        text=T("Check details"),
-                        callback_data=f"{hyperlink.__name__}{check.__name__}:{appointment.pk}",
-                    ),
-                    tg.InlineKeyboardButton(
-                        text=T("Reschedule"),
-                        callback_data=f"{hyperlink.__name__}{schedule.__name__}:{appointment.pk}",
+                    appointment_button(
+                        T("Reschedule"), tokens.SCHEDULE, appointment, up
                     ),
                 ]
             ]
@@ -462,10 +560,15 @@ def show_list(_, up: tg.Update):
         )
 
 
-dispatcher.add_handler(CommandHandler("list", show_list))
+router.add_handler(CommandHandler("list", show_list))
+
 
+def create_appointment_modification_command(fn: Callable, archived: Callable = None):
+    """
+    Asks for a tracking number, and calls ``fn`` with the matching appointment in ``chat_data``.
+    If there's no such appointment, but there's an archived one, calls ``archived`` with it instead, if given.
+    """
 
-def create_appointment_modification_command(fn: Callable):
     @wraps(fn)
     @util.login_required
     def wrapper(bot: tg.Bot, up: tg.Update, *args, **kwargs):
@@ -479,15 +582,23 @@ def create_appointment_modification_command(fn: Callable):
 
         if not tracking_number:
             up.effective_message.reply_text(
-                T("Please enter a tracking number:\n\n(Case insensitive)")
+                T("Please enter a tracking number:")
             )
             return fn.__name__
 
         try:
-            chat_data["appointment"] = Appointment.objects.get(
-                tracking_number__iexact=tracking_number, is_cancelled=False
+            # tracking numbers are digits, so an exact match can use the unique index
+            chat_data["appointment"] = Appointment.objects.active().get(
+                tracking_number=tracking_number
             )
         except Appointment.DoesNotExist:
+            if archived is not None:
+                appointment = ArchivedAppointment.objects.filter(
+                    tracking_number=tracking_number
+                ).first()
+                if appointment is not None:
+                    return archived(bot, up, appointment)
+
             up.effective_message.reply_text(
                 T(
                     f"You entered an invalid tracking number.\n\n"
@@ -511,33 +622,56 @@ def schedule(_, up: tg.Update, chat_data: dict):
 
     up.effective_message.reply_text(
         T(f"Please choose the new time slot for this booking."),
-        reply_markup=util.get_time_slot_keyboard(
-            appointment.pin_code, callback_pattern=recv_new_time_slot.__name__
-        ),
+        reply_markup=get_new_time_slot_keyboard(appointment, up),
     )
 
     return ConversationHandler.END
 
 
+def get_new_time_slot_keyboard(
+    appointment: Appointment, up: tg.Update
+) -> tg.InlineKeyboardMarkup:
+    def get_callback_data(weekday_id, time_slot):
+        token = tokens.Token(
+            tokens.NEW_TIME_SLOT,
+            appointment.pk,
+            up.effective_user.id,
+            int(weekday_id),
+            time_slot.pk,
+        )
+        return NEW_TIME_SLOT + tokens.dumps(token)
+
+    return util.get_time_slot_keyboard(appointment.pin_code, get_callback_data)
+
+
 schedule_handler1, schedule_handler2 = create_appointment_modification_command(schedule)
-dispatcher.add_handler(
+router.add_handler(
     ConversationHandler(
         entry_points=[schedule_handler1],
         states={schedule.__name__: [schedule_handler2]},
         fallbacks=[ABORT, schedule_handler1],
+        name="schedule",
+        persistent=True,
     )
 )
 
 
+@util.verify_token(NEW_TIME_SLOT)
+@callbacks.defer
 @util.login_required
-def recv_new_time_slot(_, up: tg.Update, chat_data: dict):
-    query: tg.CallbackQuery = up.callback_query
-
-    weekday_id, time_slot_pk = query.data[len(recv_new_time_slot.__name__) :].split(":")
+def recv_new_time_slot(_, up: tg.Update, token: tokens.Token):
+    try:
+        appointment = get_owned_appointment(token)
+    except Appointment.DoesNotExist:
+        up.effective_message.edit_text(T("Invalid Appointment!"))
+        return
 
-    appointment = chat_data["appointment"]
-    appointment.weekday = weekday_id
-    appointment.time_slot = TimeSlot.objects.get(pk=time_slot_pk)
+    unchanged = (
+        appointment.weekday == str(token.weekday)
+        and appointment.time_slot_id == token.time_slot_id
+    )
+    appointment.weekday = str(token.weekday)
+    appointment.time_slot = TimeSlot.objects.get(pk=token.time_slot_id)
 
     try:
         appointment.validate_time_slot()
@@ -549,14 +683,13 @@ def recv_new_time_slot(_, up: tg.Update, chat_data: dict):
                     "You entered an invalid Time slot.\n"
                     "Please choose a valid time slot."
                 ),
-                reply_markup=util.get_time_slot_keyboard(
-                    appointment.pin_code, callback_pattern=recv_new_time_slot.__name__
-                ),
+                reply_markup=get_new_time_slot_keyboard(appointment, up),
             )
         except tg.error.BadRequest:
-            query.answer()
+            pass  # the message is unchanged
     else:
-        appointment.save()
+        if not unchanged:
+            appointment.save(update_fields=["weekday", "time_slot"])
         up.effective_message.edit_text(
             text=T(
                 f"Appointment rescheduled for {util.get_pretty_time_slot(appointment.weekday, appointment.time_slot)}."
@@ -564,11 +697,7 @@ def recv_new_time_slot(_, up: tg.Update, chat_data: dict):
         )
 
 
-dispatcher.add_handler(
-    CallbackQueryHandler(
-        recv_new_time_slot, pass_chat_data=True, pattern=recv_new_time_slot.__name__
-    )
-)
+router.add_callback_handler(NEW_TIME_SLOT, recv_new_time_slot)
 
 
 def check(_: tg.Bot, up: tg.Update, chat_data: dict):
@@ -577,14 +706,8 @@ def check(_: tg.Bot, up: tg.Update, chat_data: dict):
     reply_markup = tg.InlineKeyboardMarkup(
         [
             [
-                tg.InlineKeyboardButton(
-                    text="Cancel",
-                    callback_data=f"{hyperlink.__name__}{cancel.__name__}:{appointment.pk}",
-                ),
-                tg.InlineKeyboardButton(
-                    text=T("Reschedule"),
-                    callback_data=f"{hyperlink.__name__}{schedule.__name__}:{appointment.pk}",
-                ),
+                appointment_button(T("Cancel"), tokens.CANCEL, appointment, up),
+                appointment_button(T("Reschedule"), tokens.SCHEDULE, appointment, up),
             ]
         ]
     )
@@ -597,26 +720,52 @@ def check(_: tg.Bot, up: tg.Update, chat_data: dict):
     return ConversationHandler.END
 
 
-check_handler1, check_handler2 = create_appointment_modification_command(check)
-dispatcher.add_handler(
+def check_archived(_: tg.Bot, up: tg.Update, appointment: ArchivedAppointment):
+    up.effective_message.reply_text(
+        text=appointment.full_detail_markup, parse_mode="Markdown"
+    )
+
+    return ConversationHandler.END
+
+
+check_handler1, check_handler2 = create_appointment_modification_command(
+    check, archived=check_archived
+)
+router.add_handler(
     ConversationHandler(
         entry_points=[check_handler1],
         states={check.__name__: [check_handler2]},
         fallbacks=[ABORT, check_handler1],
+        name="check",
+        persistent=True,
     )
 )
 
 
 @util.login_required
-def cancel(_, up: tg.Update, __):
+def cancel(_, up: tg.Update, chat_data: dict):
+    appointment = chat_data["appointment"]
+
     keyboard = tg.InlineKeyboardMarkup(
         [
             [
                 tg.InlineKeyboardButton(
-                    T("Yes"), callback_data=f"{cancel_confirm.__name__}1"
+                    T("Yes"),
+                    callback_data=CANCEL_CONFIRM
+                    + tokens.dumps(
+                        tokens.Token(
+                            tokens.CANCEL_CONFIRM, appointment.pk, up.effective_user.id
+                        )
+                    ),
                 ),
                 tg.InlineKeyboardButton(
-                    T("No"), callback_data=f"{cancel_confirm.__name__}0"
+                    T("No"),
+                    callback_data=CANCEL_CONFIRM
+                    + tokens.dumps(
+                        tokens.Token(
+                            tokens.CANCEL_ABORT, appointment.pk, up.effective_user.id
+                        )
+                    ),
                 ),
             ]
         ]
@@ -630,40 +779,43 @@ def cancel(_, up: tg.Update, __):
 
 
 cancel_handler1, cancel_handler2 = create_appointment_modification_command(cancel)
-dispatcher.add_handler(
+router.add_handler(
     ConversationHandler(
         entry_points=[cancel_handler1],
         states={cancel.__name__: [cancel_handler2]},
         fallbacks=[ABORT, cancel_handler1],
+        name="cancel",
+        persistent=True,
     )
 )
 
 
+@util.verify_token(CANCEL_CONFIRM)
+@callbacks.defer
 @util.login_required
-def cancel_confirm(_, up: tg.Update, chat_data: dict):
-    query: tg.CallbackQuery = up.callback_query
+def cancel_confirm(_, up: tg.Update, token: tokens.Token):
+    if token.action != tokens.CANCEL_CONFIRM:
+        up.effective_message.edit_text(text=T("Appointment cancellation Aborted!"))
+        return
 
-    confirmation = query.data[len(cancel_confirm.__name__) :]
+    appointments = Appointment.objects.owned_by(str(token.owner_id)).filter(
+        pk=token.appointment_id
+    )
+    if not appointments.exists():
+        up.effective_message.edit_text(T("Invalid Appointment!"))
+        return
 
-    if bool(int(confirmation)):
-        appointment = chat_data["appointment"]
-        appointment.is_cancelled = True
-        appointment.save()
-        up.effective_message.edit_text(text=T("Okay, appointment cancelled."))
-    else:
-        up.effective_message.edit_text(text=T("Appointment cancellation Aborted!"))
+    # cancelling twice is a no-op, so that redelivered callbacks are harmless
+    stats.update(appointments.active(), is_cancelled=True)
+    up.effective_message.edit_text(text=T("Okay, appointment cancelled."))
 
 
-dispatcher.add_handler(
-    CallbackQueryHandler(
-        cancel_confirm, pass_chat_data=True, pattern=cancel_confirm.__name__
-    )
-)
+router.add_callback_handler(CANCEL_CONFIRM, cancel_confirm)
 
 HYPERLINK_MAP = {
-    check.__name__: check,
-    cancel.__name__: cancel,
-    schedule.__name__: schedule,
+    tokens.CHECK: check,
+    tokens.CANCEL: cancel,
+    tokens.SCHEDULE: schedule,
 }
 
 
@@ -671,7 +823,7 @@ def nothing_to_abort(_, up: tg.Update):
     up.effective_message.reply_text("Nothing to abort.")
 
 
-dispatcher.add_handler(CommandHandler("abort", nothing_to_abort))
+router.add_handler(CommandHandler("abort", nothing_to_abort))
 
 
 def unknown(_, up: tg.Update):
@@ -680,10 +832,119 @@ def unknown(_, up: tg.Update):
     )
 
 
-dispatcher.add_handler(MessageHandler(Filters.command, unknown))
-dispatcher.add_handler(MessageHandler(Filters.text, unknown))
+router.add_handler(MessageHandler(Filters.command, unknown))
+router.add_handler(MessageHandler(Filters.text, unknown))
+
+profiler.instrument_handlers(router.handlers)
+metrics.instrument_handlers(router.handlers)
+logs.bind_handlers(router.handlers)
+
+
+@util.ensure_db_cleanup
+def reconcile_stats(_, job):
+    since = timezone.localdate() - timedelta(days=settings.STATS_RECONCILE_DAYS)
+    stats.reconcile(since)
+
+
+@util.ensure_db_cleanup
+def archive_appointments(_, job):
+    # a few batches at a time, so that the other jobs don't wait for long
+    archive.archive(max_batches=settings.ARCHIVE_BATCHES_PER_RUN)
+
+
+def create_updater() -> Updater:
+    """
+    Builds the bot, its dispatcher, and the updater feeding it.
+    Deferred until the bot starts, so that importing this module stays cheap.
+    """
+
+    # conversation states and chat data are only written to disk on shutdown, see `stop_bot()`
+    persistence = PicklePersistence(
+        settings.BOT_STATE_FILE,
+        store_user_data=False,
+        store_bot_data=False,
+        on_flush=True,
+    )
+    router.set_persistence(persistence)
+
+    bot = tg.Bot(settings.TELEGRAM_API_TOKEN, request=Request(con_pool_size=8))
+    metrics.instrument_bot(bot)
+
+    job_queue = JobQueue()
+    dispatcher = dedup.DedupDispatcher(
+        bot, update_queue, job_queue=job_queue, persistence=persistence
+    )
+    job_queue.set_dispatcher(dispatcher)
+    job_queue.run_repeating(
+        notifications.send_pending, settings.NOTIFICATION_INTERVAL, first=0
+    )
+    job_queue.run_repeating(reconcile_stats, settings.STATS_RECONCILE_INTERVAL)
+    job_queue.run_repeating(archive_appointments, settings.ARCHIVE_INTERVAL)
+
+    dispatcher.add_handler(throttle.handler, group=-1)
+    dispatcher.add_handler(router)
+    dispatcher.add_error_handler(logs.log_error)
+
+    return Updater(dispatcher=dispatcher, workers=None)
 
 
 def start_bot():
+    listener = logs.configure()
+    updater = create_updater()
+
+    appliance_lookup.get_filter()
+    metrics.watch_queue(update_queue)
+    health.start_server(updater)
+    profiler.install_signal_handler()
+
+    updater.last_update_id = dedup.deduplicator.get_offset()
     updater.start_polling()
-    # updater.idle()
+
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopping.set())
+    while not stopping.wait(1):
+        pass
+
+    drained = stop_bot(updater)
+    # write out the records still queued
+    listener.stop()
+    if not drained:
+        # don't wait for the stuck handlers
+        logging.shutdown()
+        os._exit(1)
+
+
+def stop_bot(updater: Updater) -> bool:
+    """
+    Stops fetching updates, and waits up to ``DRAIN_TIMEOUT`` seconds
+    for the updates already fetched to be handled.
+
+    If they all were, saves the conversation state,
+    and checkpoints the last update, so that the next process resumes polling right after it.
+    Otherwise, the handlers still running might be changing the state,
+    so the next process starts from the state saved on the last clean shutdown,
+    and the checkpoint saved while running (which only covers completed updates, see `telebot.dedup`).
+
+    Returns whether everything was handled in time.
+    """
+
+    logger.info("Draining %d queued updates", update_queue.qsize())
+
+    stopper = threading.Thread(target=updater.stop, daemon=True)
+    stopper.start()
+    stopper.join(settings.DRAIN_TIMEOUT)
+
+    if stopper.is_alive():
+        logger.warning(
+            "Gave up draining after %ss, with %d updates still queued, not saving the state",
+            settings.DRAIN_TIMEOUT,
+            update_queue.qsize(),
+        )
+        return False
+
+    updater.dispatcher.update_persistence()
+    updater.dispatcher.persistence.flush()
+    dedup.deduplicator.save()
+
+    return True
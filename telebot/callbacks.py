@@ -0,0 +1,61 @@
+import contextvars
+import logging
+from functools import wraps
+from typing import Callable
+
+import telegram as tg
+
+from telebot import dedup, metrics
+
+logger = logging.getLogger(__name__)
+
+
+def answer(up: tg.Update, text: str = None):
+    with metrics.CALLBACK_ACK_LATENCY.time():
+        try:
+            up.callback_query.answer(text)
+        except tg.error.BadRequest:
+            # the query is too old, or was already answered.
+            logger.warning("Could not answer callback query", exc_info=True)
+
+
+def acknowledge(fn: Callable):
+    """Answers the callback query right away, so the button stops spinning, then calls ``fn``."""
+
+    @wraps(fn)
+    def wrapper(bot, up: tg.Update, *args, **kwargs):
+        answer(up)
+        return fn(bot, up, *args, **kwargs)
+
+    return wrapper
+
+
+def defer(fn: Callable):
+    """
+    Answers the callback query right away, then runs ``fn`` in the dispatcher's worker pool,
+    so the dispatcher can move on to the next update.
+
+    The return value of ``fn`` is discarded, so this can't be used for conversation states.
+    The update stays in flight until ``fn`` returns, so that it isn't checkpointed before then (see `telebot.dedup`).
+    """
+
+    instrumented = metrics.instrument_callback(fn, "deferred")
+
+    def run(bot, up: tg.Update, *args, **kwargs):
+        try:
+            instrumented(bot, up, *args, **kwargs)
+        except Exception:
+            logger.exception("Error in deferred callback")
+        finally:
+            dedup.deduplicator.release(up.update_id)
+
+    @wraps(fn)
+    def wrapper(bot, up: tg.Update, *args, **kwargs):
+        answer(up)
+        dedup.deduplicator.retain(up.update_id)
+        # carry the logging context over to the worker thread
+        context = contextvars.copy_context()
+        dispatcher = dedup.DedupDispatcher.get_instance()
+        dispatcher.run_async(context.run, run, bot, up, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,153 @@
+"""
+Drops redelivered updates, before any handler sees them.
+
+Telegram may deliver the same ``update_id`` more than once,
+e.g. when a webhook times out or the bot restarts in the middle of a poll.
+
+The ids of the last ``DEDUP_WINDOW`` updates are remembered in memory.
+The highest id up to which every update has been handled completely
+(including any work deferred to the worker threads, see ``Deduplicator.retain()``)
+is also checkpointed to the database every ``DEDUP_CHECKPOINT_EVERY`` updates,
+so that a new process can skip whatever its predecessor had already handled,
+and resume polling right after it (see ``Deduplicator.get_offset()``).
+
+Updates handled after one still in flight are handled again by the next process, if telegram redelivers them,
+which the handlers are written to tolerate.
+"""
+
+import threading
+from collections import Counter, deque
+
+import telegram as tg
+from telegram.ext import Dispatcher
+
+from gea_bot import settings
+from telebot import metrics, util
+from telebot.health import health
+from telebot.models import Checkpoint
+
+
+class Deduplicator:
+    def __init__(self, name: str, window: int, checkpoint_every: int):
+        self.name = name
+        self.checkpoint_every = checkpoint_every
+        self.recent = deque(maxlen=window)
+        self.seen = set()
+        self.lock = threading.Lock()
+
+        # updates up to the floor were handled by a previous process
+        self.floor = None
+        self.high_water_mark = None
+        # update id -> pieces of work on it that haven't finished yet
+        self.in_flight = Counter()
+        self.checkpointed = None
+        self.pending = 0
+
+    @util.ensure_db_cleanup
+    def load(self):
+        checkpoint, _ = Checkpoint.objects.get_or_create(name=self.name)
+        self.floor = self.high_water_mark = self.checkpointed = checkpoint.update_id
+
+    def get_completed(self) -> int:
+        """The highest update id, up to which every update has been handled completely."""
+
+        with self.lock:
+            if self.in_flight:
+                return min(self.in_flight) - 1
+            return self.high_water_mark
+
+    @util.ensure_db_cleanup
+    def save(self):
+        """Persists the completed update id, if it moved since the last checkpoint."""
+
+        update_id = self.get_completed()
+        with self.lock:
+            if update_id is None or update_id == self.checkpointed:
+                return
+            self.checkpointed = update_id
+            self.pending = 0
+
+        Checkpoint.objects.filter(name=self.name, update_id__lt=update_id).update(
+            update_id=update_id
+        )
+
+    def get_offset(self) -> int:
+        """The ``getUpdates`` offset that resumes polling right after the checkpoint."""
+
+        with self.lock:
+            if self.floor is None:
+                self.load()
+            return self.floor + 1
+
+    def remember(self, update_id: int):
+        if len(self.recent) == self.recent.maxlen:
+            self.seen.discard(self.recent[0])
+        self.recent.append(update_id)
+        self.seen.add(update_id)
+
+    def is_duplicate(self, update_id: int) -> bool:
+        """Whether the update was seen already. If not, it's in flight until `release()` is called for it."""
+
+        with self.lock:
+            if self.floor is None:
+                self.load()
+
+            if update_id in self.seen or update_id <= self.floor:
+                return True
+
+            self.remember(update_id)
+            self.high_water_mark = max(self.high_water_mark, update_id)
+            self.in_flight[update_id] += 1
+            self.pending += 1
+            flush = self.pending >= self.checkpoint_every
+
+        if flush:
+            self.save()
+
+        return False
+
+    def retain(self, update_id: int):
+        """Keeps an update in flight until another `release()`, e.g. for work deferred to a worker thread."""
+
+        with self.lock:
+            self.in_flight[update_id] += 1
+
+    def release(self, update_id: int):
+        with self.lock:
+            self.in_flight[update_id] -= 1
+            if self.in_flight[update_id] <= 0:
+                del self.in_flight[update_id]
+
+
+deduplicator = Deduplicator(
+    "updates", settings.DEDUP_WINDOW, settings.DEDUP_CHECKPOINT_EVERY
+)
+
+
+class DedupDispatcher(Dispatcher):
+    """
+    A dispatcher that drops redelivered updates, and keeps the others in flight while it handles them.
+
+    Its own thread and its workers are marked busy while they run handlers, see ``Health.worker()``.
+    """
+
+    def process_update(self, update):
+        if not isinstance(update, tg.Update):
+            return super().process_update(update)
+
+        if deduplicator.is_duplicate(update.update_id):
+            metrics.DUPLICATE_UPDATES.inc()
+            return
+
+        try:
+            with health.worker():
+                super().process_update(update)
+        finally:
+            deduplicator.release(update.update_id)
+
+    def run_async(self, func, *args, **kwargs):
+        def run(*args, **kwargs):
+            with health.worker():
+                return func(*args, **kwargs)
+
+        return super().run_async(run, *args, **kwargs)
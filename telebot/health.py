@@ -0,0 +1,224 @@
+"""
+Health of the bot's update pipeline, served along with the metrics on the sidecar port.
+
+- ``/healthz`` fails once polling has stalled for longer than ``HEALTH_POLL_TIMEOUT`` seconds.
+- ``/readyz`` also fails when the database is unreachable,
+  or the dispatcher has fallen far enough behind to shed updates (see `telebot.ingress`).
+
+Both respond with a JSON report of the pipeline's state, or just whether it's ok,
+unless the request carries ``METRICS_TOKEN`` as a bearer token, which ``/metrics`` requires too.
+The server only listens on ``METRICS_HOST``, localhost by default.
+"""
+
+import hmac
+import json
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.db import DatabaseError, connection
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from gea_bot import settings
+
+
+class CircuitOpen(TimeoutError):
+    """Raised instead of calling a dependency whose circuit is open, so callers can treat it like a timeout."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a flaky dependency after ``max_failures`` consecutive failures,
+    then lets a single trial call through every ``reset_timeout`` seconds, until one succeeds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, max_failures: int, reset_timeout: float):
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    @contextmanager
+    def guard(self, *errors):
+        """Counts any of ``errors`` raised inside the block as a failure."""
+
+        with self.lock:
+            state = self.state
+            if state == self.OPEN:
+                raise CircuitOpen()
+            if state == self.HALF_OPEN:
+                # keep the circuit open for everyone else during the trial call
+                self.opened_at = time.monotonic()
+
+        try:
+            yield
+        except errors:
+            with self.lock:
+                self.failures += 1
+                if self.failures >= self.max_failures:
+                    self.opened_at = time.monotonic()
+            raise
+        else:
+            with self.lock:
+                self.failures = 0
+                self.opened_at = None
+
+
+maps_circuit = CircuitBreaker(
+    settings.MAPS_CIRCUIT_FAILURES, settings.MAPS_CIRCUIT_RESET_TIMEOUT
+)
+
+
+def check_db() -> dict:
+    start = time.perf_counter()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except DatabaseError as e:
+        return {"ok": False, "error": str(e)}
+    finally:
+        connection.close()
+
+    return {"ok": True, "latency": time.perf_counter() - start}
+
+
+class Health:
+    def __init__(self):
+        self.updater = None
+        self.last_poll = None
+        self.busy_workers = 0
+        self.lock = threading.Lock()
+
+    def watch(self, updater):
+        """Records the time of every successful ``getUpdates`` call made by ``updater``."""
+
+        self.updater = updater
+        self.last_poll = time.time()
+
+        bot = updater.bot
+        get_updates = bot.get_updates
+
+        @wraps(get_updates)
+        def wrapper(*args, **kwargs):
+            updates = get_updates(*args, **kwargs)
+            self.last_poll = time.time()
+            return updates
+
+        bot.get_updates = wrapper
+
+    @contextmanager
+    def worker(self):
+        """Marks the dispatcher's thread, or one of its workers, as busy inside the block."""
+
+        with self.lock:
+            self.busy_workers += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.busy_workers -= 1
+
+    def report(self) -> dict:
+        dispatcher = self.updater.dispatcher
+        update_queue = dispatcher.update_queue
+
+        return {
+            "polling": self.updater.running,
+            "last_poll_age": time.time() - self.last_poll,
+            "queue": {
+                "depth": update_queue.qsize(),
+                "oldest_age": update_queue.oldest_age(),
+            },
+            "workers": {
+                "busy": self.busy_workers,
+                # including the dispatcher's own thread
+                "total": dispatcher.workers + 1,
+                "utilisation": self.busy_workers / (dispatcher.workers + 1),
+            },
+            "database": check_db(),
+            "maps": maps_circuit.state,
+        }
+
+    @staticmethod
+    def is_live(report: dict) -> bool:
+        return (
+            report["polling"] and report["last_poll_age"] < settings.HEALTH_POLL_TIMEOUT
+        )
+
+    @classmethod
+    def is_ready(cls, report: dict) -> bool:
+        return (
+            cls.is_live(report)
+            and report["database"]["ok"]
+            and report["queue"]["depth"] < settings.SHED_QUEUE_DEPTH
+            and report["queue"]["oldest_age"] < settings.SHED_QUEUE_AGE
+        )
+
+
+health = Health()
+
+
+def is_authorized(authorization: str) -> bool:
+    """Whether an ``Authorization`` header carries ``METRICS_TOKEN``. Never, if it isn't set."""
+
+    expected = f"Bearer {settings.METRICS_TOKEN}"
+    return bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        authorization.encode(), expected.encode()
+    )
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        authorized = is_authorized(self.headers.get("Authorization", ""))
+
+        if self.path == "/metrics" and authorized:
+            self.respond(200, generate_latest(), CONTENT_TYPE_LATEST)
+        elif self.path in ("/healthz", "/readyz"):
+            report = health.report()
+            if self.path == "/healthz":
+                ok = health.is_live(report)
+            else:
+                ok = health.is_ready(report)
+            body = report if authorized else {"ok": ok}
+            self.respond(
+                200 if ok else 503, json.dumps(body).encode(), "application/json"
+            )
+        else:
+            self.respond(404, b"", "text/plain")
+
+    def respond(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # probes would flood the logs
+
+
+def start_server(updater):
+    """Serves the metrics and health of the bot process on a sidecar port."""
+
+    health.watch(updater)
+
+    server = ThreadingHTTPServer(
+        (settings.METRICS_HOST, settings.METRICS_PORT), RequestHandler
+    )
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
@@ -0,0 +1,112 @@
+"""
+Admission control for incoming updates.
+
+Updates are fetched into a bounded queue. Once the queue is full, fetching blocks,
+pushing the backlog back onto telegram's servers.
+
+Before that, once the queue is deeper than ``SHED_QUEUE_DEPTH``,
+or its oldest update has waited for longer than ``SHED_QUEUE_AGE`` seconds,
+new updates that don't belong to an ongoing interaction are shed:
+messages get a cheap "busy" reply, anything else is dropped.
+
+Busy replies are sent from a thread of their own, so that a slow Bot API never holds up fetching.
+At most ``SHED_BUSY_REPLIES`` of them wait to be sent, the messages shed beyond that go unanswered.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import telegram as tg
+from django.utils.translation import gettext as T
+
+from telebot import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class IngressQueue(queue.Queue):
+    def __init__(
+        self,
+        maxsize: int,
+        shed_depth: int,
+        shed_age: float,
+        is_critical: Callable[[tg.Update], bool],
+        busy_replies: int,
+    ):
+        super().__init__(maxsize)
+        self.shed_depth = shed_depth
+        self.shed_age = shed_age
+        self.is_critical = is_critical
+
+        self.busy_replies = queue.Queue(busy_replies)
+        self.replier = None
+        self.replier_lock = threading.Lock()
+
+    # items are stored along with the time they were enqueued at.
+
+    def _init(self, maxsize):
+        self.queue = deque()
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item))
+
+    def _get(self):
+        return self.queue.popleft()[1]
+
+    def oldest_age(self) -> float:
+        with self.mutex:
+            if not self.queue:
+                return 0.0
+            return time.monotonic() - self.queue[0][0]
+
+    def is_overloaded(self) -> bool:
+        return self.qsize() >= self.shed_depth or self.oldest_age() >= self.shed_age
+
+    def put(self, item, block=True, timeout=None):
+        if (
+            isinstance(item, tg.Update)
+            and self.is_overloaded()
+            and not self.is_critical(item)
+        ):
+            self.shed(item)
+        else:
+            super().put(item, block, timeout)
+
+    def shed(self, up: tg.Update):
+        if up.message is not None:
+            try:
+                self.busy_replies.put_nowait(up.message)
+            except queue.Full:
+                pass
+            else:
+                metrics.SHED_UPDATES.labels("busy").inc()
+                self.start_replier()
+                return
+
+        metrics.SHED_UPDATES.labels("dropped").inc()
+
+    def start_replier(self):
+        if self.replier is not None:
+            return
+        with self.replier_lock:
+            if self.replier is None:
+                self.replier = threading.Thread(
+                    target=self.send_busy_replies, name="busy-replies", daemon=True
+                )
+                self.replier.start()
+
+    def send_busy_replies(self):
+        while True:
+            message = self.busy_replies.get()
+            try:
+                message.reply_text(
+                    T("I'm a little busy right now, please try again later.")
+                )
+            except tg.TelegramError:
+                logger.warning("Could not send busy reply", exc_info=True)
+            finally:
+                self.busy_replies.task_done()
@@ -0,0 +1,157 @@
+import contextvars
+import json
+import logging
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable
+
+import telegram as tg
+
+import telebot.util as util
+from gea_bot import settings
+
+update_id = contextvars.ContextVar("update_id", default=None)
+chat_id = contextvars.ContextVar("chat_id", default=None)
+user_id = contextvars.ContextVar("user_id", default=None)
+handler_name = contextvars.ContextVar("handler_name", default=None)
+
+CONTEXT_VARS = (update_id, chat_id, user_id, handler_name)
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def update_context(up: tg.Update, handler: str = None):
+    """Tags every record logged inside this block with the details of ``up``."""
+
+    tokens = [
+        update_id.set(up.update_id),
+        chat_id.set(up.effective_chat.id if up.effective_chat else None),
+        user_id.set(up.effective_user.id if up.effective_user else None),
+        handler_name.set(handler),
+    ]
+    try:
+        yield
+    finally:
+        for var, token in zip(CONTEXT_VARS, tokens):
+            var.reset(token)
+
+
+def bind_context(fn: Callable, state=None):
+    @wraps(fn)
+    def wrapper(bot, up, *args, **kwargs):
+        with update_context(up, fn.__name__):
+            return fn(bot, up, *args, **kwargs)
+
+    return wrapper
+
+
+def bind_handlers(handlers):
+    util.wrap_callbacks(handlers, bind_context)
+
+
+class ContextFilter(logging.Filter):
+    """Copies the per-update context onto the record, in the thread that logged it."""
+
+    def filter(self, record):
+        for var in CONTEXT_VARS:
+            setattr(record, var.name, var.get())
+        return True
+
+
+class LoadSamplingFilter(logging.Filter):
+    """Keeps only a ``rate`` fraction of INFO (and lower) records while the queue is backed up."""
+
+    def __init__(self, log_queue: queue.Queue, threshold: int, rate: float):
+        super().__init__()
+        self.log_queue = log_queue
+        self.threshold = threshold
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or self.log_queue.qsize() < self.threshold:
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """A QueueHandler that never blocks the caller, dropping records when the queue is full."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Unlike the default, keep the exception separate from the message,
+        # so that the formatter can emit it as its own field.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for var in CONTEXT_VARS:
+            value = getattr(record, var.name, None)
+            if value is not None:
+                entry[var.name] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+
+        return json.dumps(entry, default=str)
+
+
+def configure() -> QueueListener:
+    """
+    Routes all logging through a bounded queue to a background thread,
+    which writes the records to stderr as JSON lines.
+    """
+
+    log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(
+        LoadSamplingFilter(
+            log_queue, settings.LOG_SAMPLE_THRESHOLD, settings.LOG_SAMPLE_RATE
+        )
+    )
+    queue_handler.addFilter(ContextFilter())
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(settings.LOG_LEVEL)
+
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+
+    return listener
+
+
+def log_error(_, up: tg.Update, error: Exception):
+    """Dispatcher error handler, logging the exception along with the update that caused it."""
+
+    if isinstance(up, tg.Update):
+        with update_context(up):
+            logger.error("Error while handling update", exc_info=error)
+    else:
+        logger.error("Error while polling for updates", exc_info=error)
@@ -0,0 +1,153 @@
+"""
+Checks that the bot's per-user queries stay on indexes as the tables grow.
+
+Creates a throwaway test database (the same way ``manage.py test`` does, so it needs the CREATEDB privilege on postgres),
+fills it with synthetic users and appointments, and runs ``EXPLAIN`` on each query the bot makes.
+Fails if any of them scans one of the large tables sequentially.
+"""
+
+import random
+import re
+from typing import Dict, List
+
+import djclick as click
+from django.db import connection
+from django.db.models import QuerySet
+
+from appliances.models import Appliance, ProductLine
+from appointments.models import Appointment, ArchivedAppointment
+from pin_codes.models import PinCode, TimeSlot
+from users.models import CustomUser
+
+BATCH_SIZE = 5000
+
+# vendor -> pattern matching a sequential scan in the output of EXPLAIN
+SEQ_SCAN = {
+    "postgresql": r"Seq Scan on (?P<table>\w+)",
+    "sqlite": r"\bSCAN (?:TABLE )?(?P<table>\w+)",
+}
+
+# the tables that grow with the number of users, which must never be scanned
+LARGE_TABLES = {
+    Appointment._meta.db_table,
+    ArchivedAppointment._meta.db_table,
+    CustomUser._meta.db_table,
+}
+
+
+def get_queries(user: CustomUser, appointment: Appointment) -> Dict[str, QuerySet]:
+    """The lookups in `telebot.bot` and `telebot.util`, for ``user`` and their ``appointment``."""
+
+    return {
+        "get_user": CustomUser.objects.filter(username=user.username),
+        "show_list": user.appointment_set.for_listing(),
+        "tracking number": Appointment.objects.active().filter(
+            tracking_number=appointment.tracking_number
+        ),
+        "archived tracking number": ArchivedAppointment.objects.filter(
+            tracking_number=appointment.tracking_number
+        ),
+        "get_owned_appointment": Appointment.objects.active()
+        .owned_by(user.username)
+        .filter(pk=appointment.pk),
+        "cancel_confirm": Appointment.objects.owned_by(user.username).filter(
+            pk=appointment.pk
+        ),
+    }
+
+
+def populate(num_users: int, num_appointments: int):
+    product_line = ProductLine.objects.create(name="Synthetic")
+    Appliance.objects.bulk_create(
+        Appliance(
+            serial_number=f"SYN{i}",
+            product_line=product_line,
+            model_number="SYN",
+            name="Synthetic",
+        )
+        for i in range(100)
+    )
+    time_slot = TimeSlot.objects.create(start="09:00", end="11:00")
+    PinCode.objects.bulk_create(PinCode(pin_code=str(i)) for i in range(100))
+
+    for start in range(0, num_users, BATCH_SIZE):
+        CustomUser.objects.bulk_create(
+            CustomUser(username=str(i), phone_number=f"+9190{i:08}")
+            for i in range(start, min(start + BATCH_SIZE, num_users))
+        )
+
+    # bulk_create doesn't set primary keys on every database
+    appliances = list(Appliance.objects.values_list("pk", flat=True))
+    pin_codes = list(PinCode.objects.values_list("pk", flat=True))
+    users = list(CustomUser.objects.values_list("pk", flat=True))
+
+    for start in range(0, num_appointments, BATCH_SIZE):
+        Appointment.objects.bulk_create(
+            Appointment(
+                appliance_id=random.choice(appliances),
+                user_id=random.choice(users),
+                address="Synthetic",
+                pin_code_id=random.choice(pin_codes),
+                weekday=PinCode.MON,
+                time_slot=time_slot,
+                reason="Synthetic",
+                tracking_number=f"{i:010}",
+                is_cancelled=random.random() < 0.3,
+            )
+            for i in range(start, min(start + BATCH_SIZE, num_appointments))
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def explain(queries: Dict[str, QuerySet], plans: bool = False) -> List[str]:
+    """Prints whether each of ``queries`` stays on indexes, returning the names of those that don't."""
+
+    pattern = SEQ_SCAN[connection.vendor]
+
+    failures = []
+    for name, queryset in queries.items():
+        plan = queryset.explain()
+        scanned = LARGE_TABLES.intersection(
+            match.group("table") for match in re.finditer(pattern, plan)
+        )
+        if scanned:
+            failures.append(name)
+            click.secho(f"{name}: scans {', '.join(sorted(scanned))}", fg="red")
+        else:
+            click.echo(f"{name}: ok")
+        if scanned or plans:
+            click.echo(plan + "\n")
+    return failures
+
+
+def check(num_users: int, num_appointments: int, plans: bool = False) -> List[str]:
+    """Fills the current database with synthetic data, and explains the bot's queries over it."""
+
+    populate(num_users, num_appointments)
+
+    appointment = Appointment.objects.select_related("user").order_by("?")[0]
+    return explain(get_queries(appointment.user, appointment), plans)
+
+
+@click.command()
+@click.option("--users", "num_users", default=20_000)
+@click.option("--appointments", "num_appointments", default=200_000)
+@click.option("--plans", is_flag=True, help="Print every query plan.")
+def command(num_users, num_appointments, plans):
+    if connection.vendor not in SEQ_SCAN:
+        raise click.ClickException(f"Unsupported database: {connection.vendor}")
+
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        failures = check(num_users, num_appointments, plans)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if failures:
+        raise click.ClickException(
+            f"{len(failures)} queries scan a large table: {', '.join(failures)}."
+        )
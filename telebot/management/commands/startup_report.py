@@ -0,0 +1,80 @@
+"""
+Breaks down the bot's startup time.
+
+Runs the startup path in a fresh interpreter, with ``python -X importtime``,
+and reports the time taken by each step, along with the slowest imports.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+import djclick as click
+
+STARTUP = """
+import json, time
+
+steps = []
+
+def step(name, fn):
+    start = time.perf_counter()
+    fn()
+    steps.append((name, time.perf_counter() - start))
+
+import django
+step("django.setup()", django.setup)
+step("import telebot.bot", lambda: __import__("telebot.bot"))
+
+from telebot import bot
+step("create_updater()", bot.create_updater)
+
+print(json.dumps(steps))
+"""
+
+
+def parse_importtime(stderr: str):
+    """Yields a (module, self, cumulative) tuple, in seconds, for every line of ``-X importtime`` output."""
+
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header
+        yield module.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6
+
+
+@click.command()
+@click.option("--limit", default=15, help="Number of modules and packages to list.")
+def command(limit):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if result.returncode != 0:
+        raise click.ClickException(result.stderr)
+
+    steps = json.loads(result.stdout.splitlines()[-1])
+    imports = list(parse_importtime(result.stderr))
+
+    packages = defaultdict(float)
+    for module, self_time, _ in imports:
+        packages[module.split(".")[0]] += self_time
+
+    click.echo("Startup steps:")
+    for name, elapsed in steps:
+        click.echo(f"  {elapsed * 1000:9.1f} ms  {name}")
+    click.echo(f"  {sum(e for _, e in steps) * 1000:9.1f} ms  total")
+
+    click.echo("\nSlowest packages (self time, summed over their modules):")
+    for package, elapsed in sorted(packages.items(), key=lambda i: -i[1])[:limit]:
+        click.echo(f"  {elapsed * 1000:9.1f} ms  {package}")
+
+    click.echo("\nSlowest imports (cumulative):")
+    for module, _, cumulative in sorted(imports, key=lambda i: -i[2])[:limit]:
+        click.echo(f"  {cumulative * 1000:9.1f} ms  {module}")
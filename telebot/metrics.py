@@ -0,0 +1,152 @@
+import time
+from contextlib import ExitStack
+from functools import wraps
+from typing import Callable
+
+import telegram as tg
+from django.db import connections
+from prometheus_client import Counter, Gauge, Histogram
+
+import telebot.util as util
+from gea_bot import settings
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_latency_seconds",
+    "Time spent inside a bot handler.",
+    ["handler", "state"],
+)
+UPDATE_DB_QUERIES = Histogram(
+    "bot_update_db_queries",
+    "Number of database queries executed while handling an update.",
+    ["handler"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, float("inf")),
+)
+UPDATE_DB_TIME = Histogram(
+    "bot_update_db_seconds",
+    "Time spent in the database while handling an update.",
+    ["handler"],
+)
+GEOCODE_LATENCY = Histogram(
+    "bot_geocode_latency_seconds", "Latency of Google Maps reverse geocode calls."
+)
+TELEGRAM_LATENCY = Histogram(
+    "bot_telegram_request_latency_seconds",
+    "Latency of outbound Telegram Bot API calls.",
+    ["method"],
+)
+TELEGRAM_RATE_LIMITED = Counter(
+    "bot_telegram_rate_limited_total",
+    "Number of outbound Telegram Bot API calls rejected with 429.",
+    ["method"],
+)
+CALLBACK_ACK_LATENCY = Histogram(
+    "bot_callback_ack_latency_seconds",
+    "Time taken to answer a callback query, before any deferred work runs.",
+)
+THROTTLED_UPDATES = Counter(
+    "bot_throttled_updates_total",
+    "Number of updates dropped by the per-user rate limit.",
+)
+DUPLICATE_UPDATES = Counter(
+    "bot_duplicate_updates_total", "Number of redelivered updates that were dropped."
+)
+QUEUE_DEPTH = Gauge(
+    "bot_dispatcher_queue_depth", "Number of updates waiting to be dispatched."
+)
+QUEUE_AGE = Gauge(
+    "bot_dispatcher_queue_age_seconds",
+    "Time the oldest update in the queue has been waiting for.",
+)
+SHED_UPDATES = Counter(
+    "bot_shed_updates_total",
+    "Number of updates shed because the dispatcher was saturated.",
+    ["action"],
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_latency_seconds",
+    "Time spent serving an HTTP request.",
+    ["view", "method"],
+)
+
+
+class QueryTimer:
+    """
+    A database execute wrapper that counts queries and the time spent in them,
+    on every database it's installed on (see `timing_queries()`).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def timing_queries(timer: QueryTimer) -> ExitStack:
+    """Installs ``timer`` on the connections to every database, the replicas included."""
+
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timer))
+    return stack
+
+
+def instrument_callback(fn: Callable, state=None):
+    latency = HANDLER_LATENCY.labels(fn.__name__, str(state or ""))
+    db_queries = UPDATE_DB_QUERIES.labels(fn.__name__)
+    db_time = UPDATE_DB_TIME.labels(fn.__name__)
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        try:
+            with timing_queries(timer):
+                return fn(*args, **kwargs)
+        finally:
+            latency.observe(time.perf_counter() - start)
+            db_queries.observe(timer.count)
+            db_time.observe(timer.duration)
+
+    return wrapper
+
+
+def instrument_handlers(handlers):
+    """Wraps the callback of every handler (including conversation states) with metrics."""
+
+    util.wrap_callbacks(handlers, instrument_callback)
+
+
+def instrument_bot(bot: tg.Bot):
+    """Times every outbound Bot API call and counts the ones rejected with 429."""
+
+    request = bot.request
+    request_wrapper = request._request_wrapper
+
+    @wraps(request_wrapper)
+    def wrapper(http_method, url, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            return request_wrapper(http_method, url, *args, **kwargs)
+        except tg.error.RetryAfter:
+            TELEGRAM_RATE_LIMITED.labels(api_method).inc()
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels(api_method).observe(time.perf_counter() - start)
+
+    request._request_wrapper = wrapper
+
+
+def watch_queue(update_queue):
+    """Exports the depth and age of the dispatcher's update queue."""
+
+    QUEUE_DEPTH.set_function(update_queue.qsize)
+    QUEUE_AGE.set_function(update_queue.oldest_age)
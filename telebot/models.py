@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class Checkpoint(models.Model):
+    """The highest telegram ``update_id`` that a bot process has seen, persisted across restarts."""
+
+    name = models.CharField(max_length=255, unique=True)
+    update_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.update_id}"
+
+    def __repr__(self):
+        return f"<Checkpoint {repr(self.name)} update_id: {self.update_id}>"
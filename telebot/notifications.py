@@ -0,0 +1,40 @@
+"""
+Sends the notifications queued up for customers (see `appointments.bulk`), from the bot's job queue.
+"""
+
+import logging
+
+import telegram as tg
+from django.utils import timezone
+
+from appointments.models import Notification
+from gea_bot import settings
+from telebot import util
+
+logger = logging.getLogger(__name__)
+
+
+@util.ensure_db_cleanup
+def send_pending(bot: tg.Bot, job):
+    notifications = (
+        Notification.objects.filter(sent_at=None)
+        .select_related("appointment__user")
+        .order_by("pk")[: settings.NOTIFICATION_BATCH_SIZE]
+    )
+
+    done = []
+    for notification in notifications:
+        username = notification.appointment.user.username
+        try:
+            if username.isdigit():
+                bot.send_message(
+                    int(username), notification.text, parse_mode="Markdown"
+                )
+        except tg.error.RetryAfter:
+            break  # try again on the next run
+        except tg.TelegramError:
+            # e.g. the user blocked the bot, retrying won't help
+            logger.warning("Could not send notification", exc_info=True)
+        done.append(notification.pk)
+
+    Notification.objects.filter(pk__in=done).update(sent_at=timezone.now())
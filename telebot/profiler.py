@@ -0,0 +1,139 @@
+import logging
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from typing import Callable
+
+import telebot.util as util
+from gea_bot import settings
+
+logger = logging.getLogger(__name__)
+
+
+def collapse_stack(frame) -> str:
+    """Formats a frame's call stack as a single ``;`` separated line, outermost call first."""
+
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        frame = frame.f_back
+
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of threads that are handling a randomly chosen subset of updates.
+
+    Profiling is off until :meth:`start` is called,
+    which profiles for ``window`` seconds and then dumps the aggregated stacks to ``out_dir``,
+    in the "folded" format understood by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, out_dir: str, rate: float, window: float, interval: float):
+        self.out_dir = out_dir
+        self.rate = rate
+        self.window = window
+        self.interval = interval
+
+        self.deadline = 0.0
+        self.targets = {}
+        self.stacks = Counter()
+        self.lock = threading.Lock()
+        # set by the signal handler, see `install_signal_handler()`
+        self.requested = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return time.monotonic() < self.deadline
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.deadline = time.monotonic() + self.window
+            self.stacks.clear()
+
+        logger.info(
+            "Profiling %d%% of updates for %ss", self.rate * 100, self.window
+        )
+        threading.Thread(target=self._sample, name="profiler", daemon=True).start()
+
+    def instrument_callback(self, fn: Callable, state=None):
+        label = f"{fn.__name__}[{state}]" if state else fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.running or random.random() >= self.rate:
+                return fn(*args, **kwargs)
+
+            thread_id = threading.get_ident()
+            self.targets[thread_id] = label
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.targets.pop(thread_id, None)
+
+        return wrapper
+
+    def instrument_handlers(self, handlers):
+        util.wrap_callbacks(handlers, self.instrument_callback)
+
+    def _sample(self):
+        while self.running:
+            frames = sys._current_frames()
+            for thread_id, label in list(self.targets.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[f"{label};{collapse_stack(frame)}"] += 1
+            time.sleep(self.interval)
+
+        self.dump()
+
+    def dump(self) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(
+            self.out_dir, time.strftime("profile-%Y%m%d-%H%M%S.folded")
+        )
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        logger.info("Wrote %d profile samples to %s", sum(self.stacks.values()), path)
+        return path
+
+    def install_signal_handler(self, signum=signal.SIGUSR2):
+        """
+        Starts a profiling window whenever the process receives ``signum``.
+
+        The signal handler runs in the main thread, between any two bytecodes,
+        e.g. while it holds a lock that logging needs, so it only sets an event.
+        A thread waits for it to call `start()`.
+        """
+
+        signal.signal(signum, lambda *_: self.requested.set())
+        threading.Thread(
+            target=self._wait_for_requests, name="profiler-signal", daemon=True
+        ).start()
+
+    def _wait_for_requests(self):
+        while True:
+            self.requested.wait()
+            self.requested.clear()
+            self.start()
+
+
+profiler = SamplingProfiler(
+    out_dir=settings.PROFILE_DIR,
+    rate=settings.PROFILE_SAMPLE_RATE,
+    window=settings.PROFILE_WINDOW,
+    interval=settings.PROFILE_INTERVAL,
+)
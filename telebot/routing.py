@@ -0,0 +1,182 @@
+import re
+from collections import defaultdict
+from typing import Callable, Optional
+
+import telegram as tg
+from telegram.ext import (
+    CallbackQueryHandler,
+    CommandHandler,
+    ConversationHandler,
+    Handler,
+    BasePersistence,
+)
+
+from telebot import callbacks
+
+
+def get_command(message: tg.Message) -> Optional[str]:
+    """Returns the (lowercase) bot command that ``message`` starts with, if any."""
+
+    if message is None or not message.text or not message.entities:
+        return None
+
+    entity = message.entities[0]
+    if entity.type != tg.MessageEntity.BOT_COMMAND or entity.offset != 0:
+        return None
+
+    return message.text[1 : entity.length].split("@")[0].lower()
+
+
+class Router(Handler):
+    """
+    A single dispatcher handler, that looks up the handlers able to match an update,
+    instead of asking every registered handler in turn.
+
+    - Conversations the chat is currently in are always candidates.
+    - Command handlers, and conversations entered through a command, are indexed by command.
+    - Callback query handlers are indexed by a one character code,
+      that their callback data starts with.
+    - Anything else is a catch-all, and always a candidate.
+
+    The candidates are tried in registration order, so the first handler to match wins,
+    same as with the dispatcher (e.g. ``/help`` registered before a conversation works in the middle of it).
+    Callback queries that no handler matches (e.g. a button left over from a finished conversation) are answered,
+    so the button stops spinning.
+
+    Conversations are expected to be keyed per chat and user (the default).
+    """
+
+    def __init__(self):
+        super().__init__(callback=None)
+
+        self.handlers = []
+        self.positions = {}
+        self.commands = defaultdict(list)
+        self.callbacks = {}
+        self.catch_alls = []
+
+        self.conversations = []
+        self.active = {}
+
+    def register(self, handler: Handler):
+        self.positions[handler] = len(self.handlers)
+        self.handlers.append(handler)
+
+    def add_handler(self, handler: Handler):
+        self.register(handler)
+
+        if isinstance(handler, CommandHandler):
+            for command in handler.command:
+                self.commands[command].append(handler)
+        elif isinstance(handler, ConversationHandler):
+            self.conversations.append(handler)
+            for entry_point in handler.entry_points:
+                if isinstance(entry_point, CommandHandler):
+                    for command in entry_point.command:
+                        self.commands[command].append(handler)
+                elif handler not in self.catch_alls:
+                    self.catch_alls.append(handler)
+        else:
+            self.catch_alls.append(handler)
+
+    def add_callback_handler(
+        self, code: str, callback: Callable, **kwargs
+    ) -> CallbackQueryHandler:
+        """
+        Registers a handler for callback queries whose data starts with ``code``.
+        """
+
+        if len(code) != 1 or code in self.callbacks:
+            raise ValueError(f"Invalid or duplicate callback code: {code!r}")
+
+        handler = CallbackQueryHandler(callback, pattern=re.escape(code), **kwargs)
+        self.register(handler)
+        self.callbacks[code] = handler
+
+        return handler
+
+    def set_persistence(self, persistence: BasePersistence):
+        """
+        Restores the state of persistent conversations,
+        like ``Dispatcher.add_handler()`` does for conversations added to it directly.
+        """
+
+        for conversation in self.conversations:
+            if not conversation.persistent:
+                continue
+
+            conversation.persistence = persistence
+            conversation.conversations = persistence.get_conversations(
+                conversation.name
+            )
+            for key in conversation.conversations:
+                self.active.setdefault(key, []).append(conversation)
+
+    @staticmethod
+    def get_key(up: tg.Update):
+        if up.effective_chat is None or up.effective_user is None:
+            return None
+        return up.effective_chat.id, up.effective_user.id
+
+    def get_candidates(self, up: tg.Update):
+        candidates = set(self.active.get(self.get_key(up), ()))
+
+        if up.callback_query is not None:
+            handler = self.callbacks.get((up.callback_query.data or "")[:1])
+            if handler is not None:
+                candidates.add(handler)
+        else:
+            command = get_command(up.effective_message)
+            if command is not None:
+                candidates.update(self.commands.get(command, ()))
+
+        candidates.update(self.catch_alls)
+        return sorted(candidates, key=self.positions.__getitem__)
+
+    def is_active(self, up: tg.Update) -> bool:
+        """Whether ``up`` is from a chat that's in the middle of a conversation."""
+
+        return self.get_key(up) in self.active
+
+    def check_update(self, update):
+        if not isinstance(update, tg.Update):
+            return None
+
+        for handler in self.get_candidates(update):
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler, check
+
+        if update.callback_query is not None:
+            return None, None
+
+        return None
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        handler, check = check_result
+        if handler is None:
+            callbacks.answer(update)
+            return None
+
+        try:
+            return handler.handle_update(update, dispatcher, check, context)
+        finally:
+            if isinstance(handler, ConversationHandler):
+                self.track_conversation(handler, update)
+
+    def track_conversation(self, conversation: ConversationHandler, up: tg.Update):
+        """Updates the index of active conversations, after ``conversation`` handled ``up``."""
+
+        key = self.get_key(up)
+        active = set(self.active.get(key, ()))
+
+        if conversation._get_key(up) in conversation.conversations:
+            active.add(conversation)
+        else:
+            active.discard(conversation)
+
+        if active:
+            # keep the registration order, which decides precedence
+            self.active[key] = [c for c in self.conversations if c in active]
+        else:
+            self.active.pop(key, None)
@@ -0,0 +1,1077 @@
+import base64
+import contextvars
+import datetime
+import itertools
+import json
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from queue import Queue
+from typing import Tuple
+from unittest import mock
+
+import googlemaps
+import telegram as tg
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from telegram.ext import (
+    CommandHandler,
+    ConversationHandler,
+    DictPersistence,
+    Dispatcher,
+    TypeHandler,
+)
+
+from appliances.lookup import ApplianceLookup
+from appliances.models import Appliance, ProductLine
+from appointments.models import Appointment, Notification
+from gea_bot import settings
+from gea_bot.db_router import ReplicaRouter
+from pin_codes.models import PinCode, TimeSlot
+import telebot.util as util
+from telebot import (
+    bot,
+    callbacks,
+    dedup,
+    health,
+    logs,
+    notifications,
+    throttle,
+    tokens,
+)
+from telebot.ingress import IngressQueue
+from telebot.management.commands import explain_bot_queries, startup_report
+from telebot.models import Checkpoint
+from telebot.profiler import SamplingProfiler, collapse_stack
+from users.models import CustomUser
+
+USER_ID = 42
+
+ids = itertools.count(1)
+
+
+class FakeRequest:
+    """Stands in for the Bot API, recording the calls made to it."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, timeout=None):
+        return self.post(url, {}, timeout)
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit("/", 1)[-1]
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bot", "username": "bot"}
+        if method == "getMyCommands":
+            return []
+
+        self.calls.append((method, data))
+        if method in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": next(ids),
+                "date": 0,
+                "chat": {"id": USER_ID, "type": "private"},
+                "text": data.get("text", ""),
+            }
+        return True
+
+
+def message(text: str) -> dict:
+    data = {
+        "message_id": next(ids),
+        "date": 0,
+        "chat": {"id": USER_ID, "type": "private"},
+        "from": {"id": USER_ID, "is_bot": False, "first_name": "Test"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        data["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(text.split()[0])}
+        ]
+    return {"update_id": next(ids), "message": data}
+
+
+def callback_query(data: str) -> dict:
+    return {
+        "update_id": next(ids),
+        "callback_query": {
+            "id": str(next(ids)),
+            "chat_instance": "test",
+            "from": {"id": USER_ID, "is_bot": False, "first_name": "Test"},
+            "data": data,
+            "message": {
+                "message_id": next(ids),
+                "date": 0,
+                "chat": {"id": USER_ID, "type": "private"},
+                "text": "test",
+            },
+        },
+    }
+
+
+class RouterTest(TransactionTestCase):
+    """
+    Runs updates through the bot's handlers, as registered on its router.
+    Their reads go to the replica, which only sees committed data.
+    """
+
+    databases = {"default", "replica0"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.request = FakeRequest()
+        cls.dispatcher = Dispatcher(
+            tg.Bot("123456:test", request=cls.request), Queue(), workers=0
+        )
+        bot.router.set_persistence(DictPersistence())
+
+    def setUp(self):
+        CustomUser.objects.create(
+            username=str(USER_ID),
+            first_name="Test",
+            phone_number="+919876543210",
+            email="test@example.com",
+        )
+        for conversation in bot.router.conversations:
+            conversation.conversations.clear()
+        bot.router.active.clear()
+
+        lookup = ApplianceLookup(cache_size=10, cache_ttl=60, ttl=300, poll=10)
+        for patcher in (
+            mock.patch.object(bot, "appliance_lookup", lookup),
+            mock.patch.object(
+                bot, "suggestion_throttle", throttle.Throttle(rate=0.001, burst=2)
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def send(self, data: dict) -> list:
+        """Dispatches an update, returning the Bot API calls made while handling it."""
+
+        self.request.calls.clear()
+        update = tg.Update.de_json(data, self.dispatcher.bot)
+        check = bot.router.check_update(update)
+        if check is not None:
+            bot.router.handle_update(update, self.dispatcher, check)
+        return list(self.request.calls)
+
+    def replies(self, data: dict) -> list:
+        return [
+            call["text"] for method, call in self.send(data) if method == "sendMessage"
+        ]
+
+    def test_conversation(self):
+        self.assertIn("Alright, let's book", self.replies(message("/book"))[0])
+        self.assertIn("invalid serial number", self.replies(message("XYZ"))[0])
+
+    def test_command_registered_before_conversation(self):
+        self.replies(message("/book"))
+        self.assertEqual(self.replies(message("/help")), [bot.HELP])
+        # still booking
+        self.assertIn("invalid serial number", self.replies(message("XYZ"))[0])
+
+    def test_conversation_registered_before_conversation(self):
+        self.replies(message("/book"))
+        self.assertIn("Welcome back", self.replies(message("/start"))[0])
+
+    def test_conversation_registered_before_active_conversation(self):
+        self.replies(message("/check"))
+        self.assertIn("Alright, let's book", self.replies(message("/book"))[0])
+
+    def create_appliance(self) -> Appliance:
+        return Appliance.objects.create(
+            serial_number="ABC123",
+            product_line=ProductLine.objects.create(name="Fridge"),
+            model_number="M1",
+            name="Fridge",
+        )
+
+    def suggest(self, serial_number: str) -> list:
+        """The callback data of the suggestion buttons in the reply to ``serial_number``."""
+
+        ((method, reply),) = self.send(message(serial_number))
+        markup = json.loads(reply.get("reply_markup", "{}"))
+        return [row[0]["callback_data"] for row in markup.get("inline_keyboard", [])]
+
+    def test_serial_suggestion(self):
+        self.create_appliance()
+
+        self.replies(message("/book"))
+        (data,) = self.suggest("ABC12")
+        self.assertTrue(data.startswith(bot.SERIAL_SUGGESTION))
+
+        calls = self.send(callback_query(data))
+        self.assertEqual(calls[0][0], "answerCallbackQuery")
+        self.assertIn("Checks out!", calls[1][1]["text"])
+
+    def test_forged_serial_suggestion(self):
+        appliance = self.create_appliance()
+        forged = [
+            f"{bot.SERIAL_SUGGESTION}{appliance.pk}",
+            bot.SERIAL_SUGGESTION
+            + tokens.dumps(
+                tokens.Token(tokens.SUGGESTED_APPLIANCE, appliance.pk, USER_ID + 1)
+            ),
+            bot.SERIAL_SUGGESTION
+            + tokens.dumps(tokens.Token(tokens.CHECK, appliance.pk, USER_ID)),
+        ]
+
+        self.replies(message("/book"))
+        for data in forged:
+            calls = self.send(callback_query(data))
+            self.assertEqual([method for method, _ in calls], ["answerCallbackQuery"])
+        self.assertIn("invalid serial number", self.replies(message("XYZ"))[0])
+
+    def test_expired_serial_suggestion(self):
+        self.create_appliance()
+
+        self.replies(message("/book"))
+        (data,) = self.suggest("ABC12")
+        later = time.time() + settings.SERIAL_SUGGESTION_MAX_AGE + 1
+        with mock.patch("time.time", return_value=later):
+            calls = self.send(callback_query(data))
+
+        self.assertEqual(calls[0][1]["text"], "This button has expired.")
+
+    def test_serial_suggestions_throttled(self):
+        self.create_appliance()
+
+        self.replies(message("/book"))
+        self.assertEqual(len(self.suggest("ABC12")), 1)
+        self.assertEqual(len(self.suggest("ABC12")), 1)
+        self.assertEqual(self.suggest("ABC12"), [])
+
+    def test_unknown_command(self):
+        self.assertIn("could not understand", self.replies(message("/nope"))[0])
+
+    def test_unmatched_callback_query(self):
+        calls = self.send(callback_query(bot.SERIAL_SUGGESTION + "1"))
+        self.assertEqual([method for method, _ in calls], ["answerCallbackQuery"])
+
+
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.update = tg.Update.de_json(message("test"), None)
+
+    def test_outside_update(self):
+        self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+    def test_reads_from_replica(self):
+        with logs.update_context(self.update):
+            self.assertEqual(self.router.db_for_read(CustomUser), "replica0")
+
+    def test_sticks_after_user_write(self):
+        with logs.update_context(self.update):
+            self.router.db_for_write(CustomUser)
+            self.assertEqual(self.router.db_for_read(CustomUser), "default")
+
+        later = time.monotonic() + settings.REPLICA_STICKINESS
+        with logs.update_context(self.update), mock.patch(
+            "time.monotonic", return_value=later
+        ):
+            self.assertEqual(self.router.db_for_read(CustomUser), "replica0")
+
+    def test_bookkeeping_doesnt_stick(self):
+        with logs.update_context(self.update):
+            self.router.db_for_write(Checkpoint)
+            self.router.db_for_write(PinCode)
+            self.assertEqual(self.router.db_for_read(CustomUser), "replica0")
+
+
+class TokenTest(SimpleTestCase):
+    token = tokens.Token(tokens.NEW_TIME_SLOT, 123, USER_ID, 5, 7)
+
+    def test_round_trip(self):
+        data = tokens.dumps(self.token)
+        self.assertLessEqual(len(bot.NEW_TIME_SLOT + data), 64)
+        self.assertEqual(tokens.loads(data, owner_id=USER_ID), self.token)
+
+    def test_tampered(self):
+        raw = bytearray(base64.urlsafe_b64decode(tokens.dumps(self.token) + "=="))
+        for i in range(len(raw)):
+            tampered = raw.copy()
+            tampered[i] ^= 1
+            data = base64.urlsafe_b64encode(tampered).rstrip(b"=").decode()
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.loads(data, owner_id=USER_ID)
+
+    def test_truncated(self):
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.loads(tokens.dumps(self.token)[:-4], owner_id=USER_ID)
+
+    def test_malformed(self):
+        for data in ("", "!!!", "a"):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.loads(data, owner_id=USER_ID)
+
+    def test_foreign_owner(self):
+        with self.assertRaises(tokens.InvalidToken):
+            tokens.loads(tokens.dumps(self.token), owner_id=USER_ID + 1)
+
+    def test_expired(self):
+        data = tokens.dumps(self.token)
+        later = time.time() + settings.CALLBACK_TOKEN_MAX_AGE + 1
+        with mock.patch("time.time", return_value=later):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.loads(data, owner_id=USER_ID)
+
+
+class ThrottleTest(SimpleTestCase):
+    def test_burst(self):
+        limit = throttle.Throttle(rate=1, burst=3)
+        now = time.monotonic()
+
+        with mock.patch("time.monotonic", return_value=now):
+            allowed = [limit.allow(USER_ID) for _ in range(5)]
+            self.assertEqual(limit.allow(USER_ID + 1), (True, False))
+        self.assertEqual(allowed, [(True, False)] * 3 + [(False, True), (False, False)])
+
+        # refilled at one token per second
+        with mock.patch("time.monotonic", return_value=now + 1):
+            self.assertEqual(limit.allow(USER_ID), (True, False))
+            self.assertEqual(limit.allow(USER_ID), (False, True))
+
+    def test_prune(self):
+        limit = throttle.Throttle(rate=1, burst=3, max_users=2)
+        now = time.monotonic()
+
+        with mock.patch("time.monotonic", return_value=now):
+            limit.allow(1)
+        with mock.patch("time.monotonic", return_value=now + 3):
+            limit.allow(2)
+            limit.allow(3)
+        self.assertEqual(set(limit.buckets), {2, 3})
+
+
+class SharedThrottleTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_window(self):
+        limit = throttle.SharedThrottle(rate=1, burst=3)
+        now = 1000 * limit.window
+
+        with mock.patch("time.time", return_value=now):
+            allowed = [limit.allow(USER_ID) for _ in range(5)]
+        self.assertEqual(allowed, [(True, False)] * 3 + [(False, True), (False, False)])
+
+        with mock.patch("time.time", return_value=now + limit.window):
+            self.assertEqual(limit.allow(USER_ID), (True, False))
+
+    def test_evicted(self):
+        limit = throttle.SharedThrottle(rate=1, burst=3)
+
+        with mock.patch.object(cache, "incr", side_effect=ValueError):
+            self.assertEqual(limit.allow(USER_ID), (True, False))
+        self.assertEqual(limit.allow(USER_ID), (True, False))
+
+    def test_local_cache(self):
+        with mock.patch.object(settings, "THROTTLE_SHARED", True):
+            with self.assertRaises(ImproperlyConfigured):
+                throttle.create_throttle()
+
+
+class IngressQueueTest(SimpleTestCase):
+    def setUp(self):
+        self.request = FakeRequest()
+        self.bot = tg.Bot("123456:test", request=self.request)
+
+        # the Bot API hangs until released
+        self.release = threading.Event()
+        post = self.request.post
+
+        def slow_post(*args, **kwargs):
+            self.release.wait(5)
+            return post(*args, **kwargs)
+
+        self.request.post = slow_post
+
+    def update(self, data: dict) -> tg.Update:
+        return tg.Update.de_json(data, self.bot)
+
+    def test_sheds_when_overloaded(self):
+        updates = IngressQueue(
+            maxsize=10,
+            shed_depth=2,
+            shed_age=60,
+            is_critical=lambda up: up.callback_query is not None,
+            busy_replies=2,
+        )
+        for _ in range(2):
+            updates.put(self.update(message("/list")))
+
+        start = time.monotonic()
+        for _ in range(5):
+            updates.put(self.update(message("/list")))
+        updates.put(self.update(callback_query("x")))
+        self.assertLess(time.monotonic() - start, 1)
+
+        # only the critical update was let in, and the busy replies didn't wait for the Bot API
+        self.assertEqual(updates.qsize(), 3)
+        self.release.set()
+        updates.busy_replies.join()
+        # at most the two waiting to be sent, and the one being sent when they were shed
+        methods = [method for method, _ in self.request.calls]
+        self.assertEqual(set(methods), {"sendMessage"})
+        self.assertLessEqual(len(methods), 3)
+
+
+class DeduplicatorTest(TestCase):
+    def setUp(self):
+        Checkpoint.objects.create(name="test", update_id=100)
+        self.deduplicator = dedup.Deduplicator("test", window=3, checkpoint_every=100)
+
+    def test_redelivered(self):
+        self.assertFalse(self.deduplicator.is_duplicate(101))
+        self.assertTrue(self.deduplicator.is_duplicate(101))
+        self.assertFalse(self.deduplicator.is_duplicate(102))
+
+    def test_handled_by_previous_process(self):
+        self.assertTrue(self.deduplicator.is_duplicate(99))
+        self.assertTrue(self.deduplicator.is_duplicate(100))
+        self.assertFalse(self.deduplicator.is_duplicate(101))
+        self.assertEqual(self.deduplicator.get_offset(), 101)
+
+    def test_window(self):
+        for update_id in (101, 102, 103, 104):
+            self.deduplicator.is_duplicate(update_id)
+
+        # only the last three are remembered
+        self.assertEqual(self.deduplicator.seen, {102, 103, 104})
+        self.assertFalse(self.deduplicator.is_duplicate(101))
+
+    def test_new_checkpoint(self):
+        deduplicator = dedup.Deduplicator("new", window=3, checkpoint_every=100)
+        self.assertFalse(deduplicator.is_duplicate(1))
+        self.assertEqual(deduplicator.get_offset(), 1)
+
+
+class CallbacksTest(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        self.up = mock.Mock(update_id=101)
+        self.up.callback_query.answer.side_effect = lambda text: self.calls.append(
+            "answer"
+        )
+
+        self.deduplicator = dedup.Deduplicator("test", window=10, checkpoint_every=100)
+        self.deduplicator.floor = self.deduplicator.high_water_mark = 100
+        self.dispatcher = dedup.DedupDispatcher(
+            tg.Bot("123456:test", request=FakeRequest()), Queue(), workers=0
+        )
+        for patcher in (
+            mock.patch.object(dedup, "deduplicator", self.deduplicator),
+            mock.patch.object(
+                dedup.DedupDispatcher, "get_instance", return_value=self.dispatcher
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_deferred(self):
+        """Runs the next deferred callback, in a thread of its own like the workers."""
+
+        promise = self.dispatcher._Dispatcher__async_queue.get_nowait()
+        thread = threading.Thread(target=promise.run)
+        thread.start()
+        thread.join()
+
+    def test_acknowledge(self):
+        @callbacks.acknowledge
+        def handle(bot, up):
+            self.calls.append("work")
+            return 1
+
+        self.assertEqual(handle(None, self.up), 1)
+        self.assertEqual(self.calls, ["answer", "work"])
+
+    def test_defer(self):
+        var = contextvars.ContextVar("var", default=None)
+
+        @callbacks.defer
+        def handle(bot, up):
+            self.calls.append(("work", var.get(), health.health.busy_workers))
+
+        var.set("set by the dispatcher")
+        self.assertIsNone(handle(None, self.up))
+
+        # answered, and kept in flight until the work is done
+        self.assertEqual(self.calls, ["answer"])
+        self.assertEqual(self.deduplicator.in_flight, {101: 1})
+
+        self.run_deferred()
+        self.assertEqual(self.calls, ["answer", ("work", "set by the dispatcher", 1)])
+        self.assertEqual(self.deduplicator.in_flight, {})
+        self.assertEqual(health.health.busy_workers, 0)
+
+    def test_defer_error(self):
+        @callbacks.defer
+        def handle(bot, up):
+            raise ValueError()
+
+        handle(None, self.up)
+        with self.assertLogs("telebot.callbacks", "ERROR"):
+            self.run_deferred()
+
+        self.assertEqual(self.deduplicator.in_flight, {})
+        self.assertEqual(health.health.busy_workers, 0)
+
+    def test_busy_while_handling(self):
+        self.dispatcher.add_handler(
+            TypeHandler(
+                tg.Update,
+                lambda bot, up: self.calls.append(health.health.busy_workers),
+            )
+        )
+
+        self.dispatcher.process_update(tg.Update(102))
+
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(health.health.busy_workers, 0)
+        self.assertEqual(self.deduplicator.in_flight, {})
+
+
+class CheckpointTest(TestCase):
+    def setUp(self):
+        Checkpoint.objects.create(name="test", update_id=100)
+        self.deduplicator = dedup.Deduplicator("test", window=10, checkpoint_every=3)
+
+    def get_checkpoint(self) -> int:
+        return Checkpoint.objects.get(name="test").update_id
+
+    def test_completed(self):
+        for update_id in (101, 102, 103):
+            self.deduplicator.is_duplicate(update_id)
+        self.assertEqual(self.deduplicator.get_completed(), 100)
+
+        self.deduplicator.release(102)
+        self.assertEqual(self.deduplicator.get_completed(), 100)
+        self.deduplicator.release(101)
+        self.assertEqual(self.deduplicator.get_completed(), 102)
+        self.deduplicator.release(103)
+        self.assertEqual(self.deduplicator.get_completed(), 103)
+
+    def test_retained(self):
+        self.deduplicator.is_duplicate(101)
+        self.deduplicator.retain(101)
+        self.deduplicator.release(101)
+        self.assertEqual(self.deduplicator.get_completed(), 100)
+
+        self.deduplicator.release(101)
+        self.assertEqual(self.deduplicator.get_completed(), 101)
+
+    def test_saves_completed(self):
+        for update_id in (101, 102):
+            self.deduplicator.is_duplicate(update_id)
+            self.deduplicator.release(update_id)
+        self.deduplicator.is_duplicate(103)  # the third update triggers a checkpoint
+        self.assertEqual(self.get_checkpoint(), 102)
+
+        self.deduplicator.release(103)
+        self.deduplicator.save()
+        self.assertEqual(self.get_checkpoint(), 103)
+        self.assertEqual(self.deduplicator.get_offset(), 101)
+
+    def test_never_moves_back(self):
+        Checkpoint.objects.filter(name="test").update(update_id=200)
+        self.deduplicator.is_duplicate(101)
+        self.deduplicator.release(101)
+        self.deduplicator.save()
+        self.assertEqual(self.get_checkpoint(), 200)
+
+    def test_dispatcher(self):
+        dispatcher = dedup.DedupDispatcher(
+            tg.Bot("123456:test", request=FakeRequest()), Queue(), workers=0
+        )
+        handled = []
+        dispatcher.add_handler(
+            TypeHandler(tg.Update, lambda _, up: handled.append(up.update_id))
+        )
+
+        with mock.patch.object(dedup, "deduplicator", self.deduplicator):
+            self.deduplicator.retain(101)  # e.g. deferred work
+            dispatcher.process_update(tg.Update(101))
+            dispatcher.process_update(tg.Update(101))
+            self.assertEqual(self.deduplicator.get_completed(), 100)
+
+            dispatcher.process_update(tg.Update(100))
+            dispatcher.process_update(tg.Update(102))
+
+        self.assertEqual(handled, [101, 102])
+        self.assertEqual(self.deduplicator.get_completed(), 100)
+
+
+class StopBotTest(SimpleTestCase):
+    def setUp(self):
+        self.updater = mock.Mock()
+        self.release = threading.Event()
+        self.updater.stop.side_effect = lambda: self.release.wait(5)
+        self.addCleanup(self.release.set)
+
+    def test_drained(self):
+        self.release.set()
+        with mock.patch.object(dedup.deduplicator, "save") as save:
+            self.assertTrue(bot.stop_bot(self.updater))
+
+        self.updater.dispatcher.persistence.flush.assert_called_once_with()
+        save.assert_called_once_with()
+
+    def test_timed_out(self):
+        with mock.patch.object(settings, "DRAIN_TIMEOUT", 0.01):
+            with mock.patch.object(dedup.deduplicator, "save") as save:
+                self.assertFalse(bot.stop_bot(self.updater))
+
+        self.updater.dispatcher.persistence.flush.assert_not_called()
+        save.assert_not_called()
+
+
+class WrapCallbacksTest(SimpleTestCase):
+    def test_shared_handler(self):
+        def abort(bot, up):
+            pass
+
+        def step(bot, up):
+            pass
+
+        shared = CommandHandler("abort", abort)
+        handlers = [
+            ConversationHandler(
+                entry_points=[CommandHandler("first", step)],
+                states={"step": [shared]},
+                fallbacks=[shared],
+                name="first",
+            ),
+            ConversationHandler(
+                entry_points=[CommandHandler("second", step)],
+                states={},
+                fallbacks=[shared],
+            ),
+        ]
+        labels = []
+
+        def label(fn, state):
+            return lambda bot, up: labels.append((fn.__name__, state))
+
+        util.wrap_callbacks(handlers, label)
+        util.wrap_callbacks(handlers, lambda fn, state: fn)
+        for handler, _ in util.walk_handlers(handlers):
+            handler.callback(None, None)
+
+        self.assertEqual(
+            labels,
+            [
+                ("step", "first"),
+                ("abort", "step"),
+                ("abort", "first"),
+                ("step", None),
+                ("abort", None),
+            ],
+        )
+        # the original is still used once
+        self.assertIs(handlers[0].states["step"][0], shared)
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    def setUp(self):
+        self.circuit = health.CircuitBreaker(max_failures=2, reset_timeout=30)
+
+    def trip(self):
+        with self.assertRaises(ConnectionError):
+            with self.circuit.guard(ConnectionError):
+                raise ConnectionError()
+
+    def test_opens_after_failures(self):
+        self.trip()
+        self.assertEqual(self.circuit.state, health.CircuitBreaker.CLOSED)
+        self.trip()
+        self.assertEqual(self.circuit.state, health.CircuitBreaker.OPEN)
+
+        with self.assertRaises(health.CircuitOpen):
+            with self.circuit.guard(ConnectionError):
+                self.fail("called through an open circuit")
+
+    def test_success_resets_failures(self):
+        self.trip()
+        with self.circuit.guard(ConnectionError):
+            pass
+        self.trip()
+        self.assertEqual(self.circuit.state, health.CircuitBreaker.CLOSED)
+
+    def test_half_open(self):
+        self.trip()
+        self.trip()
+
+        later = time.monotonic() + 31
+        with mock.patch("time.monotonic", return_value=later):
+            self.assertEqual(self.circuit.state, health.CircuitBreaker.HALF_OPEN)
+            with self.circuit.guard(ConnectionError):
+                # a single trial call, everyone else still sees it open
+                self.assertEqual(self.circuit.state, health.CircuitBreaker.OPEN)
+            self.assertEqual(self.circuit.state, health.CircuitBreaker.CLOSED)
+
+    def test_failed_trial_reopens(self):
+        self.trip()
+        self.trip()
+
+        later = time.monotonic() + 31
+        with mock.patch("time.monotonic", return_value=later):
+            self.trip()
+            self.assertEqual(self.circuit.state, health.CircuitBreaker.OPEN)
+
+    def test_unexpected_errors_not_counted(self):
+        for _ in range(2):
+            with self.assertRaises(KeyError):
+                with self.circuit.guard(ConnectionError):
+                    raise KeyError()
+        self.assertEqual(self.circuit.state, health.CircuitBreaker.CLOSED)
+
+
+class ReverseGeocodeTest(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            util, "maps_circuit", health.CircuitBreaker(max_failures=5, reset_timeout=30)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_errors_raised_as_timeouts(self):
+        for error in (
+            googlemaps.exceptions.Timeout(),
+            googlemaps.exceptions.TransportError("unreachable"),
+        ):
+            with mock.patch.object(util, "get_gmaps") as get_gmaps:
+                get_gmaps.return_value.reverse_geocode.side_effect = error
+                with self.assertRaises(TimeoutError):
+                    util.reverse_geocode({"latitude": 0, "longitude": 0})
+
+    def test_client_timeouts(self):
+        util.get_gmaps.cache_clear()
+        self.addCleanup(util.get_gmaps.cache_clear)
+        with mock.patch("googlemaps.Client") as client:
+            util.get_gmaps()
+
+        self.assertEqual(client.call_args.kwargs["timeout"], settings.MAPS_TIMEOUT)
+        self.assertEqual(
+            client.call_args.kwargs["retry_timeout"], settings.MAPS_RETRY_TIMEOUT
+        )
+
+
+class HealthTest(SimpleTestCase):
+    def get_report(self, **changes) -> dict:
+        report = {
+            "polling": True,
+            "last_poll_age": 1.0,
+            "queue": {"depth": 0, "oldest_age": 0.0},
+            "database": {"ok": True, "latency": 0.001},
+        }
+        for key, value in changes.items():
+            section, _, name = key.partition("__")
+            if name:
+                report[section] = {**report[section], name: value}
+            else:
+                report[section] = value
+        return report
+
+    def test_ready(self):
+        self.assertTrue(health.Health.is_ready(self.get_report()))
+
+    def test_not_ready(self):
+        for changes in (
+            {"polling": False},
+            {"last_poll_age": settings.HEALTH_POLL_TIMEOUT},
+            {"database__ok": False},
+            {"queue__depth": settings.SHED_QUEUE_DEPTH},
+            {"queue__oldest_age": settings.SHED_QUEUE_AGE},
+        ):
+            with self.subTest(**changes):
+                self.assertFalse(health.Health.is_ready(self.get_report(**changes)))
+
+    def test_live_while_behind(self):
+        report = self.get_report(queue__depth=settings.SHED_QUEUE_DEPTH)
+        self.assertTrue(health.Health.is_live(report))
+
+    def get(self, path: str, token: str = None) -> Tuple[int, bytes]:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), health.RequestHandler)
+        threading.Thread(
+            target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        ).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        request = urllib.request.Request(f"http://127.0.0.1:{server.server_port}{path}")
+        if token is not None:
+            request.add_header("Authorization", f"Bearer {token}")
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    @mock.patch.object(settings, "METRICS_TOKEN", "secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.get("/metrics")[0], 404)
+        self.assertEqual(self.get("/metrics", "wrong")[0], 404)
+        self.assertEqual(self.get("/metrics", "secret")[0], 200)
+
+    @mock.patch.object(settings, "METRICS_TOKEN", "")
+    def test_metrics_without_token_set(self):
+        self.assertEqual(self.get("/metrics", "")[0], 404)
+
+    @mock.patch.object(settings, "METRICS_TOKEN", "secret")
+    def test_health_report_needs_token(self):
+        report = self.get_report(database__ok=False)
+        with mock.patch.object(health.health, "report", return_value=report):
+            self.assertEqual(self.get("/readyz"), (503, b'{"ok": false}'))
+            self.assertEqual(self.get("/healthz"), (200, b'{"ok": true}'))
+
+            status, body = self.get("/readyz", "secret")
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(body), report)
+
+
+class ExplainBotQueriesTest(TestCase):
+    def setUp(self):
+        for name in ("echo", "secho"):
+            patcher = mock.patch.object(explain_bot_queries.click, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_queries_use_indexes(self):
+        self.assertEqual(explain_bot_queries.check(num_users=200, num_appointments=2000), [])
+
+    def test_detects_scan(self):
+        queries = {"by reason": Appointment.objects.filter(reason="Broken")}
+        self.assertEqual(explain_bot_queries.explain(queries), ["by reason"])
+
+
+class SendPendingTest(TestCase):
+    def setUp(self):
+        product_line = ProductLine.objects.create(name="Fridge")
+        appliance = Appliance.objects.create(
+            serial_number="ABC123", product_line=product_line
+        )
+        pin_code = PinCode.objects.create(pin_code="560001")
+        time_slot = TimeSlot.objects.create(
+            start=datetime.time(9), end=datetime.time(11)
+        )
+        self.notifications = []
+        for i, username in enumerate(["1", "admin", "2", "3"]):
+            user = CustomUser.objects.create(username=username)
+            appointment = Appointment.objects.create(
+                tracking_number=f"{i:010}",
+                appliance=appliance,
+                user=user,
+                pin_code=pin_code,
+                weekday=PinCode.MON,
+                time_slot=time_slot,
+            )
+            self.notifications.append(
+                Notification.objects.create(appointment=appointment, text=f"#{i}")
+            )
+        self.bot = mock.Mock()
+
+    def send_pending(self):
+        # without closing the test's connection
+        notifications.send_pending.__wrapped__(self.bot, None)
+
+    def get_sent(self) -> list:
+        return list(
+            Notification.objects.exclude(sent_at=None)
+            .order_by("pk")
+            .values_list("text", flat=True)
+        )
+
+    def test_sends(self):
+        self.send_pending()
+
+        self.assertEqual(
+            self.bot.send_message.call_args_list,
+            [
+                mock.call(1, "#0", parse_mode="Markdown"),
+                mock.call(2, "#2", parse_mode="Markdown"),
+                mock.call(3, "#3", parse_mode="Markdown"),
+            ],
+        )
+        # including the one to a user outside Telegram
+        self.assertEqual(self.get_sent(), ["#0", "#1", "#2", "#3"])
+
+    def test_batch_size(self):
+        with mock.patch.object(settings, "NOTIFICATION_BATCH_SIZE", 2):
+            self.send_pending()
+        self.assertEqual(self.get_sent(), ["#0", "#1"])
+
+        self.send_pending()
+        self.assertEqual(self.get_sent(), ["#0", "#1", "#2", "#3"])
+        self.assertEqual(self.bot.send_message.call_count, 3)
+
+    def test_errors(self):
+        self.bot.send_message.side_effect = [
+            tg.error.Unauthorized("Forbidden: bot was blocked by the user"),
+            tg.error.RetryAfter(5),
+        ]
+
+        with self.assertLogs("telebot.notifications", "WARNING"):
+            self.send_pending()
+
+        # the blocked user isn't retried, the rate limited ones are
+        self.assertEqual(self.get_sent(), ["#0", "#1"])
+
+
+class ProfilerTest(SimpleTestCase):
+    def setUp(self):
+        out_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(out_dir.cleanup)
+        self.profiler = SamplingProfiler(out_dir.name, rate=1, window=60, interval=0.01)
+
+    def test_collapse_stack(self):
+        def inner():
+            return collapse_stack(sys._getframe())
+
+        def outer():
+            return inner()
+
+        stack = outer().split(";")
+
+        self.assertEqual(
+            [frame.split(" ")[0] for frame in stack[-3:]],
+            ["test_collapse_stack", "outer", "inner"],
+        )
+        self.assertRegex(stack[-1], r"^inner \(tests\.py:\d+\)$")
+
+    def test_dump(self):
+        self.profiler.stacks.update({"recv_pincode;a;b": 1, "recv_pincode;a": 3})
+
+        with self.assertLogs("telebot.profiler", "INFO"):
+            path = self.profiler.dump()
+
+        self.assertTrue(path.endswith(".folded"))
+        with open(path) as f:
+            self.assertEqual(f.read(), "recv_pincode;a 3\nrecv_pincode;a;b 1\n")
+
+    def test_signal(self):
+        previous = signal.getsignal(signal.SIGUSR2)
+        self.addCleanup(signal.signal, signal.SIGUSR2, previous)
+        started = threading.Event()
+        threads = []
+
+        def start():
+            threads.append(threading.current_thread().name)
+            started.set()
+
+        with mock.patch.object(self.profiler, "start", side_effect=start):
+            self.profiler.install_signal_handler()
+            os.kill(os.getpid(), signal.SIGUSR2)
+            self.assertTrue(started.wait(1))
+
+        # not inside the signal handler, on the main thread
+        self.assertEqual(threads, ["profiler-signal"])
+
+
+class StartupReportTest(SimpleTestCase):
+    def test_parse_importtime(self):
+        stderr = "\n".join(
+            [
+                "import time: self [us] | cumulative | imported package",
+                "import time:       120 |        120 |   _io",
+                "import time:      2500 |      14000 | telebot.bot",
+                "Traceback (most recent call last):",
+            ]
+        )
+
+        self.assertEqual(
+            list(startup_report.parse_importtime(stderr)),
+            [("_io", 0.00012, 0.00012), ("telebot.bot", 0.0025, 0.014)],
+        )
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.addFilter(logs.ContextFilter())
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class LogsTest(SimpleTestCase):
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.logger = logs.logger
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.update = tg.Update.de_json(message("test"), None)
+
+    def format(self, record) -> dict:
+        return json.loads(logs.JsonFormatter().format(record))
+
+    def test_context(self):
+        with logs.update_context(self.update, "recv_pincode"):
+            self.logger.warning("inside")
+        self.logger.warning("outside")
+
+        inside, outside = map(self.format, self.handler.records)
+        self.assertEqual(inside["message"], "inside")
+        self.assertEqual(inside["update_id"], self.update.update_id)
+        self.assertEqual(inside["chat_id"], USER_ID)
+        self.assertEqual(inside["user_id"], USER_ID)
+        self.assertEqual(inside["handler_name"], "recv_pincode")
+        self.assertEqual(set(outside), {"time", "level", "logger", "message"})
+
+    def test_exception(self):
+        try:
+            raise KeyError("missing")
+        except KeyError:
+            self.logger.exception("failed")
+
+        (record,) = self.handler.records
+        entry = self.format(logs.DroppingQueueHandler(Queue()).prepare(record))
+        self.assertEqual(entry["level"], "ERROR")
+        self.assertIn("KeyError: 'missing'", entry["exc_info"])
+
+    def test_log_error(self):
+        error = ValueError("boom")
+        logs.log_error(None, self.update, error)
+        logs.log_error(None, None, error)
+
+        handled, polling = self.handler.records
+        self.assertEqual(handled.getMessage(), "Error while handling update")
+        self.assertEqual(handled.update_id, self.update.update_id)
+        self.assertIs(handled.exc_info[1], error)
+        self.assertEqual(polling.getMessage(), "Error while polling for updates")
+        self.assertIsNone(polling.update_id)
+
+    def test_sampling(self):
+        log_queue = Queue()
+        sampling = logs.LoadSamplingFilter(log_queue, threshold=2, rate=0.1)
+        info = logging.LogRecord("test", logging.INFO, "", 0, "info", None, None)
+        warning = logging.LogRecord("test", logging.WARNING, "", 0, "warning", None, None)
+
+        with mock.patch("random.random", return_value=0.5):
+            self.assertTrue(sampling.filter(info))
+            log_queue.put(None)
+            log_queue.put(None)
+            self.assertFalse(sampling.filter(info))
+            self.assertTrue(sampling.filter(warning))
+        with mock.patch("random.random", return_value=0.05):
+            self.assertTrue(sampling.filter(info))
+
+    def test_drops_when_full(self):
+        handler = logs.DroppingQueueHandler(Queue(maxsize=1))
+        record = logging.LogRecord("test", logging.INFO, "", 0, "info", None, None)
+        handler.enqueue(record)
+        handler.enqueue(record)
+
+        self.assertEqual(handler.dropped, 1)
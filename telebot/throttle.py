@@ -0,0 +1,149 @@
+"""
+Per-user flood protection, run before any other handler.
+
+Every telegram user gets a token bucket, refilled at ``THROTTLE_RATE`` tokens per second,
+holding at most ``THROTTLE_BURST`` tokens. Updates arriving at an empty bucket are dropped,
+and the user is told to slow down once per burst of dropped updates.
+
+With ``THROTTLE_SHARED``, the limit is instead counted in the django cache,
+so that it holds across bot processes.
+That takes a cache shared between them, like memcached (see ``MEMCACHED_LOCATION``),
+so the bot refuses to start with a per-process one.
+"""
+
+import threading
+import time
+from typing import Tuple
+
+import telegram as tg
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext as T
+from telegram.ext import DispatcherHandlerStop, TypeHandler
+
+from gea_bot import settings
+from telebot import metrics
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "notified")
+
+    def __init__(self, capacity: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.notified = False
+
+    def take(self, rate: float, capacity: float) -> bool:
+        now = time.monotonic()
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        self.notified = False
+        return True
+
+
+class Throttle:
+    def __init__(self, rate: float, burst: int, max_users: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def prune(self):
+        """Forgets the users whose buckets have refilled completely."""
+
+        idle = self.burst / self.rate
+        now = time.monotonic()
+        self.buckets = {
+            user_id: bucket
+            for user_id, bucket in self.buckets.items()
+            if now - bucket.updated < idle
+        }
+
+    def get_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            if len(self.buckets) >= self.max_users:
+                self.prune()
+            bucket = self.buckets[user_id] = TokenBucket(self.burst)
+        return bucket
+
+    def allow(self, user_id: int) -> Tuple[bool, bool]:
+        """Returns whether to let this update through, and whether to notify the user if not."""
+
+        with self.lock:
+            bucket = self.get_bucket(user_id)
+            if bucket.take(self.rate, self.burst):
+                return True, False
+
+            notify = not bucket.notified
+            bucket.notified = True
+            return False, notify
+
+
+class SharedThrottle:
+    """
+    A fixed window approximation of the token bucket, counted in the django cache.
+    Allows ``burst`` updates per ``burst / rate`` seconds.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.burst = burst
+        self.window = max(1, round(burst / rate))
+
+    def allow(self, user_id: int) -> Tuple[bool, bool]:
+        key = f"throttle:{user_id}:{int(time.time() // self.window)}"
+        timeout = self.window * 2
+        cache.add(key, 0, timeout=timeout)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # evicted (or expired) since add(), so count this update as the first one
+            cache.add(key, 1, timeout=timeout)
+            count = 1
+
+        return count <= self.burst, count == self.burst + 1
+
+
+def create_throttle():
+    if not settings.THROTTLE_SHARED:
+        return Throttle(settings.THROTTLE_RATE, settings.THROTTLE_BURST)
+
+    if isinstance(caches["default"], (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            "THROTTLE_SHARED needs a cache shared between processes, set MEMCACHED_LOCATION."
+        )
+    return SharedThrottle(settings.THROTTLE_RATE, settings.THROTTLE_BURST)
+
+
+throttle = create_throttle()
+
+
+def check_rate_limit(_, up: tg.Update):
+    if up.effective_user is None:
+        return
+
+    allowed, notify = throttle.allow(up.effective_user.id)
+    if allowed:
+        return
+
+    metrics.THROTTLED_UPDATES.inc()
+
+    if notify:
+        text = T("You're sending messages too fast. Please wait a moment.")
+        if up.callback_query is not None:
+            up.callback_query.answer(text)
+        elif up.effective_message is not None:
+            up.effective_message.reply_text(text)
+
+    raise DispatcherHandlerStop()
+
+
+handler = TypeHandler(tg.Update, check_rate_limit)
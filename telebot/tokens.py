@@ -0,0 +1,100 @@
+"""
+Compact, signed callback data for inline buttons.
+
+A token packs the action, the appointment it acts on (or, for ``SUGGESTED_APPLIANCE``, the appliance),
+the telegram user it was issued to,
+and an optional (weekday, time slot) argument into 23 bytes,
+followed by a truncated HMAC-SHA256 of those bytes.
+This is url-safe base64 encoded into 42 characters, well within telegram's 64 byte limit.
+
+Since a token carries everything needed to act on a tap, and can be verified
+using just the ``SECRET_KEY``, any bot process can handle it without shared state.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import struct
+import time
+from typing import NamedTuple
+
+from gea_bot import settings
+
+VERSION = 1
+
+CHECK = 1
+CANCEL = 2
+SCHEDULE = 3
+CANCEL_CONFIRM = 4
+CANCEL_ABORT = 5
+NEW_TIME_SLOT = 6
+SUGGESTED_APPLIANCE = 7
+
+# version, action, weekday, appointment id, time slot id, owner id, issued at
+PAYLOAD = struct.Struct(">BBBIIqI")
+MAC_SIZE = 8
+
+KEY = hashlib.sha256(b"telebot.tokens" + settings.SECRET_KEY.encode()).digest()
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class Token(NamedTuple):
+    action: int
+    appointment_id: int
+    owner_id: int
+    weekday: int = 0
+    time_slot_id: int = 0
+
+
+def sign(payload: bytes) -> bytes:
+    return hmac.new(KEY, payload, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def dumps(token: Token) -> str:
+    payload = PAYLOAD.pack(
+        VERSION,
+        token.action,
+        token.weekday,
+        token.appointment_id,
+        token.time_slot_id,
+        token.owner_id,
+        int(time.time()),
+    )
+    return base64.urlsafe_b64encode(payload + sign(payload)).rstrip(b"=").decode()
+
+
+def loads(data: str, owner_id: int, max_age: int = None) -> Token:
+    """
+    Verifies and decodes a token issued to ``owner_id``.
+
+    Raises :class:`InvalidToken` if the token is malformed, forged, issued to another user,
+    from an older version, or older than ``max_age`` (by default ``CALLBACK_TOKEN_MAX_AGE``) seconds.
+    """
+
+    if max_age is None:
+        max_age = settings.CALLBACK_TOKEN_MAX_AGE
+
+    try:
+        raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError):
+        raise InvalidToken("malformed")
+
+    payload, mac = raw[: PAYLOAD.size], raw[PAYLOAD.size :]
+    if len(payload) != PAYLOAD.size or not hmac.compare_digest(mac, sign(payload)):
+        raise InvalidToken("bad signature")
+
+    version, action, weekday, appointment_id, time_slot_id, owner, issued_at = (
+        PAYLOAD.unpack(payload)
+    )
+    if version != VERSION:
+        raise InvalidToken("stale version")
+    if owner != owner_id:
+        raise InvalidToken("foreign owner")
+    if time.time() - issued_at > max_age:
+        raise InvalidToken("expired")
+
+    return Token(action, appointment_id, owner, weekday, time_slot_id)
@@ -1,24 +1,49 @@
+import copy
 import secrets
-from functools import wraps
+from functools import lru_cache, wraps
 from typing import Tuple, Dict, Callable
 
-import googlemaps
 import telegram as tg
 from django import db
 from django.utils.translation import gettext as T
 from telegram.ext import ConversationHandler
 
 from gea_bot import settings
+from telebot import tokens
+from telebot.health import maps_circuit
 from pin_codes.models import PinCode
 from users.models import CustomUser
 
-gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_TOKEN)
+
+@lru_cache()
+def get_gmaps():
+    # deferred until the first lookup, since googlemaps is slow to import
+    import googlemaps
+
+    return googlemaps.Client(
+        key=settings.GOOGLE_MAPS_API_TOKEN,
+        timeout=settings.MAPS_TIMEOUT,
+        retry_timeout=settings.MAPS_RETRY_TIMEOUT,
+    )
 
 
 def reverse_geocode(coordinates: Dict[str, float]) -> Tuple[str, str, PinCode]:
-    details = gmaps.reverse_geocode(
-        (coordinates["latitude"], coordinates["longitude"])
-    )[0]
+    """
+    Raises ``TimeoutError`` if google maps doesn't respond in time, can't be reached,
+    or has been failing lately (see ``maps_circuit``).
+    """
+
+    import googlemaps
+
+    errors = (googlemaps.exceptions.Timeout, googlemaps.exceptions.TransportError)
+    try:
+        with maps_circuit.guard(*errors):
+            details = get_gmaps().reverse_geocode(
+                (coordinates["latitude"], coordinates["longitude"])
+            )[0]
+    except errors as e:
+        raise TimeoutError(str(e)) from e
+
     pin_code = [
         i["long_name"]
         for i in details["address_components"]
@@ -78,31 +103,117 @@ def get_pretty_time_slot(weekday_id, time_slot):
     return T(f"{PinCode.WEEKDAY_CHOICES_DICT[weekday_id]}, {time_slot}")
 
 
+def get_time_slot_callback_data(weekday_id: str, time_slot) -> str:
+    return f"{weekday_id}:{time_slot.pk}"
+
+
 def get_time_slot_keyboard(
-    pin_code: PinCode, callback_pattern: str = ""
+    pin_code: PinCode, get_callback_data: Callable = None
 ) -> tg.InlineKeyboardMarkup:
+    if get_callback_data is None:
+        get_callback_data = get_time_slot_callback_data
+
     return tg.InlineKeyboardMarkup(
         [
             [
                 tg.InlineKeyboardButton(
                     get_pretty_time_slot(weekday_id, time_slot),
-                    callback_data=f"{callback_pattern}{weekday_id}:{time_slot.pk}",
+                    callback_data=get_callback_data(weekday_id, time_slot),
                 )
             ]
-            for weekday_id in pin_code.working_days
-            for time_slot in pin_code.time_slots.all()
+            for weekday_id in pin_code.get_working_days()
+            for time_slot in pin_code.get_time_slots()
         ]
     )
 
 
+def verify_token(code: str, max_age: int = None):
+    """
+    Verifies the signed token in the data of a callback query, registered under ``code``,
+    and no older than ``max_age`` seconds (see `tokens.loads()`).
+    The decoded token is passed on to the decorated function as the ``token`` keyword argument.
+    """
+
+    def decorator(fn: Callable):
+        @wraps(fn)
+        def wrapper(bot, up: tg.Update, *args, **kwargs):
+            query: tg.CallbackQuery = up.callback_query
+            try:
+                token = tokens.loads(
+                    query.data[len(code) :],
+                    owner_id=up.effective_user.id,
+                    max_age=max_age,
+                )
+            except tokens.InvalidToken:
+                query.answer(T("This button has expired."))
+                return
+
+            return fn(bot, up, *args, token=token, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
 def ensure_db_cleanup(fn: Callable):
-    """Ensures that database connection is correctly cleaned up."""
+    """Ensures that the database connections (to the replicas too) are correctly cleaned up."""
 
     @wraps(fn)
     def wrapper(*args, **kwargs):
         try:
             return fn(*args, **kwargs)
         finally:
-            db.connection.close()
+            db.connections.close_all()
 
     return wrapper
+
+
+def walk_handlers(handlers, state=None):
+    """
+    Yields a (handler, conversation state) pair for every handler,
+    descending into the entry points, states and fallbacks of ConversationHandlers.
+
+    The entry points and fallbacks of a named conversation get its name for a state.
+    """
+
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from walk_handlers(handler.entry_points, handler.name or state)
+            for child_state, child_handlers in handler.states.items():
+                yield from walk_handlers(child_handlers, child_state)
+            yield from walk_handlers(handler.fallbacks, handler.name or state)
+        else:
+            yield handler, state
+
+
+def unshare_handlers(handlers, seen: set = None):
+    """
+    Replaces every repeat of a handler inside the conversations with a copy of it
+    (e.g. the ``/abort`` fallback they all share), so that each can be wrapped on its own.
+    """
+
+    seen = set() if seen is None else seen
+    for i, handler in enumerate(handlers):
+        if isinstance(handler, ConversationHandler):
+            unshare_handlers(handler.entry_points, seen)
+            for child_handlers in handler.states.values():
+                unshare_handlers(child_handlers, seen)
+            unshare_handlers(handler.fallbacks, seen)
+            continue
+
+        if id(handler) in seen:
+            handler = handlers[i] = copy.copy(handler)
+        seen.add(id(handler))
+
+
+def wrap_callbacks(handlers, decorator: Callable):
+    """
+    Replaces the callback of every handler with ``decorator(callback, state)``.
+
+    Handlers shared between conversations (or states) are copied first,
+    so that each copy is wrapped once, with the state it's used in.
+    """
+
+    unshare_handlers(handlers)
+    for handler, state in walk_handlers(handlers):
+        handler.callback = decorator(handler.callback, state)
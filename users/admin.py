@@ -1,3 +1,5 @@
+import phonenumbers
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
@@ -7,7 +9,40 @@ from . import models
 @admin.register(models.CustomUser)
 class CustomUserAdmin(UserAdmin):
     list_display = ("__str__", "phone_number", "email", "is_staff")
+    search_fields = ("^phone_number", "^first_name", "^last_name")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fieldsets[1][1]["fields"] += ("phone_number",)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Phone numbers are stored in E.164, so full phone numbers are normalized before searching,
+        and partial ones typed without a country code are searched with the default region's.
+        """
+
+        try:
+            phone_number = phonenumbers.parse(
+                search_term, settings.PHONENUMBER_DEFAULT_REGION
+            )
+        except phonenumbers.NumberParseException:
+            phone_number = None
+
+        if phone_number is None or not phonenumbers.is_valid_number(phone_number):
+            results, may_have_duplicates = super().get_search_results(
+                request, queryset, search_term
+            )
+            digits = search_term.strip().replace(" ", "").replace("-", "")
+            if digits.isascii() and digits.isdigit():
+                country_code = phonenumbers.country_code_for_region(
+                    settings.PHONENUMBER_DEFAULT_REGION
+                )
+                # without the national trunk prefix, e.g. 098... in India
+                prefix = f"+{country_code}{digits.lstrip('0')}"
+                results |= queryset.filter(phone_number__startswith=prefix)
+            return results, may_have_duplicates
+
+        e164 = phonenumbers.format_number(
+            phone_number, phonenumbers.PhoneNumberFormat.E164
+        )
+        return queryset.filter(phone_number=e164), False
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import migrations
+import phonenumber_field.modelfields
+import phonenumbers
+
+# django's istartswith lookup compiles to UPPER(column::text) LIKE UPPER(...)
+INDEXES = {
+    "users_customuser_phone_number_upper_like": "phone_number",
+    "users_customuser_first_name_upper_like": "first_name",
+    "users_customuser_last_name_upper_like": "last_name",
+}
+
+
+def normalize_phone_numbers(apps, schema_editor):
+    CustomUser = apps.get_model("users", "CustomUser")
+
+    for user in CustomUser.objects.exclude(phone_number="").only("phone_number"):
+        try:
+            phone_number = phonenumbers.parse(
+                str(user.phone_number), settings.PHONENUMBER_DEFAULT_REGION
+            )
+        except phonenumbers.NumberParseException:
+            continue
+        if not phonenumbers.is_valid_number(phone_number):
+            continue
+
+        CustomUser.objects.filter(pk=user.pk).update(
+            phone_number=phonenumbers.format_number(
+                phone_number, phonenumbers.PhoneNumberFormat.E164
+            )
+        )
+
+
+def create_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, column in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} "
+            f"ON users_customuser (UPPER({column}::text) text_pattern_ops)"
+        )
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20180914_0339'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='phone_number',
+            field=phonenumber_field.modelfields.PhoneNumberField(blank=True, db_index=True, max_length=255),
+        ),
+        migrations.RunPython(normalize_phone_numbers, migrations.RunPython.noop),
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
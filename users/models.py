@@ -4,7 +4,7 @@ from phonenumber_field.modelfields import PhoneNumberField
 
 
 class CustomUser(AbstractUser):
-    phone_number = PhoneNumberField(max_length=255, blank=True)
+    phone_number = PhoneNumberField(max_length=255, blank=True, db_index=True)
 
     def get_username(self):
         return (
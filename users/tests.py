@@ -1,3 +1,74 @@
-from django.test import TestCase
+import importlib
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.admin.sites import AdminSite
+from django.db import connection
+from django.test import RequestFactory, TestCase
+
+from users.admin import CustomUserAdmin
+from users.models import CustomUser
+
+migration = importlib.import_module("users.migrations.0003_phone_number_e164")
+
+
+class NormalizePhoneNumbersTest(TestCase):
+    def set_raw(self, user: CustomUser, phone_number: str):
+        # bypassing the field, which normalizes on save
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE users_customuser SET phone_number = %s WHERE id = %s",
+                [phone_number, user.pk],
+            )
+
+    def test_normalize(self):
+        national = CustomUser.objects.create(username="1")
+        self.set_raw(national, "098765 43210")
+        international = CustomUser.objects.create(username="2")
+        self.set_raw(international, "+91 98765-43211")
+        invalid = CustomUser.objects.create(username="3")
+        self.set_raw(invalid, "12345")
+        empty = CustomUser.objects.create(username="4")
+
+        migration.normalize_phone_numbers(apps, connection.schema_editor())
+
+        phone_numbers = dict(
+            CustomUser.objects.values_list("username", "phone_number")
+        )
+        self.assertEqual(
+            phone_numbers,
+            {"1": "+919876543210", "2": "+919876543211", "3": "12345", "4": ""},
+        )
+
+
+class CustomUserSearchTest(TestCase):
+    def setUp(self):
+        self.admin = CustomUserAdmin(CustomUser, AdminSite())
+        self.request = RequestFactory().get("/")
+        self.first = CustomUser.objects.create(
+            username="1", phone_number="+919876543210"
+        )
+        self.second = CustomUser.objects.create(
+            username="2", phone_number="+919876500000", first_name="Ravi"
+        )
+        self.other = CustomUser.objects.create(
+            username="3", phone_number="+14155550123", first_name="98765"
+        )
+
+    def search(self, search_term: str) -> set:
+        results, _ = self.admin.get_search_results(
+            self.request, CustomUser.objects.all(), search_term
+        )
+        return set(results)
+
+    def test_full_phone_number(self):
+        self.assertEqual(self.search("098765 43210"), {self.first})
+        self.assertEqual(self.search("+91 98765 43210"), {self.first})
+
+    def test_partial_phone_number(self):
+        self.assertEqual(self.search("98765"), {self.first, self.second, self.other})
+        self.assertEqual(self.search("098765-4"), {self.first})
+        self.assertEqual(self.search("+9198765"), {self.first, self.second})
+        self.assertEqual(self.search("+1415"), {self.other})
+
+    def test_name(self):
+        self.assertEqual(self.search("rav"), {self.second})